@@ -1,65 +1,270 @@
-from flask import Flask, render_template, send_file
+from flask import Flask, render_template, send_file, jsonify, abort, Response, request
 import os
 import glob
+import threading
 from datetime import datetime
+from jobs import JobManager
+import metrics
 
 app = Flask(__name__)
 
+# Фоновые задачи анализа: не больше двух отчетов одновременно
+jobs = JobManager(max_workers=2)
+
+# Кэш запросов, JSON API и манифест создаются при первом обращении, чтобы
+# import app не загружал psycopg2, PIL и pyarrow (benchmark.py --startup, import_app)
+_services = {}
+_services_lock = threading.Lock()
+
+def _service(name, factory):
+    with _services_lock:
+        if name not in _services:
+            _services[name] = factory()
+        return _services[name]
+
+def get_query_cache():
+    """Общий кэш результатов SQL для анализа"""
+    def create():
+        from query_cache import QueryCache
+        return QueryCache()
+    return _service('query_cache', create)
+
+def get_query_api():
+    """Параметризованные запросы к агрегатам; соединения пула берутся при первом запросе"""
+    def create():
+        from query_api import QueryAPI
+        return QueryAPI()
+    return _service('query_api', create)
+
+def get_artifacts():
+    """Манифест графиков и отчетов; файлы, записанные до создания, учитываются сразу"""
+    def create():
+        from artifacts import ArtifactManifest
+        manifest = ArtifactManifest()
+        manifest.sync()
+        return manifest
+    return _service('artifacts', create)
+
+# Ссылки с ?v=<etag> указывают на неизменяемое содержимое
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
 @app.route('/')
 def index():
-    """Главная страница с графиками"""
-    # Получаем список созданных графиков
-    chart_files = glob.glob('charts/*.png')
+    """Главная страница с графиками (список файлов берётся из манифеста)"""
     charts = []
-    
-    for chart_file in chart_files:
-        chart_name = os.path.basename(chart_file)
-        chart_type = chart_name.replace('.png', '').replace('_', ' ').title()
+    artifacts = get_artifacts()
+    for entry in artifacts.list('chart'):
+        chart_name = entry['filename']
         charts.append({
             'filename': chart_name,
-            'name': chart_type,
-            'created_time': datetime.fromtimestamp(os.path.getctime(chart_file)).strftime('%Y-%m-%d %H:%M:%S')
+            'name': chart_name.replace('.png', '').replace('_', ' ').title(),
+            'created_time': datetime.fromtimestamp(entry['mtime']).strftime('%Y-%m-%d %H:%M:%S'),
+            'url': f"/charts/{chart_name}?v={entry['etag']}",
+            'thumbnail': f"/charts/thumbs/{os.path.basename(entry['thumbnail'])}?v={entry['etag']}",
         })
     
-    # Получаем список Excel файлов
-    excel_files = glob.glob('exports/*.xlsx')
     exports = []
-    
-    for excel_file in excel_files:
+    for entry in artifacts.list('export'):
         exports.append({
-            'filename': os.path.basename(excel_file),
-            'size': f"{os.path.getsize(excel_file) / 1024:.1f} KB"
+            'filename': entry['filename'],
+            'size': f"{entry['size'] / 1024:.1f} KB",
+            'url': f"/exports/{entry['filename']}?v={entry['etag']}",
         })
     
     return render_template('index.html', charts=charts, exports=exports)
 
+def send_artifact(path, entry):
+    """Условная отдача файла по ETag/Last-Modified
+
+    Ссылки со страницы содержат ?v=<etag>: такой URL неизменен, пока не
+    изменился файл, и кэшируется браузером на год. Без версии браузер
+    каждый раз перепроверяет файл и получает 304, если он не менялся.
+    """
+    if entry is None:
+        if not os.path.isfile(path):
+            abort(404)
+        return send_file(os.path.abspath(path), max_age=0)
+    versioned = request.args.get('v') == entry['etag']
+    response = send_file(os.path.abspath(path), etag=entry['etag'], last_modified=entry['mtime'],
+                         max_age=IMMUTABLE_MAX_AGE if versioned else 0)
+    if versioned:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.must_revalidate = True
+    return response
+
 @app.route('/charts/<filename>')
 def serve_chart(filename):
-    """Отдача файлов графиков"""
-    return send_file(f'charts/{filename}')
+    """Отдача файлов графиков в полном разрешении"""
+    return send_artifact(f'charts/{filename}', get_artifacts().get('chart', filename))
+
+@app.route('/charts/thumbs/<filename>')
+def serve_thumbnail(filename):
+    """Отдача превью графиков"""
+    png_name = f"{os.path.splitext(filename)[0]}.png"
+    entry = get_artifacts().get('chart', png_name)
+    if entry is None or os.path.basename(entry['thumbnail']) != filename:
+        abort(404)
+    return send_artifact(entry['thumbnail'], entry)
 
 @app.route('/exports/<filename>')
 def serve_export(filename):
     """Отдача Excel файлов"""
-    return send_file(f'exports/{filename}')
+    return send_artifact(f'exports/{filename}', get_artifacts().get('export', filename))
+
+def run_analysis_job(report, force=False):
+    """Полный анализ в фоновом потоке (без окон, графики в пуле процессов)"""
+    from main import AWSTickitAnalyzer
+    analyzer = AWSTickitAnalyzer(query_cache=get_query_cache(), headless=True, artifacts=get_artifacts())
+    try:
+        analyzer.run_complete_analysis(use_facts=True, parallel_render=True, progress=report,
+                                       force_render=force)
+    finally:
+        analyzer.close()
+
+def run_dashboards_job(report, as_of=None):
+    """Перегенерация дашбордов Superset в фоновом потоке (графики superset_* и их отчеты)"""
+    from main import AWSTickitAnalyzer
+    import superset
+    paths = sorted(glob.glob(os.path.join(superset.BUNDLE_DIR, '*.json')))
+    analyzer = AWSTickitAnalyzer(query_cache=get_query_cache(), headless=True, artifacts=get_artifacts())
+    try:
+        report(0, 1, f"Дашбордов: {len(paths)}")
+        superset.run_bundles(analyzer, paths, as_of=as_of)
+    finally:
+        analyzer.close()
+
+def job_started_page(job, created, name):
+    """Ответ на постановку задачи: новая, ждущая своей очереди или уже идущая такая же"""
+    if not created:
+        status = f"⏳ {name} с теми же параметрами уже выполняется"
+    elif job['status'] == 'queued' and job['message'] != 'В очереди':
+        status = f"🕒 {name} поставлен в очередь ({job['message'].lower()})"
+    else:
+        status = f"🚀 {name} запущен"
+    return (f"{status}: задача <a href='/jobs/{job['id']}'>{job['id']}</a>. "
+            f"<a href='/'>Вернуться на главную</a>")
 
 @app.route('/run-analysis')
 def run_analysis():
-    """Запуск анализа и обновление страницы"""
+    """Постановка анализа в очередь фоновых задач (?force=1 — перерисовать все графики)
+
+    Обычный и принудительный прогоны пишут одни и те же графики и отчеты,
+    поэтому они выполняются друг за другом (ресурс 'analysis').
+    """
+    force = request.args.get('force') == '1'
+    job, created = jobs.submit('run-analysis', run_analysis_job, resource='analysis', force=force)
+    return job_started_page(job, created, "Анализ")
+
+@app.route('/run-dashboards')
+def run_dashboards():
+    """Перегенерация дашбордов Superset (?as_of=2008-12-31 — дата для относительных диапазонов)"""
+    job, created = jobs.submit('run-dashboards', run_dashboards_job, resource='superset',
+                               as_of=request.args.get('as_of'))
+    return job_started_page(job, created, "Пересчёт дашбордов")
+
+@app.route('/jobs')
+def list_jobs():
+    """Список фоновых задач"""
+    return jsonify(jobs.list())
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Статус и прогресс фоновой задачи"""
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+@app.route('/api/datasets')
+def api_datasets():
+    """Наборы данных JSON API и допустимые фильтры"""
+    return jsonify(get_query_api().describe())
+
+@app.route('/api/query/<name>')
+def api_query(name):
+    """Агрегат с фильтрами из строки запроса, например
+    /api/query/monthly_sales?date_from=2008-01-01&catgroup=Shows"""
     try:
-        from main import AWSTickitAnalyzer
-        analyzer = AWSTickitAnalyzer()
-        analyzer.run_complete_analysis()
-        analyzer.close()
-        return "✅ Анализ успешно выполнен! <a href='/'>Вернуться на главную</a>"
-    except Exception as e:
-        return f"❌ Ошибка: {e} <a href='/'>Вернуться на главную</a>"
+        result = get_query_api().run(name, request.args.to_dict())
+    except KeyError:
+        return jsonify({'error': f"неизвестный набор данных {name}"}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/extract')
+def list_extracts():
+    """Источники потоковой выгрузки и форматы"""
+    import extract
+    return jsonify({'sources': list(extract.extract_sources()), 'formats': list(extract.FORMATS)})
+
+@app.route('/extract/<source>')
+def extract_download(source):
+    """Потоковая выгрузка таблицы или набора данных (?format=csv|csv.gz|parquet)
+
+    Ответ уходит chunked-порциями прямо из COPY, соединение пула занято
+    только на время загрузки.
+    """
+    import extract
+    file_format = request.args.get('format', 'csv')
+    if file_format not in extract.FORMATS:
+        return jsonify({'error': f"неизвестный формат {file_format}"}), 400
+    sources = extract.extract_sources()
+    if source not in sources:
+        abort(404)
+    
+    def generate():
+        from db_pool import get_pool
+        with get_pool().connection() as connection:
+            yield from extract.stream_extract(connection, sources[source], file_format)
+    
+    mimetype, extension = extract.FORMATS[file_format]
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{source}.{extension}"'})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Метрики стадий анализа, фоновых задач и кэша в формате Prometheus"""
+    lines = [metrics.REGISTRY.prometheus_text().rstrip('\n')]
+    
+    lines.append("# HELP tickit_jobs Фоновые задачи по статусам")
+    lines.append("# TYPE tickit_jobs gauge")
+    statuses = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+    for job in jobs.list():
+        statuses[job['status']] += 1
+    for status, count in statuses.items():
+        lines.append(f'tickit_jobs{{status="{status}"}} {count}')
+    
+    cache = get_query_cache().summary()
+    for field in ('hits', 'misses', 'evictions'):
+        lines.append(f"# TYPE tickit_query_cache_{field}_total counter")
+        lines.append(f"tickit_query_cache_{field}_total {cache[field]}")
+    lines.append("# TYPE tickit_query_cache_size_bytes gauge")
+    lines.append(f"tickit_query_cache_size_bytes {int(cache['size_mb'] * 1024 ** 2)}")
+    
+    api_cache = get_query_api().cache.summary()
+    for field in ('hits', 'misses', 'evictions'):
+        lines.append(f"# TYPE tickit_api_cache_{field}_total counter")
+        lines.append(f"tickit_api_cache_{field}_total {api_cache[field]}")
+    
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+@app.route('/profiles/latest')
+def latest_profile():
+    """JSON-профиль последнего запуска анализа"""
+    profiles = glob.glob('profiles/run_*.json')
+    if not profiles:
+        abort(404)
+    return send_file(os.path.abspath(max(profiles)), mimetype='application/json')
 
 if __name__ == '__main__':
     # Создаем необходимые папки
     os.makedirs('charts', exist_ok=True)
     os.makedirs('exports', exist_ok=True)
     os.makedirs('templates', exist_ok=True)
+    # Файлы, записанные до запуска сервера, попадают в манифест до первого запроса
+    get_artifacts()
     
     # Запускаем сервер на порту 56777
     print("🚀 Запуск веб-сервера на http://127.0.0.1:56777")
@@ -0,0 +1,135 @@
+"""Манифест готовых артефактов для веб-интерфейса.
+
+Графики и Excel-отчеты регистрируются в манифесте в момент записи файла:
+для каждого сохраняются размер, время изменения, ETag (хэш содержимого) и,
+для PNG, уменьшенное превью. Главная страница читает только манифест и не
+обходит папки с файлами на каждый запрос.
+"""
+import glob
+import hashlib
+import os
+import threading
+
+from PIL import Image, features
+
+from file_locks import file_lock, file_version, read_json, write_json
+
+MANIFEST_PATH = 'artifacts.json'
+THUMBNAIL_DIR = 'charts/thumbs'
+THUMBNAIL_WIDTH = 480
+
+# Папка -> (вид артефакта, маска файлов)
+ARTIFACT_DIRS = {
+    'charts': ('chart', '*.png'),
+    'exports': ('export', '*.xlsx'),
+}
+
+
+def file_etag(path):
+    """ETag по содержимому файла: неизменный PNG сохраняет ETag между запусками"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+def make_thumbnail(path, thumbnail_dir=THUMBNAIL_DIR, width=THUMBNAIL_WIDTH):
+    """Превью графика шириной width пикселей (WebP, если Pillow его поддерживает)"""
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    extension = 'webp' if features.check('webp') else 'png'
+    thumbnail_path = os.path.join(thumbnail_dir, f"{os.path.splitext(os.path.basename(path))[0]}.{extension}")
+    with Image.open(path) as image:
+        image.thumbnail((width, width * 4))
+        if extension == 'webp':
+            image.save(thumbnail_path, 'WEBP', quality=80, method=4)
+        else:
+            image.save(thumbnail_path, 'PNG', optimize=True)
+    return thumbnail_path
+
+
+class ArtifactManifest:
+    """Манифест артефактов: (вид, имя файла) -> ETag, размер, время, превью
+
+    Манифест хранится в JSON, поэтому им могут пользоваться и анализ (запись),
+    и веб-сервер (чтение) в разных процессах. Изменение манифеста (перечитать,
+    дополнить, сохранить) выполняется под файловой блокировкой, чтобы
+    параллельные записи из разных экземпляров и процессов не затирали друг
+    друга; чтение перечитывает файл, только если он был заменён.
+    """
+
+    def __init__(self, manifest_path=MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._loaded_stat = None
+        self.entries = {}
+
+    def _reload(self, force=False):
+        stat_key = file_version(self.manifest_path)
+        if stat_key is None or (not force and stat_key == self._loaded_stat):
+            return
+        data = read_json(self.manifest_path)
+        if data is not None:
+            self.entries = data.get('artifacts', {})
+            self._loaded_stat = stat_key
+
+    def _save(self):
+        self._loaded_stat = write_json(self.manifest_path, {'artifacts': self.entries},
+                                       ensure_ascii=False, indent=2)
+
+    def _describe(self, kind, path, previous=None):
+        stat = os.stat(path)
+        entry = {
+            'kind': kind,
+            'filename': os.path.basename(path),
+            'path': path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'etag': file_etag(path),
+        }
+        if kind == 'chart':
+            thumbnail = previous.get('thumbnail') if previous else None
+            if not (previous and previous['etag'] == entry['etag'] and thumbnail and os.path.exists(thumbnail)):
+                thumbnail = make_thumbnail(path)
+            entry['thumbnail'] = thumbnail
+        return entry
+
+    def register(self, kind, path):
+        """Учёт только что записанного файла (для графиков — с новым превью)"""
+        with self._lock, file_lock(self.manifest_path):
+            self._reload(force=True)
+            key = f"{kind}/{os.path.basename(path)}"
+            self.entries[key] = self._describe(kind, path, self.entries.get(key))
+            self._save()
+            return self.entries[key]
+
+    def sync(self):
+        """Сверка манифеста с папками: новые и изменённые файлы, удалённые записи"""
+        with self._lock, file_lock(self.manifest_path):
+            self._reload(force=True)
+            found = {}
+            for directory, (kind, pattern) in ARTIFACT_DIRS.items():
+                for path in glob.glob(os.path.join(directory, pattern)):
+                    key = f"{kind}/{os.path.basename(path)}"
+                    previous = self.entries.get(key)
+                    stat = os.stat(path)
+                    if previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+                        found[key] = previous
+                    else:
+                        found[key] = self._describe(kind, path, previous)
+            if found != self.entries:
+                self.entries = found
+                self._save()
+            return len(found)
+
+    def list(self, kind):
+        """Артефакты вида kind, новые сверху"""
+        with self._lock:
+            self._reload()
+            items = [entry for entry in self.entries.values() if entry['kind'] == kind]
+        return sorted(items, key=lambda entry: entry['mtime'], reverse=True)
+
+    def get(self, kind, filename):
+        with self._lock:
+            self._reload()
+            return self.entries.get(f"{kind}/{filename}")
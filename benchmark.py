@@ -0,0 +1,276 @@
+"""Бенчмарк анализа AWS Tickit на синтетических данных разного масштаба.
+
+Для каждого метода-графика анализатора (create_*) замеряются стадии:
+query (до первой строки), transfer (передача остальных строк), dataframe
+(сборка DataFrame), render (всё остальное время метода: стиль, отрисовка,
+запись файла), а также export для Excel-отчета. Результаты каждого
+прогона сохраняются в JSON, чтобы видеть регрессии и провалы при росте данных.
+
+    python benchmark.py --backend snapshot --scales 1 10 100
+    python benchmark.py --backend postgres --scales 1 10 --load
+    python benchmark.py --startup
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+import synthetic
+from main import AWSTickitAnalyzer, CHART_QUERIES, EXCEL_QUERIES
+from snapshot import SnapshotAnalyzer
+
+# Методы-графики анализатора, которые вызываются как есть
+CHART_BENCHMARKS = (
+    'create_pie_chart',
+    'create_bar_chart',
+    'create_horizontal_bar_chart',
+    'create_line_chart',
+    'create_histogram',
+    'create_scatter_plot',
+    'create_interactive_slider_chart',
+)
+
+STAGES = ('query', 'transfer', 'dataframe', 'render', 'export')
+
+# Библиотеки, которые main.py раньше загружал при любом импорте
+HEAVY_MODULES = ('pandas', 'numpy', 'matplotlib', 'plotly', 'seaborn', 'openpyxl', 'psycopg2', 'pyarrow', 'PIL')
+
+# Сценарий запуска -> код, выполняемый в новом интерпретаторе
+STARTUP_SCENARIOS = {
+    'eager_stack': "import pandas, matplotlib.pyplot, plotly.express, seaborn, openpyxl, psycopg2",
+    'import_main': "import main",
+    'cli_list': "import main; main.main(['list'])",
+    'one_chart_modules': "import main, charts, render_cache, artifacts, db_pool",
+    'import_app': "import app",
+}
+
+
+def _empty_stages():
+    return {stage: 0.0 for stage in STAGES}
+
+
+def timed_sql(connection, query, stages):
+    """Выполнение запроса серверным курсором с разбивкой времени по стадиям"""
+    started = time.perf_counter()
+    with connection.cursor(name=f"bench_{uuid.uuid4().hex}") as cursor:
+        cursor.execute(query)
+        rows = cursor.fetchmany(1)
+        first_row = time.perf_counter()
+        rows += cursor.fetchall()
+        fetched = time.perf_counter()
+        columns = [column[0] for column in cursor.description]
+    connection.rollback()
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    built = time.perf_counter()
+    stages['query'] += first_row - started
+    stages['transfer'] += fetched - first_row
+    stages['dataframe'] += built - fetched
+    return df
+
+
+def load_dataset(analyzer, name, query, stages):
+    """Набор данных графика/листа с замером стадий для текущего backend"""
+    if isinstance(analyzer, SnapshotAnalyzer):
+        started = time.perf_counter()
+        df = analyzer.get_data(name, query)
+        stages['query'] += time.perf_counter() - started
+        return df
+    return timed_sql(analyzer.connection, query, stages)
+
+
+def timed_data_source(analyzer, stages):
+    """Подмена источника данных анализатора на время метода-графика
+
+    Снимок: время get_data/price_histogram идёт в query. PostgreSQL: запросы
+    execute_query выполняются через timed_sql с разбивкой по стадиям.
+    Возвращает функцию, восстанавливающую исходные методы.
+    """
+    def count_rows(df):
+        if df is not None:
+            stages['rows'] += len(df)
+        return df
+
+    if isinstance(analyzer, SnapshotAnalyzer):
+        def timed(method):
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                df = method(*args, **kwargs)
+                stages['query'] += time.perf_counter() - started
+                return count_rows(df)
+            return wrapper
+        analyzer.get_data = timed(analyzer.get_data)
+        analyzer.price_histogram = timed(analyzer.price_histogram)
+    else:
+        analyzer.execute_query = lambda query, description="", connection=None: count_rows(
+            timed_sql(analyzer.connection, query, stages))
+
+    def restore():
+        for name in ('get_data', 'price_histogram', 'execute_query'):
+            analyzer.__dict__.pop(name, None)
+    return restore
+
+
+def bench_charts(analyzer):
+    """Вызовы create_* анализатора (безоконный режим, стиль и запись файлов как в анализе)"""
+    # Кэш отрисовки не должен пропускать графики, которые не изменились с прошлого прогона
+    analyzer.force_render = True
+    results = {}
+    for method in CHART_BENCHMARKS:
+        stages = _empty_stages()
+        stages['rows'] = 0
+        restore = timed_data_source(analyzer, stages)
+        started = time.perf_counter()
+        try:
+            getattr(analyzer, method)()
+        finally:
+            restore()
+        total = time.perf_counter() - started
+        stages['render'] = max(0.0, total - stages['query'] - stages['transfer'] - stages['dataframe'])
+        results[method] = stages
+        print(f"⏱️ {method}: " + ", ".join(f"{stage} {stages[stage]:.3f} с" for stage in STAGES[:4]))
+    return results
+
+
+def bench_export(analyzer):
+    stages = _empty_stages()
+    dataframes = {name: load_dataset(analyzer, name, query, stages) for name, query in EXCEL_QUERIES.items()}
+    started = time.perf_counter()
+    analyzer.export_to_excel({name: df for name, df in dataframes.items() if df is not None},
+                             'benchmark_export.xlsx')
+    stages['export'] = time.perf_counter() - started
+    stages['rows'] = sum(len(df) for df in dataframes.values() if df is not None)
+    print(f"⏱️ export_to_excel: " + ", ".join(f"{stage} {stages[stage]:.3f} с" for stage in STAGES))
+    return stages
+
+
+def startup_benchmark(repeats=5):
+    """Время холодного старта сценариев в отдельных интерпретаторах и загруженные тяжёлые модули
+
+    eager_stack — стоимость старых импортов main.py, one_chart_modules —
+    модули, которые нужны для отрисовки одного статического графика,
+    import_app — старт веб-сервера (тяжёлые модули должны грузиться по запросу).
+    """
+    probe = ("import sys, time, json\n"
+             "started = time.perf_counter()\n"
+             "{code}\n"
+             "elapsed = time.perf_counter() - started\n"
+             f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+             "print('@@' + json.dumps({{'seconds': elapsed, 'heavy': heavy}}))")
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, code in STARTUP_SCENARIOS.items():
+        timings, heavy = [], []
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, '-c', probe.format(code=code)], cwd=repo_dir,
+                                    capture_output=True, text=True, check=True).stdout
+            measured = json.loads(output[output.rindex('@@') + 2:])
+            timings.append(measured['seconds'])
+            heavy = measured['heavy']
+        results[name] = {'median_seconds': statistics.median(timings), 'min_seconds': min(timings),
+                         'heavy_modules': heavy}
+        print(f"⏱️ {name}: {results[name]['median_seconds'] * 1000:.0f} мс, "
+              f"тяжёлые модули: {', '.join(heavy) or 'нет'}")
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'repeats': repeats,
+        'scenarios': results,
+    }
+
+
+def run_benchmark(backend, scale, seed=42, data_dir='benchmarks/data', load=False):
+    """Один прогон на заданном масштабе; возвращает словарь результатов"""
+    setup_started = time.perf_counter()
+    if backend == 'snapshot':
+        snapshot_dir = os.path.abspath(os.path.join(data_dir, f"sf{scale}"))
+        if load or not os.path.exists(os.path.join(snapshot_dir, 'manifest.json')):
+            synthetic.write_snapshot(snapshot_dir, scale, seed)
+        analyzer = SnapshotAnalyzer(snapshot_dir, headless=True)
+    else:
+        from db_pool import get_pool, close_pool
+        database = f"tickit_sf{scale}"
+        if load:
+            import psycopg2
+            from db_pool import DB_CONFIG
+            synthetic.ensure_database(database)
+            connection = psycopg2.connect(**{**DB_CONFIG, 'database': database})
+            try:
+                synthetic.load_postgres(connection, scale, seed, replace=True)
+            finally:
+                connection.close()
+        close_pool()
+        get_pool(database=database)
+        analyzer = AWSTickitAnalyzer(headless=True)
+    setup = time.perf_counter() - setup_started
+
+    try:
+        chart_results = bench_charts(analyzer)
+        export_results = bench_export(analyzer)
+    finally:
+        analyzer.close()
+        if backend == 'postgres':
+            close_pool()
+
+    return {
+        'backend': backend,
+        'scale': scale,
+        'seed': seed,
+        'rows': {name: synthetic.table_rows(name, scale) for name in synthetic.COLUMNS},
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'setup_seconds': setup,
+        'charts': chart_results,
+        'export': export_results,
+        'total_seconds': setup + sum(sum(stages[s] for s in STAGES) for stages in chart_results.values())
+                         + sum(export_results[s] for s in STAGES),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк анализа AWS Tickit по масштабам данных")
+    parser.add_argument('--backend', choices=['snapshot', 'postgres'], default='snapshot')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--load', action='store_true', help="заново сгенерировать/загрузить данные")
+    parser.add_argument('--out', default='benchmarks/results')
+    parser.add_argument('--startup', action='store_true', help="замерить только время запуска CLI и импорта main")
+    args = parser.parse_args()
+
+    if args.startup:
+        os.makedirs(args.out, exist_ok=True)
+        result = startup_benchmark()
+        path = os.path.join(args.out, f"startup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"✅ Результаты запуска: {path}")
+        return
+
+    out_dir = os.path.abspath(args.out)
+    data_dir = os.path.abspath('benchmarks/data')
+    work_dir = os.path.abspath('benchmarks/work')
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(work_dir, exist_ok=True)
+    # Графики и Excel бенчмарка пишутся в отдельную папку, не трогая charts/ и exports/
+    os.chdir(work_dir)
+
+    for scale in args.scales:
+        print(f"\n🚀 Бенчмарк {args.backend}, масштаб x{scale}")
+        result = run_benchmark(args.backend, scale, args.seed, data_dir, args.load)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(out_dir, f"{args.backend}_sf{scale}_{stamp}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"✅ x{scale}: {result['total_seconds']:.2f} с, результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
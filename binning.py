@@ -0,0 +1,164 @@
+"""Гистограммы без выгрузки сырых значений.
+
+Распределение считается в базе (width_bucket по тем же границам, что
+выбрал бы numpy/matplotlib) или потоково по порциям данных. Наружу
+возвращаются только границы интервалов и количества.
+
+    python binning.py verify
+"""
+import argparse
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def bin_edges(lo, hi, bins):
+    """Границы интервалов, совпадающие с np.histogram(values, bins) для данных с min=lo, max=hi"""
+    return np.histogram_bin_edges(np.array([lo, hi], dtype='float64'), bins=bins)
+
+
+def binned_frame(edges, counts):
+    """DataFrame с колонками bin_left, bin_right, count"""
+    edges = np.asarray(edges, dtype='float64')
+    return pd.DataFrame({
+        'bin_left': edges[:-1],
+        'bin_right': edges[1:],
+        'count': np.asarray(counts, dtype='int64'),
+    })
+
+
+def edges_of(binned):
+    """Границы интервалов из DataFrame гистограммы"""
+    return np.append(binned['bin_left'].to_numpy(), binned['bin_right'].iloc[-1])
+
+
+def db_histogram(run_query, table, column, where=None, bins=30):
+    """Гистограмма столбца таблицы, посчитанная в PostgreSQL
+
+    run_query(sql) -> DataFrame (например, AWSTickitAnalyzer.execute_query).
+    Границы берутся по MIN/MAX в базе, номер интервала — width_bucket по
+    массиву левых границ, поэтому значения на границах попадают в те же
+    интервалы, что и в np.histogram (последний интервал закрыт справа).
+    """
+    conditions = [f"{column} IS NOT NULL"] + ([where] if where else [])
+    where_sql = "WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+
+    bounds = run_query(f"SELECT MIN({column})::float8 AS lo, MAX({column})::float8 AS hi, "
+                       f"COUNT(*) AS n FROM {table} {where_sql};")
+    if bounds is None:
+        return None
+    if int(bounds['n'].iloc[0]) == 0:
+        return binned_frame(bin_edges(0.0, 1.0, bins), np.zeros(bins))
+
+    edges = bin_edges(float(bounds['lo'].iloc[0]), float(bounds['hi'].iloc[0]), bins)
+    # repr(float) однозначно восстанавливается в float8 на стороне PostgreSQL
+    thresholds = ", ".join(repr(float(edge)) for edge in edges[:-1])
+    buckets = run_query(f"SELECT width_bucket({column}::float8, ARRAY[{thresholds}]::float8[]) AS bucket, "
+                        f"COUNT(*) AS n FROM {table} {where_sql} GROUP BY bucket;")
+    if buckets is None:
+        return None
+
+    counts = np.zeros(bins, dtype='int64')
+    for bucket, n in zip(buckets['bucket'].astype(int), buckets['n'].astype('int64')):
+        counts[bucket - 1] += n
+    return binned_frame(edges, counts)
+
+
+def chunked_histogram(chunks, bins=30, value_range=None):
+    """Гистограмма по итератору порций значений (массивы/Series)
+
+    Если value_range=(lo, hi) не задан, порции материализуются для первого
+    прохода — для постоянной памяти передавайте границы заранее
+    (например, MIN/MAX из базы).
+    """
+    if value_range is None:
+        chunks = [np.asarray(chunk, dtype='float64') for chunk in chunks]
+        non_empty = [chunk for chunk in chunks if len(chunk)]
+        if not non_empty:
+            return binned_frame(bin_edges(0.0, 1.0, bins), np.zeros(bins))
+        value_range = (min(chunk.min() for chunk in non_empty), max(chunk.max() for chunk in non_empty))
+    edges = bin_edges(value_range[0], value_range[1], bins)
+    counts = np.zeros(bins, dtype='int64')
+    for chunk in chunks:
+        values = np.asarray(chunk, dtype='float64')
+        counts += np.histogram(values[~np.isnan(values)], bins=edges)[0]
+    return binned_frame(edges, counts)
+
+
+def matches_pandas_histogram(values, binned):
+    """Точная сверка с np.histogram по сырым значениям (как в plt.hist)"""
+    values = pd.to_numeric(pd.Series(values)).astype('float64').dropna().to_numpy()
+    counts, edges = np.histogram(values, bins=len(binned))
+    return bool(np.array_equal(edges, edges_of(binned)) and np.array_equal(counts, binned['count'].to_numpy()))
+
+
+def _fake_run_query(values):
+    """run_query для db_histogram без базы: отвечает на оба его запроса по массиву values
+
+    width_bucket(x, ARRAY[...]) в PostgreSQL — число левых границ, не превышающих x,
+    то есть np.searchsorted(..., side='right').
+    """
+    values = np.asarray(values, dtype='float64')
+
+    def run_query(sql):
+        if 'width_bucket' not in sql:
+            if not len(values):
+                return pd.DataFrame({'lo': [None], 'hi': [None], 'n': [0]})
+            return pd.DataFrame({'lo': [values.min()], 'hi': [values.max()], 'n': [len(values)]})
+        thresholds = np.array([float(edge) for edge in re.search(r'ARRAY\[([^\]]*)\]', sql).group(1).split(',')])
+        buckets, counts = np.unique(np.searchsorted(thresholds, values, side='right'), return_counts=True)
+        return pd.DataFrame({'bucket': buckets, 'n': counts})
+    return run_query
+
+
+def verify_on_synthetic(scale=1, seed=42, bins=30, chunk_rows=7919):
+    """Сверка гистограмм с np.histogram на синтетических ценах, без базы
+
+    Проверяются цены listing из synthetic (как в create_histogram), те же
+    цены вместе со всеми границами интервалов (значения ровно на min, max и
+    внутренних границах) и набор из одинаковых значений. Каждый набор
+    считается через db_histogram (с эмуляцией width_bucket), потоково
+    порциями с заданными границами и порциями без них. True, если всё совпало.
+    """
+    import synthetic
+    prices = pd.concat([block['priceperticket'] for block in synthetic.generate_table('listing', scale, seed)])
+    prices = prices[prices.between(1, 500)].to_numpy(dtype='float64')
+    lo, hi = prices.min(), prices.max()
+    cases = {
+        'цены listing': prices,
+        'цены и границы интервалов': np.concatenate([prices, bin_edges(lo, hi, bins), [lo, hi, hi]]),
+        'одинаковые значения': np.full(1000, 42.0),
+    }
+
+    passed = True
+    for case, values in cases.items():
+        # Порции разного размера, включая пустую — как при потоковом чтении
+        chunks = [values[:0]] + [values[start:start + chunk_rows] for start in range(0, len(values), chunk_rows)]
+        results = {
+            'db_histogram': db_histogram(_fake_run_query(values), 'listing', 'priceperticket', bins=bins),
+            'chunked_histogram': chunked_histogram(iter(chunks), bins, (values.min(), values.max())),
+            'chunked_histogram (без границ)': chunked_histogram(iter(chunks), bins),
+        }
+        for method, binned in results.items():
+            matches = (matches_pandas_histogram(values, binned)
+                       and int(binned['count'].sum()) == len(values))
+            passed = passed and matches
+            print(f"{'✅' if matches else '❌'} {case}, {method}: {len(values)} значений")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Гистограммы без выгрузки сырых значений: проверка")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    verify = subparsers.add_parser('verify', help="сверка с np.histogram на синтетических ценах")
+    verify.add_argument('--scale', type=int, default=1)
+    verify.add_argument('--seed', type=int, default=42)
+    verify.add_argument('--bins', type=int, default=30)
+    args = parser.parse_args()
+    if not verify_on_synthetic(args.scale, args.seed, args.bins):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+"""Отрисовка статических графиков AWS Tickit.
+
+Каждая функция получает готовый DataFrame и путь к PNG, поэтому графики
+можно рисовать как в основном процессе, так и пакетно в пуле процессов
+без окна (backend Agg, без plt.show()).
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+DPI = 300
+STYLE = 'seaborn-v0_8'
+_style_applied = False
+
+# pyplot хранит глобальное состояние текущей фигуры, поэтому отрисовка
+# в потоках одного процесса (например, фоновые задачи Flask) сериализуется
+PYPLOT_LOCK = threading.Lock()
+
+# Общий пул процессов отрисовки: создаётся при первом пакете и живёт до выхода
+_POOL = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def error_bounds(df, column):
+    """Отклонения до границ интервала [column_low, column_high] для xerr/yerr
+    или None, если данные точные (не предпросмотр по выборке)"""
+    if f'{column}_low' not in df or f'{column}_high' not in df:
+        return None
+    return np.vstack([np.clip(df[column] - df[f'{column}_low'], 0, None),
+                      np.clip(df[f'{column}_high'] - df[column], 0, None)])
+
+
+def render_pie(df, path, colors):
+    """Круговая диаграмма: распределение выручки по категориям"""
+    fig = plt.figure(figsize=(10, 8))
+    labels = df['catgroup']
+    title = 'Распределение выручки по категориям событий (в тыс. $)'
+    errors = error_bounds(df, 'revenue_k')
+    if errors is not None:
+        labels = [f"{name}\n±{error:,.0f}" for name, error in zip(df['catgroup'], errors.max(axis=0))]
+        title += '\nпредпросмотр по выборке, ± — 95% интервал'
+    plt.pie(df['revenue_k'], labels=labels, autopct='%1.1f%%',
+            colors=colors, startangle=90)
+    plt.title(title, fontsize=14, fontweight='bold')
+    plt.tight_layout()
+    plt.savefig(path, dpi=DPI, bbox_inches='tight')
+    return fig
+
+
+def render_bar(df, path, colors):
+    """Столбчатая диаграмма: топ городов по пользователям"""
+    fig = plt.figure(figsize=(12, 6))
+    bars = plt.bar(range(len(df)), df['user_count'], color=colors[0])
+    plt.title('Топ-10 городов по количеству пользователей', fontsize=14, fontweight='bold')
+    plt.xlabel('Города')
+    plt.ylabel('Количество пользователей')
+    plt.xticks(range(len(df)), [f"{row['city']}, {row['state']}" for _, row in df.iterrows()], rotation=45)
+
+    # Добавляем значения на столбцы
+    for bar, count in zip(bars, df['user_count']):
+        plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 5,
+                 int(count), ha='center', va='bottom')
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=DPI, bbox_inches='tight')
+    return fig
+
+
+def render_horizontal_bar(df, path, colors):
+    """Горизонтальная столбчатая диаграмма: средний чек по штатам"""
+    fig = plt.figure(figsize=(12, 8))
+    bars = plt.barh(range(len(df)), df['avg_transaction'], color=colors[1],
+                    xerr=error_bounds(df, 'avg_transaction'), capsize=3)
+    plt.title('Средняя стоимость транзакции по штатам ($)', fontsize=14, fontweight='bold')
+    plt.xlabel('Средняя стоимость транзакции ($)')
+    plt.ylabel('Штаты')
+    plt.yticks(range(len(df)), df['state'])
+
+    # Добавляем значения
+    for bar, value in zip(bars, df['avg_transaction']):
+        plt.text(bar.get_width() + 1, bar.get_y() + bar.get_height()/2,
+                 f'${value:.2f}', va='center')
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=DPI, bbox_inches='tight')
+    return fig
+
+
+def render_line(df, path, colors):
+    """Линейный график: динамика продаж по месяцам"""
+    dates = pd.to_datetime(df['year'].astype(int).astype(str) + '-' + df['month'].astype(int).astype(str) + '-01')
+
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10))
+
+    # График количества продаж
+    ax1.plot(dates, df['total_sales'], marker='o', linewidth=2, color=colors[2])
+    ax1.set_title('Динамика количества продаж по месяцам', fontsize=14, fontweight='bold')
+    ax1.set_ylabel('Количество продаж')
+    ax1.grid(True, alpha=0.3)
+
+    # График выручки
+    ax2.plot(dates, df['total_revenue'], marker='s', linewidth=2, color=colors[3])
+    ax2.set_title('Динамика выручки по месяцам', fontsize=14, fontweight='bold')
+    ax2.set_ylabel('Выручка ($)')
+    ax2.set_xlabel('Месяц')
+    ax2.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=DPI, bbox_inches='tight')
+    return fig
+
+
+def render_histogram(df, path, colors):
+    """Гистограмма: распределение цен на билеты (df — интервалы bin_left, bin_right, count)"""
+    edges = list(df['bin_left']) + [df['bin_right'].iloc[-1]]
+    fig = plt.figure(figsize=(12, 6))
+    plt.hist(df['bin_left'], bins=edges, weights=df['count'], color=colors[4], alpha=0.7, edgecolor='black')
+    errors = error_bounds(df, 'count')
+    if errors is not None:
+        plt.errorbar((df['bin_left'] + df['bin_right']) / 2, df['count'], yerr=errors,
+                     fmt='none', ecolor='black', capsize=2)
+    plt.title('Распределение цен на билеты', fontsize=14, fontweight='bold')
+    plt.xlabel('Цена билета ($)')
+    plt.ylabel('Количество билетов')
+    plt.grid(True, alpha=0.3)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=DPI, bbox_inches='tight')
+    return fig
+
+
+def render_scatter(df, path, colors):
+    """Точечная диаграмма: цена vs количество проданных билетов"""
+    fig = plt.figure(figsize=(12, 8))
+    scatter = plt.scatter(df['avg_ticket_price'], df['total_tickets_sold'],
+                          c=df['avg_ticket_price'], cmap='viridis', s=100, alpha=0.6)
+    xerr, yerr = error_bounds(df, 'avg_ticket_price'), error_bounds(df, 'total_tickets_sold')
+    if xerr is not None or yerr is not None:
+        plt.errorbar(df['avg_ticket_price'], df['total_tickets_sold'], xerr=xerr, yerr=yerr,
+                     fmt='none', ecolor='gray', alpha=0.6, capsize=3)
+
+    plt.colorbar(scatter, label='Средняя цена билета ($)')
+    plt.title('Связь между ценой билета и количеством проданных билетов', fontsize=14, fontweight='bold')
+    plt.xlabel('Средняя цена билета ($)')
+    plt.ylabel('Общее количество проданных билетов')
+    plt.grid(True, alpha=0.3)
+
+    # Добавляем подписи категорий
+    for _, row in df.iterrows():
+        plt.annotate(row['catname'],
+                     (row['avg_ticket_price'], row['total_tickets_sold']),
+                     xytext=(5, 5), textcoords='offset points', fontsize=8)
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=DPI, bbox_inches='tight')
+    return fig
+
+
+def _render_revenue_update(df, path, color, title):
+    fig = plt.figure(figsize=(10, 6))
+    plt.bar(df['catgroup'], df['revenue'], color=color)
+    plt.title(title, fontweight='bold')
+    plt.ylabel('Выручка ($)')
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig(path, dpi=DPI, bbox_inches='tight')
+    return fig
+
+
+def render_before_update(df, path, colors):
+    """Выручка по категориям до обновления данных"""
+    return _render_revenue_update(df, path, 'lightblue', 'Выручка по категориям (ДО обновления)')
+
+
+def render_after_update(df, path, colors):
+    """Выручка по категориям после обновления данных"""
+    return _render_revenue_update(df, path, 'lightgreen', 'Выручка по категориям (ПОСЛЕ обновления)')
+
+
+# Бюджеты интерактивного графика: объём HTML и время отрисовки в браузере
+# не растут с историей продаж
+SLIDER_MAX_FRAMES = 36
+SLIDER_MAX_POINTS = 240
+SLIDER_PERIODS = (('M', 'месяц'), ('Q', 'квартал'), ('Y', 'год'))
+
+
+def slider_frames(df, max_frames=SLIDER_MAX_FRAMES, max_points=SLIDER_MAX_POINTS):
+    """Предагрегация дневных продаж по категориям под бюджеты слайдера
+
+    Кадр — месяц, квартал или год: берётся самый мелкий период, при котором
+    кадров не больше max_frames (иначе остаются последние max_frames лет).
+    Если в кадре больше max_points точек, дни внутри кадра объединяются
+    в интервалы по step дней: daily_sales и daily_tickets усредняются
+    (остаются «в день»), avg_price взвешивается числом продаж.
+    """
+    df = df.assign(sale_date=pd.to_datetime(df['sale_date']))
+    for freq, period_name in SLIDER_PERIODS:
+        periods = df['sale_date'].dt.to_period(freq)
+        if periods.nunique() <= max_frames:
+            break
+    else:
+        periods = periods[periods >= sorted(periods.unique())[-max_frames]]
+        df = df.loc[periods.index]
+
+    frame_start = periods.dt.start_time
+    days_per_frame = df.groupby(periods)['sale_date'].nunique().max()
+    step = max(1, -(-int(days_per_frame) * df['catgroup'].nunique() // max_points))
+    offset = (df['sale_date'] - frame_start).dt.days // step * step
+    bucket = frame_start + pd.to_timedelta(offset, unit='D')
+
+    df = df.assign(period=periods.astype(str), bucket=bucket,
+                   revenue=df['avg_price'] * df['daily_sales'])
+    df = df.groupby(['bucket', 'period', 'catgroup'], observed=True).agg(
+        daily_sales=('daily_sales', 'mean'),
+        daily_tickets=('daily_tickets', 'mean'),
+        revenue=('revenue', 'sum'),
+        sales=('daily_sales', 'sum'),
+    ).reset_index()
+    df['avg_price'] = df['revenue'] / df['sales']
+    df.attrs.update(period_name=period_name, step_days=step)
+    return df.drop(columns=['revenue', 'sales']).sort_values('bucket', ignore_index=True)
+
+
+def slider_figure(df, max_frames=SLIDER_MAX_FRAMES, max_points=SLIDER_MAX_POINTS):
+    """Интерактивный график plotly с временным слайдером (данные прорежены, см. slider_frames)"""
+    # plotly загружается только для интерактивного графика
+    import plotly.express as px
+    df = slider_frames(df, max_frames, max_points)
+    return px.scatter(df,
+                      x="daily_sales",
+                      y="avg_price",
+                      size="daily_tickets",
+                      color="catgroup",
+                      animation_frame="period",
+                      title="Интерактивная динамика продаж по категориям",
+                      labels={"daily_sales": "Ежедневные продажи",
+                              "avg_price": "Средняя цена ($)",
+                              "period": df.attrs['period_name'].capitalize()},
+                      range_x=[0, df['daily_sales'].max() * 1.1],
+                      range_y=[0, df['avg_price'].max() * 1.1])
+
+
+def write_slider_html(fig, path, compact=True):
+    """Автономный HTML интерактивного графика (plotly.js встроен в файл)
+
+    compact=True — числовые массивы всех кадров приводятся к float32 и
+    попадают в HTML в двоичном base64-виде, а не списками чисел в JSON.
+    """
+    if compact:
+        for trace in list(fig.data) + [trace for frame in fig.frames for trace in frame.data]:
+            trace.x = np.asarray(trace.x, dtype='float32')
+            trace.y = np.asarray(trace.y, dtype='float32')
+            if trace.marker.size is not None:
+                trace.marker.size = np.asarray(trace.marker.size, dtype='float32')
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fig.write_html(path, include_plotlyjs=True, full_html=True, auto_play=False)
+    return os.path.getsize(path)
+
+
+# Имя графика -> (функция отрисовки, путь к PNG, сообщение об успехе)
+CHARTS = {
+    'pie': (render_pie, 'charts/pie_chart_revenue_by_category.png', 'Создана круговая диаграмма'),
+    'bar': (render_bar, 'charts/bar_chart_top_cities.png', 'Создана столбчатая диаграмма'),
+    'horizontal_bar': (render_horizontal_bar, 'charts/horizontal_bar_avg_transaction.png',
+                       'Создана горизонтальная столбчатая диаграмма'),
+    'line': (render_line, 'charts/line_chart_sales_trends.png', 'Создан линейный график'),
+    'histogram': (render_histogram, 'charts/histogram_ticket_prices.png', 'Создана гистограмма'),
+    'scatter': (render_scatter, 'charts/scatter_price_vs_quantity.png', 'Создана точечная диаграмма'),
+    'before_update': (render_before_update, 'charts/before_update.png', 'Создан график ДО обновления'),
+    'after_update': (render_after_update, 'charts/after_update.png', 'Создан график ПОСЛЕ обновления'),
+}
+
+
+def render(name, df, colors):
+    """Отрисовка графика name в его PNG; возвращает фигуру matplotlib"""
+    render_fn, path, _ = CHARTS[name]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with PYPLOT_LOCK:
+        return render_fn(df, path, colors)
+
+
+def use_style():
+    """Стиль графиков анализа (применяется один раз на процесс)"""
+    global _style_applied
+    if not _style_applied:
+        plt.style.use(STYLE)
+        _style_applied = True
+
+
+def _init_worker():
+    """Инициализация процесса-воркера: безоконный backend и стиль графиков"""
+    matplotlib.use('Agg', force=True)
+    use_style()
+
+
+def _ping():
+    return os.getpid()
+
+
+def worker_pool(max_workers=None):
+    """Общий пул процессов для пакетной отрисовки (один на процесс)
+
+    Воркеры запускаются через spawn, а не fork: пул создаётся из потоков
+    фоновых задач, и при fork дочерний процесс унаследовал бы PYPLOT_LOCK
+    (и другие блокировки), захваченные в этот момент соседним потоком.
+    Импорт pandas и matplotlib в воркере оплачивается один раз, поэтому
+    пул не закрывается после пакета; если нужно больше воркеров, чем
+    есть, пул пересоздаётся. Закрывать его вызывающему не нужно.
+    """
+    global _POOL, _POOL_WORKERS
+    max_workers = max_workers or os.cpu_count() or 1
+    with _POOL_LOCK:
+        if _POOL is None or max_workers > _POOL_WORKERS:
+            if _POOL is not None:
+                # Уже отправленные задачи старого пула доработают
+                _POOL.shutdown(wait=False)
+            _POOL = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _POOL_WORKERS = max_workers
+        return _POOL
+
+
+def warm_worker_pool(max_workers=None):
+    """Запуск воркеров заранее (например, пока выполняются запросы графиков)"""
+    pool = worker_pool(max_workers)
+    for _ in range(_POOL_WORKERS):
+        pool.submit(_ping)
+    return pool
+
+
+def discard_worker_pool(pool=None):
+    """Закрытие общего пула (или только пула pool, если он ещё общий): после падения воркера"""
+    global _POOL, _POOL_WORKERS
+    with _POOL_LOCK:
+        if _POOL is None or (pool is not None and pool is not _POOL):
+            return
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL, _POOL_WORKERS = None, 0
+
+
+atexit.register(discard_worker_pool)
+
+
+def _render_job(name, df, colors):
+    started = time.perf_counter()
+    # В воркере один поток, PYPLOT_LOCK не нужен
+    render_fn, path, _ = CHARTS[name]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fig = render_fn(df, path, colors)
+    plt.close(fig)
+    return name, CHARTS[name][1], time.perf_counter() - started
+
+
+def render_batch(jobs, colors, max_workers=None):
+    """Параллельная отрисовка списка (имя, DataFrame): одна фигура на воркер
+
+    Возвращает словарь имя -> время отрисовки в секундах.
+    """
+    timings = {}
+    if not jobs:
+        return timings
+    pool = worker_pool(min(max_workers or os.cpu_count() or 1, len(jobs)))
+    futures = {pool.submit(_render_job, name, df, colors): name for name, df in jobs}
+    for future in as_completed(futures):
+        try:
+            name, path, seconds = future.result()
+            timings[name] = seconds
+            print(f"✅ {CHARTS[name][2]}: {path} ({seconds:.2f} с)")
+        except BrokenProcessPool as e:
+            discard_worker_pool(pool)
+            print(f"❌ Ошибка отрисовки графика {futures[future]}: воркер завершился аварийно ({e})")
+        except Exception as e:
+            print(f"❌ Ошибка отрисовки графика {futures[future]}: {e}")
+    return timings
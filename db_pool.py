@@ -0,0 +1,106 @@
+"""Общий пул соединений с базой AWS Tickit.
+
+Анализаторы и веб-приложение берут соединения из одного потокобезопасного
+пула вместо того, чтобы открывать новое соединение на каждый запуск.
+Перед выдачей соединение проверяется; разорванные соединения заменяются.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool as pg_pool
+
+DB_CONFIG = {
+    'host': "localhost",
+    'database': "AWS_Tickit_Database",
+    'user': "postgres",
+    'password': "0000",
+    'port': "5432",
+}
+
+
+class ConnectionPool:
+    """Пул соединений psycopg2 с ожиданием свободного слота и проверкой здоровья"""
+
+    def __init__(self, minconn=1, maxconn=8, health_check_interval=30.0, **config):
+        self.maxconn = maxconn
+        self.health_check_interval = health_check_interval
+        self._pool = pg_pool.ThreadedConnectionPool(minconn, maxconn, **{**DB_CONFIG, **config})
+        # ThreadedConnectionPool выбрасывает PoolError при исчерпании — ждём слот сами
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_checked = {}
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        if now - self._last_checked.get(id(conn), 0) < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        self._last_checked[id(conn)] = now
+        return True
+
+    def getconn(self):
+        """Рабочее соединение из пула (блокирует, пока нет свободного слота)"""
+        self._slots.acquire()
+        try:
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self._is_healthy(conn):
+                    return conn
+                self._last_checked.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+            raise psycopg2.OperationalError("Не удалось получить рабочее соединение из пула")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """Возврат соединения в пул (разорванные соединения закрываются)"""
+        try:
+            close = close or bool(conn.closed)
+            if close:
+                self._last_checked.pop(id(conn), None)
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """with pool.connection() as conn: ..."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        self._pool.closeall()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_pool(**kwargs):
+    """Общий для процесса пул соединений (создаётся при первом обращении)"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ConnectionPool(**kwargs)
+        return _shared_pool
+
+
+def close_pool():
+    """Закрытие всех соединений общего пула"""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.closeall()
+            _shared_pool = None
@@ -0,0 +1,268 @@
+"""Выгрузка таблиц и наборов данных в CSV / CSV.gz / Parquet потоком из PostgreSQL.
+
+Данные читаются командой COPY (...) TO STDOUT и передаются дальше порциями
+через ограниченную очередь, поэтому память процесса не зависит от размера
+выгрузки: ни DataFrame, ни весь файл целиком в памяти не собираются.
+Для Parquet поток CSV из COPY разбирается pyarrow блоками и пишется
+группами строк.
+
+    python extract.py --list
+    python extract.py sales --format csv.gz --output exports/sales.csv.gz
+    python extract.py sales_facts --format parquet --output exports/sales_facts.parquet
+"""
+import argparse
+import os
+import queue
+import threading
+import zlib
+
+from query_cache import normalize_sql
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+TABLES = ('sales', 'listing', 'events', 'users', 'venue', 'category', 'date')
+CHUNK_SIZE = 256 * 1024
+# Не больше QUEUE_CHUNKS порций ждут отправки клиенту
+QUEUE_CHUNKS = 16
+# Размер блока CSV, из которого pyarrow собирает одну группу строк Parquet
+PARQUET_BLOCK_SIZE = 8 * 1024 * 1024
+
+# OID типов PostgreSQL -> тип колонки Arrow (остальные типы выгружаются строками)
+ARROW_TYPES = {
+    16: 'bool_',
+    20: 'int64', 21: 'int16', 23: 'int32',
+    700: 'float32', 701: 'float64',
+    # NUMERIC переводится в float64, как и при загрузке таблицы фактов
+    1700: 'float64',
+    1082: 'date32',
+    1114: 'timestamp',
+}
+
+
+class ExtractCancelled(Exception):
+    """Клиент перестал читать выгрузку"""
+
+
+def extract_sources():
+    """Имя -> SQL: таблицы Tickit, таблица фактов и наборы данных графиков и отчета"""
+    import facts
+    from main import CHART_QUERIES, EXCEL_QUERIES
+    sources = {table: f"SELECT * FROM {table}" for table in TABLES}
+    sources['sales_facts'] = facts.FACT_QUERY
+    sources.update(CHART_QUERIES)
+    sources.update(EXCEL_QUERIES)
+    return {name: normalize_sql(query) for name, query in sources.items()}
+
+
+class _ChunkWriter:
+    """Файлоподобный приёмник: собирает записи в порции CHUNK_SIZE и кладёт их в очередь
+
+    COPY вызывает write() на каждую строку, поэтому данные буферизуются;
+    при gzip=True порции сжимаются на лету.
+    """
+
+    def __init__(self, chunks, stop, gzip=False, chunk_size=CHUNK_SIZE):
+        self.chunks = chunks
+        self.stop = stop
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        self.closed = False
+        self.written = 0
+
+    def _put(self, data):
+        while True:
+            if self.stop.is_set():
+                raise ExtractCancelled()
+            try:
+                self.chunks.put(bytes(data), timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.written += len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data)
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_size:
+            self._put(self.buffer)
+            self.buffer.clear()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        if self.compressor is not None:
+            self.buffer += self.compressor.flush()
+        if self.buffer:
+            self._put(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        self.closed = True
+
+
+def _column_types(connection, query):
+    """Имена колонок запроса и типы Arrow (без чтения строк)"""
+    import pyarrow as pa
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT * FROM ({query}) extract_source LIMIT 0")
+        description = cursor.description
+    connection.rollback()
+    types = {}
+    for column in description:
+        kind = ARROW_TYPES.get(column.type_code, 'string')
+        types[column.name] = pa.timestamp('us') if kind == 'timestamp' else getattr(pa, kind)()
+    return [column.name for column in description], types
+
+
+def _copy_csv(connection, query, sink, header=True):
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv{', HEADER' if header else ''})", sink)
+    connection.rollback()
+
+
+def _write_parquet(connection, query, writer):
+    """COPY в CSV -> pyarrow (потоковый разбор блоками) -> Parquet в writer"""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    names, types = _column_types(connection, query)
+    read_fd, write_fd = os.pipe()
+    failure = []
+
+    def copy():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe:
+                _copy_csv(connection, query, pipe, header=False)
+        except BaseException as e:
+            failure.append(e)
+
+    copier = threading.Thread(target=copy, daemon=True)
+    copier.start()
+    try:
+        with os.fdopen(read_fd, 'rb') as pipe:
+            if pipe.peek(1):
+                reader = pa_csv.open_csv(
+                    pipe,
+                    read_options=pa_csv.ReadOptions(column_names=names, block_size=PARQUET_BLOCK_SIZE),
+                    # COPY пишет NULL пустым полем без кавычек, пустую строку — как ""
+                    convert_options=pa_csv.ConvertOptions(column_types=types, null_values=[''],
+                                                          strings_can_be_null=True,
+                                                          quoted_strings_can_be_null=False,
+                                                          true_values=['t'], false_values=['f']),
+                )
+                with pq.ParquetWriter(writer, reader.schema, compression='zstd') as parquet:
+                    for batch in reader:
+                        parquet.write_batch(batch)
+            else:
+                # Пустой результат: pyarrow не разбирает CSV без строк — пишется только схема
+                schema = pa.schema([(name, types[name]) for name in names])
+                pq.ParquetWriter(writer, schema, compression='zstd').close()
+    finally:
+        copier.join()
+    if failure:
+        raise failure[0]
+
+
+def stream_extract(connection, query, file_format='csv', chunk_size=CHUNK_SIZE):
+    """Генератор порций байтов выгрузки запроса query в формате file_format
+
+    COPY выполняется в отдельном потоке на переданном соединении; если
+    потребитель закрывает генератор раньше времени (клиент оборвал загрузку),
+    запрос в базе отменяется.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {file_format}")
+    chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+    stop = threading.Event()
+    done = object()
+    writer = _ChunkWriter(chunks, stop, gzip=file_format == 'csv.gz', chunk_size=chunk_size)
+
+    def produce():
+        try:
+            if file_format == 'parquet':
+                _write_parquet(connection, query, writer)
+            else:
+                _copy_csv(connection, query, writer)
+            writer.finish()
+            result = done
+        except ExtractCancelled:
+            return
+        except BaseException as e:
+            connection.rollback()
+            result = e
+        while not stop.is_set():
+            try:
+                chunks.put(result, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        if producer.is_alive():
+            stop.set()
+            connection.cancel()
+        producer.join()
+        connection.rollback()
+
+
+def extract_to_file(connection, query, path, file_format='csv'):
+    """Выгрузка запроса в файл; возвращает размер файла в байтах"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for chunk in stream_extract(connection, query, file_format):
+            f.write(chunk)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка данных AWS Tickit через COPY")
+    parser.add_argument('source', nargs='?', help="таблица или набор данных (см. --list)")
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--output', help="путь к файлу (по умолчанию exports/<source>.<формат>)")
+    parser.add_argument('--list', action='store_true', help="показать доступные источники")
+    args = parser.parse_args()
+
+    sources = extract_sources()
+    if args.list or not args.source:
+        print("📦 Источники выгрузки: " + ", ".join(sources))
+        return
+    if args.source not in sources:
+        raise SystemExit(f"❌ Неизвестный источник: {args.source}")
+
+    import time
+    from db_pool import get_pool, close_pool
+    output = args.output or os.path.join('exports', f"{args.source}.{FORMATS[args.format][1]}")
+    started = time.perf_counter()
+    try:
+        with get_pool().connection() as connection:
+            size = extract_to_file(connection, sources[args.source], output, args.format)
+        elapsed = time.perf_counter() - started
+        print(f"✅ {args.source} выгружен в {output}: {size / 1024 ** 2:.1f} MB за {elapsed:.2f} с")
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
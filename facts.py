@@ -0,0 +1,134 @@
+"""Единая выборка фактов продаж и агрегаты для графиков и экспорта.
+
+Вместо того чтобы каждый график заново соединял sales ⨝ events ⨝ category,
+таблица фактов выгружается один раз (только нужные колонки, компактные типы),
+а все агрегаты считаются из неё векторизованными groupby в pandas.
+"""
+import pandas as pd
+
+# Денормализованная выборка: одна строка на продажу, только используемые колонки.
+# LEFT JOIN сохраняет все продажи; агрегаты сами отбрасывают строки без пары,
+# повторяя семантику INNER JOIN исходных запросов.
+FACT_QUERY = """
+SELECT s.saleid, s.eventid, s.saletime, s.qtysold, s.pricepaid,
+       c.catgroup, c.catname,
+       l.priceperticket,
+       u.state AS buyer_state,
+       v.venueid, v.venuename, v.venuecity, v.venuestate
+FROM sales s
+LEFT JOIN events e ON s.eventid = e.eventid
+LEFT JOIN category c ON e.catid = c.catid
+LEFT JOIN listing l ON s.listid = l.listid
+LEFT JOIN users u ON s.buyerid = u.userid
+LEFT JOIN venue v ON e.venueid = v.venueid;
+"""
+
+CATEGORICAL_COLUMNS = ['catgroup', 'catname', 'buyer_state', 'venuename', 'venuecity', 'venuestate']
+
+
+def compact_facts(df):
+    """Приведение таблицы фактов к компактным типам (int32/int16/category)"""
+    df['saleid'] = df['saleid'].astype('int32')
+    df['eventid'] = df['eventid'].astype('int32')
+    df['qtysold'] = df['qtysold'].astype('int16')
+    df['saletime'] = pd.to_datetime(df['saletime'])
+    # NUMERIC из PostgreSQL приходит как Decimal (object) — переводим в float64
+    df['pricepaid'] = pd.to_numeric(df['pricepaid']).astype('float64')
+    df['priceperticket'] = pd.to_numeric(df['priceperticket']).astype('float64')
+    df['venueid'] = pd.to_numeric(df['venueid']).astype('Int32')
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def _plain(df):
+    """Категориальные колонки результата -> обычные строки (для графиков и Excel)"""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    return df
+
+
+def category_revenue(facts):
+    """Выручка по группам категорий в тыс. $ (круговая диаграмма)"""
+    df = (facts.groupby('catgroup', observed=True)['pricepaid'].sum() / 1000).round(2)
+    df = df.rename('revenue_k').reset_index()
+    return _plain(df.sort_values('revenue_k', ascending=False, ignore_index=True))
+
+
+def state_avg_transaction(facts):
+    """Средний чек по штатам покупателей (горизонтальная диаграмма)"""
+    df = facts.groupby('buyer_state', observed=True).agg(
+        avg_transaction=('pricepaid', 'mean'),
+        total_sales=('saleid', 'count'),
+    ).reset_index().rename(columns={'buyer_state': 'state'})
+    df = df[df['total_sales'] > 100]
+    df = df.sort_values('avg_transaction', ascending=False, ignore_index=True).head(15)
+    return _plain(df)
+
+
+def monthly_sales(facts):
+    """Количество продаж и выручка по месяцам (линейный график)"""
+    sold = facts[facts['venueid'].notna()]
+    df = sold.groupby([sold['saletime'].dt.year.rename('year'),
+                       sold['saletime'].dt.month.rename('month')]).agg(
+        total_sales=('saleid', 'count'),
+        total_revenue=('pricepaid', 'sum'),
+    ).reset_index()
+    return df.sort_values(['year', 'month'], ignore_index=True)
+
+
+def price_vs_quantity(facts):
+    """Средняя цена билета и число проданных билетов по категориям (точечная диаграмма)"""
+    listed = facts[facts['priceperticket'].notna()]
+    df = listed.groupby('catname', observed=True).agg(
+        avg_ticket_price=('priceperticket', 'mean'),
+        total_tickets_sold=('qtysold', 'sum'),
+    ).reset_index()
+    df = df[df['total_tickets_sold'] > 100]
+    return _plain(df[['avg_ticket_price', 'total_tickets_sold', 'catname']].reset_index(drop=True))
+
+
+def daily_category_sales(facts):
+    """Ежедневные продажи по группам категорий с 2008 года (интерактивный график)"""
+    recent = facts[facts['saletime'] >= '2008-01-01']
+    df = recent.groupby([recent['saletime'].dt.normalize().rename('sale_date'), 'catgroup'],
+                        observed=True).agg(
+        avg_price=('pricepaid', 'mean'),
+        daily_sales=('saleid', 'count'),
+        daily_tickets=('qtysold', 'sum'),
+    ).reset_index()
+    return _plain(df.sort_values('sale_date', ignore_index=True))
+
+
+def sales_summary(facts):
+    """Сводка продаж по категориям (лист Sales_Summary)"""
+    df = facts.groupby(['catgroup', 'catname'], observed=True).agg(
+        total_sales=('saleid', 'count'),
+        total_tickets=('qtysold', 'sum'),
+        total_revenue=('pricepaid', 'sum'),
+        avg_sale_amount=('pricepaid', 'mean'),
+    ).reset_index()
+    return _plain(df.sort_values('total_revenue', ascending=False, ignore_index=True))
+
+
+def venue_performance(facts):
+    """Показатели площадок (лист Venue_Performance)"""
+    df = facts.groupby(['venueid', 'venuename', 'venuecity', 'venuestate'], observed=True).agg(
+        total_events=('eventid', 'nunique'),
+        total_revenue=('pricepaid', 'sum'),
+        avg_revenue_per_event=('pricepaid', 'mean'),
+    ).reset_index().drop(columns='venueid')
+    return _plain(df.sort_values('total_revenue', ascending=False, ignore_index=True))
+
+
+# Имя набора данных -> функция, считающая его из таблицы фактов
+FACT_AGGREGATES = {
+    'category_revenue': category_revenue,
+    'state_avg_transaction': state_avg_transaction,
+    'monthly_sales': monthly_sales,
+    'price_vs_quantity': price_vs_quantity,
+    'daily_category_sales': daily_category_sales,
+    'Sales_Summary': sales_summary,
+    'Venue_Performance': venue_performance,
+}
@@ -0,0 +1,64 @@
+"""Файловые блокировки и атомарная запись JSON-индексов.
+
+Индексы кэшей и манифесты (artifacts.json, индекс кэша запросов, манифест
+отрисовки) читаются и пишутся несколькими процессами: веб-сервером, его
+фоновыми задачами и запусками из командной строки. Изменение индекса
+выполняется как «перечитать — изменить — записать» под file_lock(), а сама
+запись идёт через временный файл и os.replace.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками процесса
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Монопольная блокировка файла path между процессами (через path.lock)"""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def file_version(path):
+    """Отпечаток файла (inode, mtime_ns, размер) или None, если файла нет
+
+    Файлы заменяются через os.replace, поэтому новая запись меняет inode
+    даже при совпадающих времени изменения и размере.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def read_json(path, default=None):
+    """Содержимое JSON-файла или default, если файла нет или он повреждён"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data, **dump_options):
+    """Атомарная запись JSON; возвращает отпечаток нового файла"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, **dump_options)
+    os.replace(tmp_path, path)
+    return file_version(path)
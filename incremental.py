@@ -0,0 +1,141 @@
+"""Инкрементальные агрегаты продаж с «водяным знаком» по saleid.
+
+Накопленные суммы (выручка, билеты, число продаж) по группам категорий,
+месяцам и штатам покупателей хранятся в памяти. Каждое обновление читает
+только продажи с saleid больше последнего обработанного и добавляет их
+к состоянию, поэтому стоимость обновления пропорциональна размеру изменения.
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+
+DELTA_QUERY = """
+SELECT s.saleid, s.saletime, s.qtysold, s.pricepaid,
+       c.catgroup, u.state
+FROM sales s
+LEFT JOIN events e ON s.eventid = e.eventid
+LEFT JOIN category c ON e.catid = c.catid
+LEFT JOIN users u ON s.buyerid = u.userid
+WHERE s.saleid > %(last_saleid)s;
+"""
+
+# Полный пересчёт каждого измерения — для сверки с инкрементальным состоянием
+FULL_QUERIES = {
+    'catgroup': """
+        SELECT c.catgroup AS key, SUM(s.pricepaid) AS revenue,
+               SUM(s.qtysold) AS tickets, COUNT(s.saleid) AS sales
+        FROM sales s
+        JOIN events e ON s.eventid = e.eventid
+        JOIN category c ON e.catid = c.catid
+        WHERE s.saleid <= %(last_saleid)s
+        GROUP BY c.catgroup;
+    """,
+    'month': """
+        SELECT TO_CHAR(s.saletime, 'YYYY-MM') AS key, SUM(s.pricepaid) AS revenue,
+               SUM(s.qtysold) AS tickets, COUNT(s.saleid) AS sales
+        FROM sales s
+        WHERE s.saleid <= %(last_saleid)s
+        GROUP BY key;
+    """,
+    'state': """
+        SELECT u.state AS key, SUM(s.pricepaid) AS revenue,
+               SUM(s.qtysold) AS tickets, COUNT(s.saleid) AS sales
+        FROM sales s
+        JOIN users u ON s.buyerid = u.userid
+        WHERE s.saleid <= %(last_saleid)s
+        GROUP BY u.state;
+    """,
+}
+
+MEASURES = ['revenue', 'tickets', 'sales']
+
+
+def _empty_state():
+    return pd.DataFrame({'revenue': pd.Series(dtype='float64'),
+                         'tickets': pd.Series(dtype='int64'),
+                         'sales': pd.Series(dtype='int64')})
+
+
+class IncrementalAggregator:
+    """Накопленные агрегаты продаж по catgroup, месяцу и штату"""
+
+    def __init__(self):
+        self.state = {dim: _empty_state() for dim in FULL_QUERIES}
+        self.last_saleid = 0
+        self.last_saletime = None
+
+    def _merge(self, rows):
+        """Добавление новых продаж (колонки saleid, saletime, qtysold, pricepaid, catgroup, state)"""
+        if len(rows) == 0:
+            return 0
+        rows = rows.assign(
+            pricepaid=pd.to_numeric(rows['pricepaid']).astype('float64'),
+            saletime=pd.to_datetime(rows['saletime']),
+        )
+        keys = {
+            'catgroup': rows['catgroup'].astype(object),
+            'month': rows['saletime'].dt.strftime('%Y-%m'),
+            'state': rows['state'].astype(object),
+        }
+        for dim, key in keys.items():
+            delta = rows.groupby(key.rename('key'), observed=True).agg(
+                revenue=('pricepaid', 'sum'),
+                tickets=('qtysold', 'sum'),
+                sales=('saleid', 'count'),
+            )
+            merged = self.state[dim].add(delta, fill_value=0)
+            self.state[dim] = merged.astype({'tickets': 'int64', 'sales': 'int64'})
+        self.last_saleid = max(self.last_saleid, int(rows['saleid'].max()))
+        latest = rows['saletime'].max()
+        if self.last_saletime is None or latest > self.last_saletime:
+            self.last_saletime = latest
+        return len(rows)
+
+    def seed_from_facts(self, facts):
+        """Начальное состояние из уже загруженной таблицы фактов (без запросов к БД)"""
+        rows = facts[['saleid', 'saletime', 'qtysold', 'pricepaid', 'catgroup', 'buyer_state']]
+        return self._merge(rows.rename(columns={'buyer_state': 'state'}))
+
+    def refresh(self, connection):
+        """Чтение и учёт только новых продаж; возвращает число добавленных строк"""
+        delta = pd.read_sql_query(DELTA_QUERY, connection,
+                                  params={'last_saleid': self.last_saleid})
+        return self._merge(delta)
+
+    def frame(self, dim):
+        """Текущие агрегаты измерения dim, отсортированные по выручке"""
+        df = self.state[dim].rename_axis(dim).reset_index()
+        return df.sort_values('revenue', ascending=False, ignore_index=True)
+
+    def category_revenue(self):
+        """Выручка по группам категорий (колонки catgroup, revenue)"""
+        return self.frame('catgroup')[['catgroup', 'revenue']]
+
+    def verify(self, connection):
+        """Сверка инкрементального состояния с полным пересчётом в БД"""
+        results = {}
+        for dim, query in FULL_QUERIES.items():
+            full = pd.read_sql_query(query, connection, params={'last_saleid': self.last_saleid})
+            full = full.set_index('key')[MEASURES].astype('float64').sort_index()
+            mine = self.state[dim][MEASURES].astype('float64').sort_index()
+            results[dim] = (full.index.equals(mine.index)
+                            and bool(np.allclose(full.values, mine.values, rtol=1e-9, atol=0.005)))
+        return results
+
+    def save(self, path):
+        """Сохранение состояния и водяного знака на диск"""
+        with open(path, 'wb') as f:
+            pickle.dump({'state': self.state, 'last_saleid': self.last_saleid,
+                         'last_saletime': self.last_saletime}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Загрузка ранее сохранённого состояния"""
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        aggregator = cls()
+        aggregator.state = data['state']
+        aggregator.last_saleid = data['last_saleid']
+        aggregator.last_saletime = data['last_saletime']
+        return aggregator
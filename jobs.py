@@ -0,0 +1,141 @@
+"""Фоновые задачи для веб-дашборда.
+
+Долгие операции (полный анализ и т.п.) выполняются в ограниченном пуле
+потоков, а HTTP-запрос сразу получает идентификатор задачи. Одинаковые
+задачи (тот же вид и те же параметры), которые уже стоят в очереди или
+выполняются, не запускаются повторно. Задачи с общим ресурсом (например,
+пишущие одни и те же файлы) выполняются строго по очереди, а остальные —
+параллельно на свободных воркерах.
+"""
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobManager:
+    """Очередь фоновых задач с ограниченным числом воркеров и дедупликацией"""
+
+    def __init__(self, max_workers=2, history=100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tickit-job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = {}
+        # Ресурс -> (задача, занимающая ресурс; очередь ждущих его задач)
+        self._resources = {}
+        self.history = history
+
+    @staticmethod
+    def _key(kind, params):
+        return (kind, tuple(sorted(params.items())))
+
+    def submit(self, kind, fn, resource=None, **params):
+        """Постановка задачи fn(report, **params) в очередь
+
+        Возвращает (снимок задачи, создана_ли_новая). Если такая же задача
+        уже в работе, возвращается она. Задача с ресурсом resource, занятым
+        другой задачей, ждёт её завершения в очереди этого ресурса.
+        """
+        key = self._key(kind, params)
+        with self._lock:
+            job_id = self._active.get(key)
+            if job_id is not None:
+                return self._snapshot(self._jobs[job_id]), False
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'kind': kind,
+                'params': params,
+                'resource': resource,
+                'status': 'queued',
+                'progress': 0.0,
+                'message': 'В очереди',
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'error': None,
+            }
+            self._jobs[job['id']] = job
+            self._active[key] = job['id']
+            self._trim_history()
+            start = True
+            if resource is not None:
+                if resource not in self._resources:
+                    self._resources[resource] = (job, deque())
+                else:
+                    holder, waiting = self._resources[resource]
+                    blocker = waiting[-1][0] if waiting else holder
+                    job['message'] = f"Ожидает задачу {blocker['id']}"
+                    waiting.append((job, key, fn, params))
+                    start = False
+            snapshot = self._snapshot(job)
+        if start:
+            self._executor.submit(self._run, job, key, fn, params)
+        return snapshot, True
+
+    def _release(self, resource):
+        """Передача ресурса следующей ждущей задаче (вызывается под self._lock)"""
+        _, waiting = self._resources[resource]
+        if not waiting:
+            del self._resources[resource]
+            return
+        job, key, fn, params = waiting.popleft()
+        self._resources[resource] = (job, waiting)
+        job['message'] = 'В очереди'
+        self._executor.submit(self._run, job, key, fn, params)
+
+    def _run(self, job, key, fn, params):
+        with self._lock:
+            job['status'] = 'running'
+            job['started'] = time.time()
+            job['message'] = 'Выполняется'
+
+        def report(done, total, message=''):
+            with self._lock:
+                job['progress'] = round(done / total, 3) if total else 0.0
+                job['message'] = message
+
+        try:
+            fn(report, **params)
+            with self._lock:
+                job['status'] = 'done'
+                job['progress'] = 1.0
+                job['message'] = 'Готово'
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+        finally:
+            with self._lock:
+                job['finished'] = time.time()
+                self._active.pop(key, None)
+                if job['resource'] is not None:
+                    self._release(job['resource'])
+
+    def _trim_history(self):
+        """Удаление самых старых завершённых задач сверх лимита истории"""
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] not in ACTIVE_STATUSES]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _snapshot(job):
+        snapshot = dict(job)
+        end = job['finished'] or time.time()
+        snapshot['elapsed'] = round(end - job['started'], 2) if job['started'] else None
+        return snapshot
+
+    def get(self, job_id):
+        """Снимок состояния задачи или None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def list(self):
+        """Снимки всех задач, новые первыми"""
+        with self._lock:
+            return [self._snapshot(job) for job in reversed(self._jobs.values())]
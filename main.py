@@ -1,106 +1,41 @@
-import psycopg2
-import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
-from openpyxl.formatting.rule import ColorScaleRule
-import os
-from datetime import datetime, timedelta
-import seaborn as sns
+"""Анализ AWS Tickit: графики, Excel-отчет и демонстрация обновления данных.
 
-class AWSTickitAnalyzer:
-    def __init__(self):
-        self.connection = None
-        self.connect()
-        plt.style.use('seaborn-v0_8')
-        self.colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD']
-    
-    def connect(self):
-        """Подключение к базе данных"""
-        try:
-            self.connection = psycopg2.connect(
-                host="localhost",
-                database="AWS_Tickit_Database",
-                user="postgres",
-                password="0000",
-                port="5432"
-            )
-            print("✅ Успешно подключились к базе данных AWS Tickit")
-        except Exception as e:
-            print(f"❌ Ошибка подключения: {e}")
-            raise
-    
-    def execute_query(self, query, description=""):
-        """Выполнение SQL-запроса"""
-        try:
-            df = pd.read_sql_query(query, self.connection)
-            if description:
-                print(f"📊 {description}: {len(df)} строк")
-            return df
-        except Exception as e:
-            print(f"❌ Ошибка выполнения запроса: {e}")
-            return None
+Тяжёлые библиотеки (pandas, matplotlib, plotly, openpyxl, psycopg2)
+импортируются внутри методов при первом использовании, а соединение с базой
+берётся из пула при первом запросе. Поэтому `from main import ...` и
+отдельные команды CLI не загружают весь стек:
 
-    # 1. PIE CHART - Распределение продаж по категориям событий
-    def create_pie_chart(self):
-        """Круговая диаграмма: распределение выручки по категориям"""
-        query = """
+    python main.py                       # полный анализ
+    python main.py charts pie scatter    # только выбранные графики
+    python main.py charts --parallel     # все статические графики в пуле процессов
+    python main.py export --streaming    # только Excel-отчет
+    python main.py list
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import metrics
+
+# Наборы данных графиков: имя -> SQL
+CHART_QUERIES = {
+    "category_revenue": """
         SELECT c.catgroup, ROUND(SUM(s.pricepaid) / 1000, 2) as revenue_k
         FROM sales s
         JOIN events e ON s.eventid = e.eventid
         JOIN category c ON e.catid = c.catid
         GROUP BY c.catgroup
         ORDER BY revenue_k DESC;
-        """
-        
-        df = self.execute_query(query, "Распределение выручки по категориям")
-        if df is not None and len(df) > 0:
-            plt.figure(figsize=(10, 8))
-            plt.pie(df['revenue_k'], labels=df['catgroup'], autopct='%1.1f%%', 
-                   colors=self.colors, startangle=90)
-            plt.title('Распределение выручки по категориям событий (в тыс. $)', fontsize=14, fontweight='bold')
-            plt.tight_layout()
-            os.makedirs('charts', exist_ok=True)
-            plt.savefig('charts/pie_chart_revenue_by_category.png', dpi=300, bbox_inches='tight')
-            plt.show()
-            print("✅ Создана круговая диаграмма: charts/pie_chart_revenue_by_category.png")
-
-    # 2. BAR CHART - Топ-10 городов по количеству пользователей
-    def create_bar_chart(self):
-        """Столбчатая диаграмма: топ городов по пользователям"""
-        query = """
+    """,
+    "top_cities": """
         SELECT city, state, COUNT(*) as user_count
         FROM users 
         GROUP BY city, state 
         HAVING COUNT(*) > 50
         ORDER BY user_count DESC
         LIMIT 10;
-        """
-        
-        df = self.execute_query(query, "Топ городов по пользователям")
-        if df is not None and len(df) > 0:
-            plt.figure(figsize=(12, 6))
-            bars = plt.bar(range(len(df)), df['user_count'], color=self.colors[0])
-            plt.title('Топ-10 городов по количеству пользователей', fontsize=14, fontweight='bold')
-            plt.xlabel('Города')
-            plt.ylabel('Количество пользователей')
-            plt.xticks(range(len(df)), [f"{row['city']}, {row['state']}" for _, row in df.iterrows()], rotation=45)
-            
-            # Добавляем значения на столбцы
-            for bar, count in zip(bars, df['user_count']):
-                plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 5, 
-                        int(count), ha='center', va='bottom')
-            
-            plt.tight_layout()
-            plt.savefig('charts/bar_chart_top_cities.png', dpi=300, bbox_inches='tight')
-            plt.show()
-            print("✅ Создана столбчатая диаграмма: charts/bar_chart_top_cities.png")
-
-    # 3. HORIZONTAL BAR CHART - Средний чек по штатам
-    def create_horizontal_bar_chart(self):
-        """Горизонтальная столбчатая диаграмма: средний чек по штатам"""
-        query = """
+    """,
+    "state_avg_transaction": """
         SELECT u.state, 
                AVG(s.pricepaid) as avg_transaction,
                COUNT(s.saleid) as total_sales
@@ -110,31 +45,8 @@ class AWSTickitAnalyzer:
         HAVING COUNT(s.saleid) > 100
         ORDER BY avg_transaction DESC
         LIMIT 15;
-        """
-        
-        df = self.execute_query(query, "Средний чек по штатам")
-        if df is not None and len(df) > 0:
-            plt.figure(figsize=(12, 8))
-            bars = plt.barh(range(len(df)), df['avg_transaction'], color=self.colors[1])
-            plt.title('Средняя стоимость транзакции по штатам ($)', fontsize=14, fontweight='bold')
-            plt.xlabel('Средняя стоимость транзакции ($)')
-            plt.ylabel('Штаты')
-            plt.yticks(range(len(df)), df['state'])
-            
-            # Добавляем значения
-            for i, (bar, value) in enumerate(zip(bars, df['avg_transaction'])):
-                plt.text(bar.get_width() + 1, bar.get_y() + bar.get_height()/2, 
-                        f'${value:.2f}', va='center')
-            
-            plt.tight_layout()
-            plt.savefig('charts/horizontal_bar_avg_transaction.png', dpi=300, bbox_inches='tight')
-            plt.show()
-            print("✅ Создана горизонтальная столбчатая диаграмма: charts/horizontal_bar_avg_transaction.png")
-
-    # 4. LINE CHART - Динамика продаж по месяцам
-    def create_line_chart(self):
-        """Линейный график: динамика продаж по месяцам"""
-        query = """
+    """,
+    "monthly_sales": """
         SELECT 
             EXTRACT(YEAR FROM s.saletime) as year,
             EXTRACT(MONTH FROM s.saletime) as month,
@@ -145,61 +57,8 @@ class AWSTickitAnalyzer:
         JOIN venue v ON e.venueid = v.venueid
         GROUP BY year, month
         ORDER BY year, month;
-        """
-        
-        df = self.execute_query(query, "Динамика продаж по месяцам")
-        if df is not None and len(df) > 0:
-            df['date'] = pd.to_datetime(df['year'].astype(int).astype(str) + '-' + df['month'].astype(int).astype(str) + '-01')
-            
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(14, 10))
-            
-            # График количества продаж
-            ax1.plot(df['date'], df['total_sales'], marker='o', linewidth=2, color=self.colors[2])
-            ax1.set_title('Динамика количества продаж по месяцам', fontsize=14, fontweight='bold')
-            ax1.set_ylabel('Количество продаж')
-            ax1.grid(True, alpha=0.3)
-            
-            # График выручки
-            ax2.plot(df['date'], df['total_revenue'], marker='s', linewidth=2, color=self.colors[3])
-            ax2.set_title('Динамика выручки по месяцам', fontsize=14, fontweight='bold')
-            ax2.set_ylabel('Выручка ($)')
-            ax2.set_xlabel('Месяц')
-            ax2.grid(True, alpha=0.3)
-            
-            plt.tight_layout()
-            plt.savefig('charts/line_chart_sales_trends.png', dpi=300, bbox_inches='tight')
-            plt.show()
-            print("✅ Создан линейный график: charts/line_chart_sales_trends.png")
-
-    # 5. HISTOGRAM - Распределение цен на билеты
-    def create_histogram(self):
-        """Гистограмма: распределение цен на билеты"""
-        query = """
-        SELECT l.priceperticket
-        FROM listing l
-        JOIN events e ON l.eventid = e.eventid
-        JOIN category c ON e.catid = c.catid
-        WHERE l.priceperticket BETWEEN 1 AND 500;
-        """
-        
-        df = self.execute_query(query, "Распределение цен на билеты")
-        if df is not None and len(df) > 0:
-            plt.figure(figsize=(12, 6))
-            plt.hist(df['priceperticket'], bins=30, color=self.colors[4], alpha=0.7, edgecolor='black')
-            plt.title('Распределение цен на билеты', fontsize=14, fontweight='bold')
-            plt.xlabel('Цена билета ($)')
-            plt.ylabel('Количество билетов')
-            plt.grid(True, alpha=0.3)
-            
-            plt.tight_layout()
-            plt.savefig('charts/histogram_ticket_prices.png', dpi=300, bbox_inches='tight')
-            plt.show()
-            print("✅ Создана гистограмма: charts/histogram_ticket_prices.png")
-
-    # 6. SCATTER PLOT - Связь между ценой билета и количеством проданных билетов
-    def create_scatter_plot(self):
-        """Точечная диаграмма: цена vs количество проданных билетов"""
-        query = """
+    """,
+    "price_vs_quantity": """
         SELECT 
             AVG(l.priceperticket) as avg_ticket_price,
             SUM(s.qtysold) as total_tickets_sold,
@@ -210,35 +69,8 @@ class AWSTickitAnalyzer:
         JOIN category c ON e.catid = c.catid
         GROUP BY c.catname
         HAVING SUM(s.qtysold) > 100;
-        """
-        
-        df = self.execute_query(query, "Цена vs количество проданных билетов")
-        if df is not None and len(df) > 0:
-            plt.figure(figsize=(12, 8))
-            scatter = plt.scatter(df['avg_ticket_price'], df['total_tickets_sold'], 
-                                c=df['avg_ticket_price'], cmap='viridis', s=100, alpha=0.6)
-            
-            plt.colorbar(scatter, label='Средняя цена билета ($)')
-            plt.title('Связь между ценой билета и количеством проданных билетов', fontsize=14, fontweight='bold')
-            plt.xlabel('Средняя цена билета ($)')
-            plt.ylabel('Общее количество проданных билетов')
-            plt.grid(True, alpha=0.3)
-            
-            # Добавляем подписи категорий
-            for i, row in df.iterrows():
-                plt.annotate(row['catname'], 
-                           (row['avg_ticket_price'], row['total_tickets_sold']),
-                           xytext=(5, 5), textcoords='offset points', fontsize=8)
-            
-            plt.tight_layout()
-            plt.savefig('charts/scatter_price_vs_quantity.png', dpi=300, bbox_inches='tight')
-            plt.show()
-            print("✅ Создана точечная диаграмма: charts/scatter_price_vs_quantity.png")
-
-    # 7. INTERACTIVE PLOTLY CHART WITH SLIDER
-    def create_interactive_slider_chart(self):
-        """Интерактивный график с временным слайдером"""
-        query = """
+    """,
+    "daily_category_sales": """
         SELECT 
             DATE(s.saletime) as sale_date,
             c.catgroup,
@@ -251,30 +83,430 @@ class AWSTickitAnalyzer:
         WHERE s.saletime >= '2008-01-01'
         GROUP BY sale_date, c.catgroup
         ORDER BY sale_date;
+    """
+}
+
+# Листы Excel-отчета: имя листа -> SQL
+EXCEL_QUERIES = {
+    "Sales_Summary": """
+        SELECT c.catgroup, c.catname,
+               COUNT(s.saleid) as total_sales,
+               SUM(s.qtysold) as total_tickets,
+               SUM(s.pricepaid) as total_revenue,
+               AVG(s.pricepaid) as avg_sale_amount
+        FROM sales s
+        JOIN events e ON s.eventid = e.eventid
+        JOIN category c ON e.catid = c.catid
+        GROUP BY c.catgroup, c.catname
+        ORDER BY total_revenue DESC;
+    """,
+    "User_Geography": """
+        SELECT city, state,
+               COUNT(*) as user_count,
+               COUNT(DISTINCT CASE WHEN likesports THEN userid END) as sports_fans,
+               COUNT(DISTINCT CASE WHEN likeconcerts THEN userid END) as concert_fans
+        FROM users
+        GROUP BY city, state
+        HAVING COUNT(*) > 10
+        ORDER BY user_count DESC;
+    """,
+    "Venue_Performance": """
+        SELECT v.venuename, v.venuecity, v.venuestate,
+               COUNT(DISTINCT e.eventid) as total_events,
+               SUM(s.pricepaid) as total_revenue,
+               AVG(s.pricepaid) as avg_revenue_per_event
+        FROM venue v
+        JOIN events e ON v.venueid = e.venueid
+        JOIN sales s ON e.eventid = s.eventid
+        GROUP BY v.venueid, v.venuename, v.venuecity, v.venuestate
+        ORDER BY total_revenue DESC;
+    """
+}
+
+# Команда CLI -> метод-график
+CHART_COMMANDS = {
+    'pie': 'create_pie_chart',
+    'bar': 'create_bar_chart',
+    'horizontal_bar': 'create_horizontal_bar_chart',
+    'line': 'create_line_chart',
+    'histogram': 'create_histogram',
+    'scatter': 'create_scatter_plot',
+    'slider': 'create_interactive_slider_chart',
+}
+
+class AWSTickitAnalyzer:
+    def __init__(self, query_cache=None, headless=False, render_cache=None, artifacts=None):
+        self._connection = None
+        self._pool = None
+        self.headless = headless
+        if headless:
+            # Без окон: графики могут рисоваться и не из главного потока (фоновые задачи Flask)
+            import matplotlib
+            matplotlib.use('Agg')
+        self._render_queue = None
+        self.facts = None
+        self.query_cache = query_cache
+        self._render_cache = render_cache
+        self.force_render = False
+        self._artifacts = artifacts
+        self.live_aggregator = None
+        self.rollup = None
+        self.preview = None
+        self.profile = []
+        self.last_profile_path = None
+        self.colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD']
+    
+    @property
+    def pool(self):
+        """Общий пул соединений (psycopg2 загружается при первом обращении)"""
+        if self._pool is None:
+            from db_pool import get_pool
+            self._pool = get_pool()
+        return self._pool
+
+    @property
+    def connection(self):
+        """Соединение анализатора; подключение откладывается до первого запроса"""
+        if self._connection is None:
+            self.connect()
+        return self._connection
+
+    @property
+    def render_cache(self):
+        if self._render_cache is None:
+            from render_cache import RenderCache
+            self._render_cache = RenderCache()
+        return self._render_cache
+
+    @property
+    def artifacts(self):
+        if self._artifacts is None:
+            from artifacts import ArtifactManifest
+            self._artifacts = ArtifactManifest()
+        return self._artifacts
+
+    def connect(self):
+        """Подключение к базе данных (соединение берётся из общего пула)"""
+        try:
+            self._connection = self.pool.getconn()
+            print("✅ Успешно подключились к базе данных AWS Tickit")
+        except Exception as e:
+            print(f"❌ Ошибка подключения: {e}")
+            raise
+    
+    def execute_query(self, query, description="", connection=None):
+        """Выполнение SQL-запроса (с кэшем результатов, если он подключён)"""
+        connection = connection or self.connection
+        with metrics.REGISTRY.span('query', description or 'query', self.profile) as span:
+            try:
+                cache_key = None
+                # versions is None: запрос читает таблицы без отпечатка версии — мимо кэша
+                versions = self.query_cache.table_versions(connection, query) if self.query_cache is not None else None
+                if versions is not None:
+                    cache_key = self.query_cache.make_key(query, versions)
+                    df = self.query_cache.get(cache_key)
+                    if df is not None:
+                        span.update(rows=len(df), frame_bytes=int(df.memory_usage(deep=True).sum()), cache='hit')
+                        if description:
+                            print(f"📊 {description}: {len(df)} строк (из кэша)")
+                        return df
+                import pandas as pd
+                df = pd.read_sql_query(query, connection)
+                span.update(rows=len(df), frame_bytes=int(df.memory_usage(deep=True).sum()))
+                if cache_key is not None:
+                    self.query_cache.put(cache_key, df)
+                if description:
+                    print(f"📊 {description}: {len(df)} строк")
+                return df
+            except Exception as e:
+                span['error'] = True
+                print(f"❌ Ошибка выполнения запроса: {e}")
+                return None
+
+    def execute_queries(self, queries, description="", max_workers=4):
+        """Параллельное выполнение набора именованных запросов на соединениях пула
+
+        queries — словарь имя -> SQL; возвращает словарь имя -> DataFrame
+        (None для запросов, завершившихся ошибкой) в исходном порядке.
         """
-        
-        df = self.execute_query(query, "Данные для интерактивного графика")
+        if not queries:
+            return {}
+
+        def run(item):
+            name, query = item
+            with self.pool.connection() as connection:
+                return name, self.execute_query(query, f"{description} {name}".strip(), connection=connection)
+
+        workers = max(1, min(len(queries), max_workers, self.pool.maxconn - 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(executor.map(run, queries.items()))
+        return {name: results[name] for name in queries}
+
+    def load_sales_facts(self):
+        """Однократная выгрузка денормализованной таблицы фактов продаж"""
+        import facts
+        df = self.execute_query(facts.FACT_QUERY, "Таблица фактов продаж")
+        if df is not None:
+            self.facts = facts.compact_facts(df)
+            memory_mb = self.facts.memory_usage(deep=True).sum() / 1024 ** 2
+            print(f"📦 Таблица фактов в памяти: {memory_mb:.1f} MB")
+        return self.facts
+
+    def enable_rollup(self):
+        """Обновление куба предагрегатов и маршрутизация в него подходящих запросов"""
+        from rollup import SalesRollup
+        try:
+            self.rollup = SalesRollup()
+            added = self.rollup.refresh(self.connection)
+            print(f"🧊 Куб продаж актуален до saleid {self.rollup.last_saleid} (+{added} строк)")
+        except Exception as e:
+            self.connection.rollback()
+            self.rollup = None
+            print(f"❌ Куб продаж недоступен, запросы идут в исходные таблицы: {e}")
+        return self.rollup
+
+    def enable_preview(self, sample_size=None, path=None):
+        """Режим предпросмотра: круговая, гистограмма, точечная и горизонтальная
+        диаграммы считаются по резервуарной выборке с 95%-ными интервалами
+
+        Выборка хранится в path и при повторном включении только дополняется
+        новыми строками sales и listing.
+        """
+        import sampling
+        sample_size = sample_size or sampling.DEFAULT_SAMPLE_SIZE
+        path = path or sampling.PREVIEW_PATH
+        try:
+            preview = sampling.PreviewSample.load(path) if os.path.exists(path) else None
+            if preview is None or preview.sales.size > sample_size:
+                preview = sampling.PreviewSample(sample_size)
+            with metrics.REGISTRY.span('preview', 'refresh', self.profile):
+                added = preview.refresh(self.connection)
+            preview.save(path)
+            self.preview = preview
+            print(f"🧭 Предпросмотр по выборке: {len(preview.sales.sample)} из {preview.sales.seen} продаж, "
+                  f"{len(preview.listing.sample)} из {preview.listing.seen} билетов (учтено новых строк: {added})")
+        except Exception as e:
+            self.connection.rollback()
+            self.preview = None
+            print(f"❌ Предпросмотр недоступен, используются точные запросы: {e}")
+        return self.preview
+
+    def disable_preview(self):
+        """Возврат к точным запросам"""
+        self.preview = None
+        print("✅ Предпросмотр выключен: графики строятся по точным запросам")
+
+    def verify_rollup(self):
+        """Сверка куба с запросами к исходным таблицам"""
+        from rollup import SalesRollup
+        rollup = self.rollup or SalesRollup()
+        checks = rollup.verify(self.connection, {**CHART_QUERIES, **EXCEL_QUERIES})
+        status = "✅" if all(checks.values()) else "❌"
+        print(f"{status} Сверка куба с исходными таблицами: {checks}")
+        return checks
+
+    def route_query(self, name, query):
+        """SQL набора данных name: запрос к кубу, если набор есть в списке куба, иначе исходный"""
+        if self.rollup is not None:
+            return self.rollup.route(name) or query
+        return query
+
+    def get_data(self, name, query, description=""):
+        """Набор данных по имени: оценка по выборке в режиме предпросмотра,
+        из таблицы фактов, если она загружена, иначе SQL-запросом"""
+        if self.preview is not None:
+            import sampling
+            if name in sampling.PREVIEW_AGGREGATES:
+                df = sampling.PREVIEW_AGGREGATES[name](self.preview)
+                if description:
+                    print(f"🧭 {description}: {len(df)} строк (оценка по выборке, 95% интервалы)")
+                return df
+        if self.facts is not None:
+            import facts
+            if name in facts.FACT_AGGREGATES:
+                df = facts.FACT_AGGREGATES[name](self.facts)
+                if description:
+                    print(f"📊 {description}: {len(df)} строк (из таблицы фактов)")
+                return df
+        routed = self.route_query(name, query)
+        if routed is not query and description:
+            description = f"{description} (куб)"
+        return self.execute_query(routed, description)
+
+    def show_figure(self, fig=None):
+        """Показ фигуры; в безоконном режиме фигура просто закрывается"""
+        import matplotlib.pyplot as plt
+        if self.headless:
+            plt.close(fig)
+        else:
+            plt.show()
+
+    def render_chart(self, name, df):
+        """Отрисовка графика сразу или постановка в очередь пакетной отрисовки
+
+        Если данные и параметры графика не изменились с прошлой отрисовки,
+        PNG остаётся прежним (см. force_render).
+        """
+        import charts
+        key = self.render_cache.key(name, df, self.colors)
+        if not self.force_render and self.render_cache.is_fresh(name, key):
+            print(f"♻️ {charts.CHARTS[name][1]}: данные не изменились, отрисовка пропущена")
+            return
+        if self._render_queue is not None:
+            self._render_queue.append((name, df))
+            return
+        charts.use_style()
+        with metrics.REGISTRY.span('render', name, self.profile) as span:
+            span['rows'] = len(df)
+            fig = charts.render(name, df, self.colors)
+        self.render_cache.record(name, key)
+        self.artifacts.register('chart', charts.CHARTS[name][1])
+        self.show_figure(fig)
+        print(f"✅ {charts.CHARTS[name][2]}: {charts.CHARTS[name][1]}")
+
+    def render_charts_parallel(self, chart_methods, max_workers=None):
+        """Безоконная отрисовка графиков в пуле процессов
+
+        Запросы выполняются последовательно в основном процессе, после чего
+        каждая фигура рисуется в отдельном воркере. Воркеры общего пула
+        запускаются заранее и импортируют библиотеки, пока идут запросы.
+        Окна на время пакета не открываются; режим headless восстанавливается
+        после него. Возвращает время по графикам.
+        """
+        import charts
+        charts.warm_worker_pool(min(max_workers or os.cpu_count() or 1, len(chart_methods)))
+        headless = self.headless
+        self.headless = True
+        self._render_queue = []
+        try:
+            for method in chart_methods:
+                method()
+            jobs = self._render_queue
+        finally:
+            self._render_queue = None
+            self.headless = headless
+        started = datetime.now()
+        timings = charts.render_batch(jobs, self.colors, max_workers=max_workers)
+        for name, df in jobs:
+            if name in timings:
+                self.render_cache.record(name, self.render_cache.key(name, df, self.colors))
+                self.artifacts.register('chart', charts.CHARTS[name][1])
+                # Отрисовка шла в воркерах — учитываем их замеры
+                metrics.REGISTRY.record({'kind': 'render', 'name': name, 'started': started.timestamp(),
+                                         'seconds': timings[name], 'rows': len(df), 'worker': True},
+                                        self.profile)
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"⏱️ Отрисовано графиков: {len(timings)} за {elapsed:.2f} с "
+              f"(сумма по воркерам {sum(timings.values()):.2f} с)")
+        return timings
+
+    # 1. PIE CHART - Распределение продаж по категориям событий
+    @metrics.traced('chart')
+    def create_pie_chart(self):
+        """Круговая диаграмма: распределение выручки по категориям"""
+        df = self.get_data('category_revenue', CHART_QUERIES['category_revenue'], "Распределение выручки по категориям")
         if df is not None and len(df) > 0:
-            df['sale_date'] = pd.to_datetime(df['sale_date'])
-            df['month_year'] = df['sale_date'].dt.to_period('M').astype(str)
-            
-            fig = px.scatter(df, 
-                           x="daily_sales", 
-                           y="avg_price",
-                           size="daily_tickets",
-                           color="catgroup",
-                           animation_frame="month_year",
-                           hover_name="catgroup",
-                           title="Интерактивная динамика продаж по категориям",
-                           labels={"daily_sales": "Ежедневные продажи", 
-                                 "avg_price": "Средняя цена ($)"})
+            self.render_chart('pie', df)
+
+    # 2. BAR CHART - Топ-10 городов по количеству пользователей
+    @metrics.traced('chart')
+    def create_bar_chart(self):
+        """Столбчатая диаграмма: топ городов по пользователям"""
+        df = self.get_data('top_cities', CHART_QUERIES['top_cities'], "Топ городов по пользователям")
+        if df is not None and len(df) > 0:
+            self.render_chart('bar', df)
+
+    # 3. HORIZONTAL BAR CHART - Средний чек по штатам
+    @metrics.traced('chart')
+    def create_horizontal_bar_chart(self):
+        """Горизонтальная столбчатая диаграмма: средний чек по штатам"""
+        df = self.get_data('state_avg_transaction', CHART_QUERIES['state_avg_transaction'], "Средний чек по штатам")
+        if df is not None and len(df) > 0:
+            self.render_chart('horizontal_bar', df)
+
+    # 4. LINE CHART - Динамика продаж по месяцам
+    @metrics.traced('chart')
+    def create_line_chart(self):
+        """Линейный график: динамика продаж по месяцам"""
+        df = self.get_data('monthly_sales', CHART_QUERIES['monthly_sales'], "Динамика продаж по месяцам")
+        if df is not None and len(df) > 0:
+            self.render_chart('line', df)
+
+    # 5. HISTOGRAM - Распределение цен на билеты
+    def price_histogram(self, bins=30):
+        """Интервалы цен билетов от $1 до $500 (bin_left, bin_right, count)
+
+        В режиме предпросмотра количества оцениваются по выборке listing
+        (с колонками count_low, count_high).
+        """
+        if self.preview is not None:
+            import sampling
+            return sampling.price_histogram(self.preview, bins=bins)
+        import binning
+        return binning.db_histogram(self.execute_query, 'listing', 'priceperticket',
+                                    where='priceperticket BETWEEN 1 AND 500', bins=bins)
+
+    @metrics.traced('chart')
+    def create_histogram(self, bins=30):
+        """Гистограмма: распределение цен на билеты
+
+        Интервалы считаются в базе — из listing приходят только границы
+        и количества, а не все значения priceperticket.
+        """
+        df = self.price_histogram(bins)
+        if df is not None:
+            print(f"📊 Распределение цен на билеты: {int(df['count'].sum())} билетов в {len(df)} интервалах")
+        if df is not None and df['count'].sum() > 0:
+            self.render_chart('histogram', df)
+
+    def verify_histogram(self, bins=30):
+        """Точная сверка гистограммы из базы с np.histogram по сырым ценам"""
+        import binning
+        raw = self.execute_query("""
+        SELECT priceperticket
+        FROM listing
+        WHERE priceperticket BETWEEN 1 AND 500;
+        """, "Сырые цены билетов для сверки")
+        binned = self.price_histogram(bins)
+        matches = raw is not None and binned is not None and binning.matches_pandas_histogram(raw['priceperticket'], binned)
+        print(f"{'✅' if matches else '❌'} Гистограмма из базы совпадает с pandas: {matches}")
+        return matches
+
+    # 6. SCATTER PLOT - Связь между ценой билета и количеством проданных билетов
+    @metrics.traced('chart')
+    def create_scatter_plot(self):
+        """Точечная диаграмма: цена vs количество проданных билетов"""
+        df = self.get_data('price_vs_quantity', CHART_QUERIES['price_vs_quantity'], "Цена vs количество проданных билетов")
+        if df is not None and len(df) > 0:
+            self.render_chart('scatter', df)
+
+    # 7. INTERACTIVE PLOTLY CHART WITH SLIDER
+    @metrics.traced('chart')
+    def create_interactive_slider_chart(self):
+        """Интерактивный график с временным слайдером
+
+        Дневные продажи прореживаются под бюджеты кадров и точек
+        (charts.slider_frames), HTML пишется с двоичными массивами.
+        """
+        import charts
+        df = self.get_data('daily_category_sales', CHART_QUERIES['daily_category_sales'], "Данные для интерактивного графика")
+        if df is not None and len(df) > 0:
+            fig = charts.slider_figure(df)
             
-            fig.show()
-            print("✅ Создан интерактивный график с временным слайдером")
+            if self.headless:
+                size = charts.write_slider_html(fig, 'charts/interactive_sales_slider.html')
+                print(f"✅ Создан интерактивный график: charts/interactive_sales_slider.html "
+                      f"({len(fig.frames)} кадров, {size / 1024:.0f} KB)")
+            else:
+                fig.show()
+                print("✅ Создан интерактивный график с временным слайдером")
 
     # 8. EXPORT TO EXCEL WITH FORMATTING
+    @metrics.traced('export')
     def export_to_excel(self, dataframes_dict, filename):
         """Экспорт данных в Excel с форматированием"""
+        import pandas as pd
+        import excel_export
         try:
             os.makedirs('exports', exist_ok=True)
             filepath = f'exports/{filename}'
@@ -283,34 +515,21 @@ class AWSTickitAnalyzer:
                 for sheet_name, df in dataframes_dict.items():
                     df.to_excel(writer, sheet_name=sheet_name, index=False)
                     
-                    # Получаем workbook и worksheet для форматирования
-                    workbook = writer.book
+                    # Получаем worksheet для форматирования
                     worksheet = writer.sheets[sheet_name]
                     
                     # Замораживаем первую строку
                     worksheet.freeze_panes = "A2"
                     
-                    # Добавляем фильтры
-                    worksheet.auto_filter.ref = worksheet.dimensions
-                    
-                    # Условное форматирование для числовых колонок
-                    numeric_columns = df.select_dtypes(include=['number']).columns
-                    for col_idx, col_name in enumerate(numeric_columns, 1):
-                        col_letter = chr(64 + col_idx)  # A, B, C, ...
-                        range_str = f"{col_letter}2:{col_letter}{len(df)+1}"
-                        
-                        # Градиентная заливка
-                        rule = ColorScaleRule(
-                            start_type="min", start_color="FFAA0000",
-                            mid_type="percentile", mid_value=50, mid_color="FFFFFF00",
-                            end_type="max", end_color="FF00AA00"
-                        )
-                        worksheet.conditional_formatting.add(range_str, rule)
+                    # Фильтры и градиентная заливка числовых колонок
+                    excel_export.apply_sheet_formatting(
+                        worksheet, excel_export.numeric_column_positions(df), len(df), len(df.columns))
             
             # Подсчет статистики
             total_sheets = len(dataframes_dict)
             total_rows = sum(len(df) for df in dataframes_dict.values())
             
+            self.artifacts.register('export', filepath)
             print(f"✅ Создан файл {filename}, {total_sheets} листов, {total_rows} строк")
             return True
             
@@ -318,140 +537,299 @@ class AWSTickitAnalyzer:
             print(f"❌ Ошибка при экспорте в Excel: {e}")
             return False
 
+    @metrics.traced('export')
+    def export_to_excel_streaming(self, queries, filename, chunk_size=50000):
+        """Потоковый экспорт в Excel: серверный курсор + write-only книга
+
+        Память не растёт с числом строк: данные читаются и пишутся порциями
+        по chunk_size строк, форматирование совпадает с export_to_excel.
+        """
+        import excel_export
+        try:
+            os.makedirs('exports', exist_ok=True)
+            filepath = f'exports/{filename}'
+            
+            with self.pool.connection() as connection:
+                routed = {name: self.route_query(name, query) for name, query in queries.items()}
+                row_counts = excel_export.stream_queries_to_excel(connection, routed, filepath, chunk_size)
+            self.artifacts.register('export', filepath)
+            
+            print(f"✅ Создан файл {filename}, {len(row_counts)} листов, "
+                  f"{sum(row_counts.values())} строк (потоковый экспорт)")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Ошибка при потоковом экспорте в Excel: {e}")
+            return False
+
     def prepare_data_for_excel_export(self):
         """Подготовка данных для экспорта в Excel"""
-        queries = {
-            "Sales_Summary": """
-                SELECT c.catgroup, c.catname,
-                       COUNT(s.saleid) as total_sales,
-                       SUM(s.qtysold) as total_tickets,
-                       SUM(s.pricepaid) as total_revenue,
-                       AVG(s.pricepaid) as avg_sale_amount
-                FROM sales s
-                JOIN events e ON s.eventid = e.eventid
-                JOIN category c ON e.catid = c.catid
-                GROUP BY c.catgroup, c.catname
-                ORDER BY total_revenue DESC;
-            """,
-            "User_Geography": """
-                SELECT city, state,
-                       COUNT(*) as user_count,
-                       COUNT(DISTINCT CASE WHEN likesports THEN userid END) as sports_fans,
-                       COUNT(DISTINCT CASE WHEN likeconcerts THEN userid END) as concert_fans
-                FROM users
-                GROUP BY city, state
-                HAVING COUNT(*) > 10
-                ORDER BY user_count DESC;
-            """,
-            "Venue_Performance": """
-                SELECT v.venuename, v.venuecity, v.venuestate,
-                       COUNT(DISTINCT e.eventid) as total_events,
-                       SUM(s.pricepaid) as total_revenue,
-                       AVG(s.pricepaid) as avg_revenue_per_event
-                FROM venue v
-                JOIN events e ON v.venueid = e.venueid
-                JOIN sales s ON e.eventid = s.eventid
-                GROUP BY v.venueid, v.venuename, v.venuecity, v.venuestate
-                ORDER BY total_revenue DESC;
-            """
-        }
+        import facts
+        
+        queries = EXCEL_QUERIES
+        # Листы, которые нельзя посчитать из таблицы фактов, запрашиваются параллельно
+        pending = {name: self.route_query(name, query) for name, query in queries.items()
+                   if self.facts is None or name not in facts.FACT_AGGREGATES}
+        results = self.execute_queries(pending, "Подготовка данных для")
         
         dataframes = {}
         for sheet_name, query in queries.items():
-            df = self.execute_query(query, f"Подготовка данных для {sheet_name}")
+            if sheet_name in results:
+                df = results[sheet_name]
+            else:
+                df = self.get_data(sheet_name, query, f"Подготовка данных для {sheet_name}")
             if df is not None:
                 dataframes[sheet_name] = df
         
         return dataframes
 
-    def demonstrate_live_data_update(self):
-        """Демонстрация обновления графика при добавлении новых данных"""
+    def refresh_live_aggregates(self):
+        """Учёт новых продаж в инкрементальных агрегатах; возвращает число строк"""
+        return self.live_aggregator.refresh(self.connection)
+
+    def demonstrate_live_data_update(self, verify=False):
+        """Демонстрация обновления графика при добавлении новых данных
+
+        Агрегаты ведутся инкрементально: обновление читает только продажи
+        после последнего обработанного saleid. verify=True сверяет результат
+        с полным пересчётом в БД.
+        """
         print("\n🎯 ДЕМОНСТРАЦИЯ: Обновление графика при добавлении данных")
         
+        from incremental import IncrementalAggregator
         # Получаем текущие данные
-        query_before = """
-        SELECT c.catgroup, SUM(s.pricepaid) as revenue
-        FROM sales s
-        JOIN events e ON s.eventid = e.eventid
-        JOIN category c ON e.catid = c.catid
-        GROUP BY c.catgroup
-        ORDER BY revenue DESC;
-        """
-        
-        df_before = self.execute_query(query_before, "Данные ДО обновления")
+        df_before = None
+        try:
+            if self.live_aggregator is None:
+                self.live_aggregator = IncrementalAggregator()
+                if self.facts is not None:
+                    loaded = self.live_aggregator.seed_from_facts(self.facts)
+                else:
+                    loaded = self.refresh_live_aggregates()
+                print(f"📊 Начальное состояние агрегатов: {loaded} продаж")
+            df_before = self.live_aggregator.category_revenue()
+        except Exception as e:
+            print(f"❌ Ошибка инкрементальной агрегации: {e}")
         
         # Создаем график ДО обновления
         if df_before is not None:
-            plt.figure(figsize=(10, 6))
-            plt.bar(df_before['catgroup'], df_before['revenue'], color='lightblue')
-            plt.title('Выручка по категориям (ДО обновления)', fontweight='bold')
-            plt.ylabel('Выручка ($)')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plt.savefig('charts/before_update.png', dpi=300, bbox_inches='tight')
-            plt.show()
+            self.render_chart('before_update', df_before)
         
         # Имитируем добавление новых данных (в реальном сценарии это была бы вставка в БД)
         print("📥 Имитация добавления новых данных продаж...")
         
-        # Получаем обновленные данные (можем использовать тот же запрос)
-        df_after = self.execute_query(query_before, "Данные ПОСЛЕ обновления")
+        # Получаем обновленные данные: читаются только новые строки sales
+        df_after = None
+        if self.live_aggregator is not None:
+            try:
+                watermark = self.live_aggregator.last_saleid
+                new_rows = self.refresh_live_aggregates()
+                print(f"📊 Новых продаж после saleid {watermark}: {new_rows}")
+                df_after = self.live_aggregator.category_revenue()
+                if verify:
+                    checks = self.live_aggregator.verify(self.connection)
+                    status = "✅" if all(checks.values()) else "❌"
+                    print(f"{status} Сверка с полным пересчётом: {checks}")
+            except Exception as e:
+                print(f"❌ Ошибка инкрементальной агрегации: {e}")
         
         # Создаем график ПОСЛЕ обновления
         if df_after is not None:
-            plt.figure(figsize=(10, 6))
-            plt.bar(df_after['catgroup'], df_after['revenue'], color='lightgreen')
-            plt.title('Выручка по категориям (ПОСЛЕ обновления)', fontweight='bold')
-            plt.ylabel('Выручка ($)')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            plt.savefig('charts/after_update.png', dpi=300, bbox_inches='tight')
-            plt.show()
-            
+            self.render_chart('after_update', df_after)
             print("✅ Графики обновлены! Проверьте папку charts/ для сравнения")
 
-    def run_complete_analysis(self):
-        """Запуск полного анализа"""
+    def run_complete_analysis(self, use_facts=False, parallel_render=False, max_workers=None,
+                              progress=None, streaming_export=False, force_render=False, use_rollup=False,
+                              preview=False):
+        """Запуск полного анализа
+
+        use_facts=True — таблица фактов продаж выгружается один раз,
+        и все графики/листы по продажам считаются из неё в pandas.
+        parallel_render=True — статические графики рисуются без окна
+        в пуле из max_workers процессов.
+        progress — необязательный callback(выполнено, всего, сообщение).
+        streaming_export=True — Excel-отчет пишется потоково, без DataFrame в памяти.
+        force_render=True — все графики перерисовываются, даже если данные не изменились.
+        use_rollup=True — куб предагрегатов обновляется, и покрываемые им
+        графики/листы читают его вместо сырых sales.
+        preview=True — круговая, гистограмма, точечная и горизонтальная
+        диаграммы строятся по выборке (приближённо, с интервалами).
+        """
         print("🚀 ЗАПУСК ПОЛНОГО АНАЛИЗА AWS TICKIT")
         print("=" * 50)
         
+        self.profile = []
+        self.force_render = force_render
+        chart_methods = [
+            self.create_pie_chart,
+            self.create_bar_chart,
+            self.create_horizontal_bar_chart,
+            self.create_line_chart,
+            self.create_histogram,
+            self.create_scatter_plot,
+        ]
+        total_steps = len(chart_methods) + 4
+        done_steps = 0
+
+        def step(message, count=1):
+            nonlocal done_steps
+            done_steps += count
+            if progress is not None:
+                progress(done_steps, total_steps, message)
+        
+        if use_rollup:
+            self.enable_rollup()
+        if preview:
+            self.enable_preview()
+        elif self.preview is not None:
+            self.disable_preview()
+        if use_facts:
+            self.load_sales_facts()
+        step("Таблица фактов загружена" if use_facts else "Подготовка")
+        
         # Создаем графики
-        self.create_pie_chart()
-        self.create_bar_chart()
-        self.create_horizontal_bar_chart()
-        self.create_line_chart()
-        self.create_histogram()
-        self.create_scatter_plot()
+        if parallel_render:
+            self.render_charts_parallel(chart_methods, max_workers=max_workers)
+            step("Статические графики", count=len(chart_methods))
+        else:
+            for method in chart_methods:
+                method()
+                step(method.__name__)
         
         # Интерактивный график
         self.create_interactive_slider_chart()
+        step("Интерактивный график")
         
         # Экспорт в Excel
-        excel_data = self.prepare_data_for_excel_export()
-        self.export_to_excel(excel_data, "aws_tickit_analysis.xlsx")
+        if streaming_export:
+            self.export_to_excel_streaming(EXCEL_QUERIES, "aws_tickit_analysis.xlsx")
+        else:
+            excel_data = self.prepare_data_for_excel_export()
+            self.export_to_excel(excel_data, "aws_tickit_analysis.xlsx")
+        step("Экспорт в Excel")
         
         # Демонстрация обновления данных
         self.demonstrate_live_data_update()
+        step("Обновление данных")
         
+        if self.query_cache is not None:
+            print(f"🗄️ Кэш запросов: {self.query_cache.summary()}")
+        print(f"🖼️ Графики: перерисовано {self.render_cache.stats['rendered']}, "
+              f"без изменений {self.render_cache.stats['skipped']}")
+
+        self.last_profile_path = metrics.write_profile(self.profile)
+        print(f"⏱️ Профиль запуска: {self.last_profile_path}")
+
         print("\n🎉 АНАЛИЗ ЗАВЕРШЕН!")
         print("📁 Результаты сохранены в папках: charts/, exports/")
 
+    def run_charts(self, names, parallel_render=False, max_workers=None, force_render=False, preview=False):
+        """Отрисовка только выбранных графиков (имена из CHART_COMMANDS)
+
+        parallel_render=True — статические графики рисуются без окна в пуле
+        из max_workers процессов; интерактивный график строится отдельно.
+        """
+        self.profile = []
+        self.force_render = force_render
+        if preview:
+            self.enable_preview()
+        static = [getattr(self, CHART_COMMANDS[name]) for name in names if name != 'slider']
+        if parallel_render and static:
+            self.render_charts_parallel(static, max_workers=max_workers)
+        else:
+            for method in static:
+                method()
+        if 'slider' in names:
+            self.create_interactive_slider_chart()
+
+        self.last_profile_path = metrics.write_profile(self.profile)
+        print(f"⏱️ Профиль запуска: {self.last_profile_path}")
+
     def close(self):
-        """Закрытие соединения"""
-        if self.connection:
-            self.connection.close()
-            print("✅ Соединение с базой данных закрыто")
+        """Возврат соединения в пул"""
+        if self._connection:
+            self.pool.putconn(self._connection)
+            self._connection = None
+            print("✅ Соединение с базой данных возвращено в пул")
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Анализ AWS Tickit: графики и Excel-отчет")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def common(sub):
+        sub.add_argument('--facts', action='store_true', help="считать из таблицы фактов в pandas")
+        sub.add_argument('--rollup', action='store_true', help="читать покрытые наборы данных из куба")
+        sub.add_argument('--headless', action='store_true', help="без окон: графики только в файлы")
+
+    full = subparsers.add_parser('all', help="полный анализ (по умолчанию)")
+    common(full)
+    full.add_argument('--parallel', action='store_true', help="статические графики в пуле процессов")
+    full.add_argument('--workers', type=int)
+    full.add_argument('--streaming-export', action='store_true')
+    full.add_argument('--preview', action='store_true', help="приближённые графики по выборке")
+    full.add_argument('--force', action='store_true', help="перерисовать все графики")
+
+    chart = subparsers.add_parser('charts', help="только выбранные графики")
+    common(chart)
+    chart.add_argument('names', nargs='*', metavar='ГРАФИК',
+                       help=f"графики ({', '.join(CHART_COMMANDS)}); по умолчанию все")
+    chart.add_argument('--parallel', action='store_true', help="статические графики в пуле процессов")
+    chart.add_argument('--workers', type=int)
+    chart.add_argument('--preview', action='store_true', help="приближённые графики по выборке")
+    chart.add_argument('--force', action='store_true', help="перерисовать графики")
+
+    export = subparsers.add_parser('export', help="только Excel-отчет")
+    common(export)
+    export.add_argument('--streaming', action='store_true', help="потоковый экспорт без DataFrame")
+
+    subparsers.add_parser('list', help="доступные графики и листы отчета")
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        # Без подкоманды — полный анализ с параметрами по умолчанию, как раньше
+        args = parser.parse_args(['all'])
+    command = args.command
+    if command == 'charts':
+        unknown = [name for name in args.names if name not in CHART_COMMANDS]
+        if unknown:
+            parser.error(f"неизвестные графики: {', '.join(unknown)} (доступны: {', '.join(CHART_COMMANDS)})")
+    if command == 'list':
+        print("📊 Графики: " + ", ".join(CHART_COMMANDS))
+        print("📁 Листы Excel: " + ", ".join(EXCEL_QUERIES))
+        return
 
-def main():
     analyzer = None
     try:
-        analyzer = AWSTickitAnalyzer()
-        analyzer.run_complete_analysis()
+        analyzer = AWSTickitAnalyzer(headless=getattr(args, 'headless', False))
+        if command == 'all':
+            analyzer.run_complete_analysis(use_facts=args.facts, parallel_render=args.parallel,
+                                           max_workers=args.workers, streaming_export=args.streaming_export,
+                                           force_render=args.force, use_rollup=args.rollup,
+                                           preview=args.preview)
+            return
+        if args.rollup:
+            analyzer.enable_rollup()
+        if args.facts:
+            analyzer.load_sales_facts()
+        if command == 'charts':
+            analyzer.run_charts(args.names or list(CHART_COMMANDS), parallel_render=args.parallel,
+                                max_workers=args.workers, force_render=args.force, preview=args.preview)
+        elif args.streaming:
+            analyzer.export_to_excel_streaming(EXCEL_QUERIES, "aws_tickit_analysis.xlsx")
+        else:
+            analyzer.export_to_excel(analyzer.prepare_data_for_excel_export(), "aws_tickit_analysis.xlsx")
     except Exception as e:
         print(f"❌ Произошла ошибка: {e}")
     finally:
         if analyzer:
             analyzer.close()
+        # Пул мог так и не понадобиться — тогда psycopg2 не загружается ради закрытия
+        if analyzer is not None and analyzer._pool is not None:
+            from db_pool import close_pool
+            close_pool()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,207 @@
+"""Трассировка стадий анализа и метрики в формате Prometheus.
+
+Каждый замер (span) — это стадия определённого вида (query, chart, render,
+export) с именем, длительностью, числом строк, размером результата в памяти
+(DataFrame) и пиковой памятью процесса за время стадии. Замеры агрегируются
+в общем реестре процесса (для /metrics) и складываются в профиль конкретного
+запуска (JSON).
+
+Объём данных, переданных по сети, не измеряется: psycopg2 не отдаёт
+счётчики байтов соединения, поэтому frame_bytes — это размер полученного
+DataFrame в памяти (DataFrame.memory_usage(deep=True)), а не трафик.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Период опроса RSS, пока открыт хотя бы один замер
+RSS_SAMPLE_INTERVAL = 0.01
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def peak_rss_bytes():
+    """Пиковый RSS процесса в байтах (None, если платформа не поддерживает)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """Текущий RSS процесса в байтах (None вне Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """Потокобезопасный реестр замеров стадий"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        # Незавершённые замеры -> наибольший RSS, замеченный за время замера
+        self._open_peaks = {}
+        self._sampler = None
+
+    def record(self, span, profile=None):
+        """Учёт завершённого замера в агрегатах и (необязательно) в профиле запуска"""
+        with self._lock:
+            stats = self._stats.setdefault((span['kind'], span['name']), {
+                'count': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'rows': 0, 'frame_bytes': 0,
+            })
+            stats['count'] += 1
+            stats['errors'] += 1 if span.get('error') else 0
+            stats['seconds'] += span['seconds']
+            stats['max_seconds'] = max(stats['max_seconds'], span['seconds'])
+            stats['rows'] += span.get('rows') or 0
+            stats['frame_bytes'] += span.get('frame_bytes') or 0
+        if profile is not None:
+            profile.append(span)
+
+    def _memory_start(self, token):
+        """Начало учёта памяти замера; опрос RSS идёт в общем фоновом потоке"""
+        rss = current_rss_bytes()
+        if rss is None:
+            return
+        with self._lock:
+            self._open_peaks[token] = rss
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_rss, name='tickit-rss-sampler', daemon=True)
+                self._sampler.start()
+
+    def _sample_rss(self):
+        """Опрос RSS раз в RSS_SAMPLE_INTERVAL, пока есть открытые замеры"""
+        while True:
+            time.sleep(RSS_SAMPLE_INTERVAL)
+            rss = current_rss_bytes() or 0
+            with self._lock:
+                if not self._open_peaks:
+                    self._sampler = None
+                    return
+                for token, peak in self._open_peaks.items():
+                    if rss > peak:
+                        self._open_peaks[token] = rss
+
+    def _memory_finish(self, token):
+        """Пиковый RSS процесса за время замера (None, если платформа не поддерживает)"""
+        rss = current_rss_bytes() or 0
+        with self._lock:
+            peak = self._open_peaks.pop(token, None)
+        return None if peak is None else max(peak, rss)
+
+    @contextmanager
+    def span(self, kind, name, profile=None):
+        """with REGISTRY.span('query', 'имя', profile) as span: span['rows'] = ...
+
+        peak_rss_bytes — наибольший RSS процесса за время стадии (по опросу
+        раз в RSS_SAMPLE_INTERVAL, а также на её старте и завершении). RSS
+        общий для процесса, поэтому стадии, идущие параллельно в других
+        потоках, видят одну и ту же память.
+        """
+        span = {'kind': kind, 'name': name, 'started': time.time()}
+        token = object()
+        self._memory_start(token)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception:
+            span['error'] = True
+            raise
+        finally:
+            span['seconds'] = time.perf_counter() - started
+            span['peak_rss_bytes'] = self._memory_finish(token)
+            self.record(span, profile)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(value) for key, value in self._stats.items()}
+
+    def prometheus_text(self):
+        """Агрегаты замеров в текстовом формате Prometheus"""
+        stats = self.snapshot()
+        lines = [
+            "# HELP tickit_stage_duration_seconds Длительность стадий анализа",
+            "# TYPE tickit_stage_duration_seconds summary",
+        ]
+        for (kind, name), value in sorted(stats.items()):
+            labels = _labels(kind=kind, name=name)
+            lines.append(f"tickit_stage_duration_seconds_count{labels} {value['count']}")
+            lines.append(f"tickit_stage_duration_seconds_sum{labels} {value['seconds']:.6f}")
+        for metric, field, help_text in (
+            ('tickit_stage_duration_max_seconds', 'max_seconds', "Максимальная длительность стадии"),
+            ('tickit_stage_errors_total', 'errors', "Число стадий, завершившихся ошибкой"),
+            ('tickit_stage_rows_total', 'rows', "Строк получено/обработано стадией"),
+            ('tickit_stage_frame_bytes_total', 'frame_bytes', "Размер результатов стадии (DataFrame) в памяти, байт"),
+        ):
+            metric_type = 'gauge' if field == 'max_seconds' else 'counter'
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            for (kind, name), value in sorted(stats.items()):
+                lines.append(f"{metric}{_labels(kind=kind, name=name)} {value[field]}")
+        peak = peak_rss_bytes()
+        if peak is not None:
+            lines.append("# HELP tickit_process_peak_rss_bytes Пиковая память процесса")
+            lines.append("# TYPE tickit_process_peak_rss_bytes gauge")
+            lines.append(f"tickit_process_peak_rss_bytes {peak}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def traced(kind):
+    """Декоратор метода анализатора: замер в REGISTRY и в self.profile"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with REGISTRY.span(kind, method.__name__, getattr(self, 'profile', None)):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summarize_profile(spans):
+    """Итоги профиля: время, строки и размер результатов по видам стадий"""
+    totals = {}
+    for span in spans:
+        total = totals.setdefault(span['kind'], {'count': 0, 'seconds': 0.0, 'rows': 0, 'frame_bytes': 0})
+        total['count'] += 1
+        total['seconds'] += span['seconds']
+        total['rows'] += span.get('rows') or 0
+        total['frame_bytes'] += span.get('frame_bytes') or 0
+    return totals
+
+
+def write_profile(spans, profile_dir='profiles'):
+    """Сохранение профиля запуска в JSON; возвращает путь к файлу"""
+    os.makedirs(profile_dir, exist_ok=True)
+    path = os.path.join(profile_dir, f"run_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'totals': summarize_profile(spans),
+            'spans': spans,
+        }, f, ensure_ascii=False, indent=2)
+    return path
@@ -0,0 +1,341 @@
+"""Параметризованные запросы к агрегатам AWS Tickit для JSON API.
+
+Каждый набор данных собирается из фиксированных фрагментов SQL: в текст
+запроса попадают только условия для переданных фильтров, а значения идут
+параметрами. Запрос выполняется как серверный prepared statement
+(PREPARE/EXECUTE) на соединении пула, поэтому разбор и планирование
+повторяются один раз на соединение и набор фильтров, а не на каждый запрос.
+Недавние ответы хранятся в памяти (LRU с временем жизни).
+
+    python query_api.py indexes
+    python query_api.py run state_avg_transaction --param date_from=2008-06-01 --param catgroup=Shows
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import psycopg2
+from psycopg2 import errors
+
+import metrics
+
+# Соединения с таблицами по псевдонимам; порядок важен (c и v требуют e)
+JOINS = OrderedDict([
+    ('e', "JOIN events e ON s.eventid = e.eventid"),
+    ('c', "JOIN category c ON e.catid = c.catid"),
+    ('u', "JOIN users u ON s.buyerid = u.userid"),
+    ('v', "JOIN venue v ON e.venueid = v.venueid"),
+])
+JOIN_DEPENDENCIES = {'c': {'e'}, 'v': {'e'}}
+
+# Фильтр -> (тип параметра, условие, нужные соединения)
+FILTERS = {
+    'date_from': ('date', "s.saletime >= {}", set()),
+    # Граница включительно: все продажи дня date_to
+    'date_to': ('date', "s.saletime < {} + 1", set()),
+    'catgroup': ('varchar', "c.catgroup = {}", {'c'}),
+    'catname': ('varchar', "c.catname = {}", {'c'}),
+    'state': ('char(2)', "u.state = {}", {'u'}),
+    'venuestate': ('char(2)', "v.venuestate = {}", {'v'}),
+    'venueid': ('integer', "e.venueid = {}", {'e'}),
+}
+
+# Набор данных -> части запроса. Параметры (HAVING/LIMIT) задаются так же,
+# как фильтры, но всегда присутствуют и имеют значение по умолчанию.
+DATASETS = {
+    'category_revenue': {
+        'description': "Выручка по группам категорий (тыс. $)",
+        'select': "c.catgroup, ROUND(SUM(s.pricepaid) / 1000, 2) AS revenue_k",
+        'joins': {'c'},
+        'group_by': "c.catgroup",
+        'order_by': "revenue_k DESC",
+    },
+    'monthly_sales': {
+        'description': "Продажи и выручка по месяцам",
+        'select': ("EXTRACT(YEAR FROM s.saletime) AS year, EXTRACT(MONTH FROM s.saletime) AS month, "
+                   "COUNT(s.saleid) AS total_sales, SUM(s.pricepaid) AS total_revenue"),
+        'joins': {'v'},
+        'group_by': "year, month",
+        'order_by': "year, month",
+    },
+    'state_avg_transaction': {
+        'description': "Средний чек по штатам покупателей",
+        'select': "u.state, AVG(s.pricepaid) AS avg_transaction, COUNT(s.saleid) AS total_sales",
+        'joins': {'u'},
+        'group_by': "u.state",
+        'having': ('min_sales', "COUNT(s.saleid) > {}"),
+        'order_by': "avg_transaction DESC",
+        'limit': 'limit',
+        'params': {'min_sales': 100, 'limit': 15},
+    },
+    'venue_performance': {
+        'description': "Выручка и число событий по площадкам",
+        'select': ("v.venuename, v.venuecity, v.venuestate, COUNT(DISTINCT e.eventid) AS total_events, "
+                   "SUM(s.pricepaid) AS total_revenue, AVG(s.pricepaid) AS avg_revenue_per_event"),
+        'joins': {'v'},
+        'group_by': "v.venueid, v.venuename, v.venuecity, v.venuestate",
+        'order_by': "total_revenue DESC",
+        'limit': 'limit',
+        'params': {'limit': 100},
+    },
+}
+# Типы параметров наборов данных
+PARAM_TYPES = {'min_sales': 'integer', 'limit': 'integer'}
+MAX_LIMIT = 10000
+
+# Индексы под фильтры API (eventid и buyerid уже проиндексированы в схеме)
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS sales_saletime_idx ON sales (saletime)",
+    "CREATE INDEX IF NOT EXISTS events_catid_idx ON events (catid)",
+    "CREATE INDEX IF NOT EXISTS events_venueid_idx ON events (venueid)",
+]
+
+
+def parse_value(kind, raw):
+    """Значение параметра из строки запроса; ValueError при неверном формате"""
+    if kind == 'date':
+        return date.fromisoformat(raw)
+    if kind == 'integer':
+        value = int(raw)
+        if value < 0:
+            raise ValueError("значение должно быть неотрицательным")
+        return value
+    value = raw.strip()
+    if not value or len(value) > 64:
+        raise ValueError("пустое или слишком длинное значение")
+    return value.upper() if kind == 'char(2)' else value
+
+
+def parse_params(name, args):
+    """Проверка параметров набора данных name: словарь имя -> значение
+
+    Неизвестный набор данных — KeyError, неизвестный или неверный параметр — ValueError.
+    """
+    dataset = DATASETS[name]
+    defaults = dataset.get('params', {})
+    params = dict(defaults)
+    for key, raw in args.items():
+        if key in FILTERS:
+            kind = FILTERS[key][0]
+        elif key in defaults:
+            kind = PARAM_TYPES[key]
+        else:
+            raise ValueError(f"неизвестный параметр {key} для {name}")
+        try:
+            params[key] = parse_value(kind, raw)
+        except ValueError as e:
+            raise ValueError(f"{key}: {e}") from None
+    if 'limit' in params:
+        params['limit'] = min(params['limit'], MAX_LIMIT)
+    return params
+
+
+def build_statement(name, params):
+    """SQL с позиционными параметрами $n, типы и значения параметров"""
+    dataset = DATASETS[name]
+    types, values, conditions = [], [], []
+
+    def bind(kind, value):
+        types.append(kind)
+        values.append(value)
+        return f"${len(values)}::{kind}"
+
+    joins = set(dataset['joins'])
+    for key in FILTERS:
+        if key in params:
+            kind, condition, needed = FILTERS[key]
+            conditions.append(condition.format(bind(kind, params[key])))
+            joins |= needed
+    for alias in list(joins):
+        joins |= JOIN_DEPENDENCIES.get(alias, set())
+
+    sql = f"SELECT {dataset['select']} FROM sales s"
+    sql += ''.join(f" {JOINS[alias]}" for alias in JOINS if alias in joins)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" GROUP BY {dataset['group_by']}"
+    if 'having' in dataset:
+        key, condition = dataset['having']
+        sql += " HAVING " + condition.format(bind(PARAM_TYPES[key], params[key]))
+    sql += f" ORDER BY {dataset['order_by']}"
+    if 'limit' in dataset:
+        sql += f" LIMIT {bind(PARAM_TYPES['limit'], params[dataset['limit']])}"
+    return sql, types, values
+
+
+def json_value(value):
+    """Значение строки результата в JSON-совместимом виде"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+class ResponseCache:
+    """LRU-кэш ответов API в памяти с ограничением времени жизни"""
+
+    def __init__(self, max_entries=256, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key, payload):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def summary(self):
+        with self._lock:
+            return {**self.stats, 'entries': len(self._entries)}
+
+
+class QueryAPI:
+    """Выполнение наборов данных как prepared statements на соединениях пула"""
+
+    def __init__(self, pool=None, cache=None):
+        self._pool = pool
+        self.cache = cache if cache is not None else ResponseCache()
+        # PID серверного процесса -> имена подготовленных на нём запросов
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            from db_pool import get_pool
+            self._pool = get_pool()
+        return self._pool
+
+    def _execute(self, connection, sql, types, values):
+        """EXECUTE подготовленного запроса (PREPARE при первом использовании на соединении)"""
+        statement = f"api_{hashlib.sha1(sql.encode('utf-8')).hexdigest()[:16]}"
+        backend = connection.get_backend_pid()
+        execute_sql = f"EXECUTE {statement}" + (f" ({', '.join(['%s'] * len(values))})" if values else "")
+        with self._lock:
+            prepared = statement in self._prepared.setdefault(backend, set())
+        for attempt in range(2):
+            try:
+                with connection.cursor() as cursor:
+                    if not prepared:
+                        cursor.execute(f"PREPARE {statement} ({', '.join(types)}) AS {sql}" if types
+                                       else f"PREPARE {statement} AS {sql}")
+                        with self._lock:
+                            self._prepared[backend].add(statement)
+                    cursor.execute(execute_sql, values)
+                    columns = [column.name for column in cursor.description]
+                    rows = cursor.fetchall()
+                connection.rollback()
+                return columns, rows
+            except errors.InvalidSqlStatementName:
+                # Соединение было пересоздано с тем же PID — готовим запрос заново
+                connection.rollback()
+                with self._lock:
+                    self._prepared[backend].discard(statement)
+                prepared = False
+            except errors.DuplicatePreparedStatement:
+                connection.rollback()
+                prepared = True
+            except psycopg2.Error:
+                connection.rollback()
+                raise
+        raise psycopg2.OperationalError(f"Не удалось выполнить подготовленный запрос {statement}")
+
+    def run(self, name, args):
+        """Ответ API для набора данных name с параметрами из строки запроса args"""
+        params = parse_params(name, args)
+        key = json.dumps([name, params], sort_keys=True, default=str)
+        payload = self.cache.get(key)
+        if payload is not None:
+            return {**payload, 'cached': True}
+        sql, types, values = build_statement(name, params)
+        with metrics.REGISTRY.span('api', name) as span:
+            with self.pool.connection() as connection:
+                columns, rows = self._execute(connection, sql, types, values)
+            span['rows'] = len(rows)
+        payload = {
+            'dataset': name,
+            'params': {key: json_value(value) for key, value in params.items()},
+            'columns': columns,
+            'rows': [[json_value(value) for value in row] for row in rows],
+            'row_count': len(rows),
+            'seconds': round(span['seconds'], 4),
+        }
+        self.cache.put(key, payload)
+        return {**payload, 'cached': False}
+
+    def describe(self):
+        """Наборы данных и допустимые параметры"""
+        return {
+            name: {
+                'description': dataset['description'],
+                'filters': sorted(FILTERS),
+                'params': dataset.get('params', {}),
+            }
+            for name, dataset in DATASETS.items()
+        }
+
+
+def ensure_indexes(connection):
+    """Индексы под фильтры API (создаются один раз)"""
+    with connection.cursor() as cursor:
+        for statement in INDEXES:
+            cursor.execute(statement)
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параметризованные запросы к агрегатам AWS Tickit")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('indexes', help="создать индексы под фильтры API")
+    run = subparsers.add_parser('run', help="выполнить набор данных с фильтрами")
+    run.add_argument('dataset', choices=sorted(DATASETS))
+    run.add_argument('--param', action='append', default=[], metavar='ИМЯ=ЗНАЧЕНИЕ')
+    args = parser.parse_args()
+
+    from db_pool import get_pool, close_pool
+    try:
+        if args.command == 'indexes':
+            with get_pool().connection() as connection:
+                ensure_indexes(connection)
+            print(f"✅ Индексы для API созданы: {len(INDEXES)}")
+        else:
+            api = QueryAPI()
+            params = dict(item.split('=', 1) for item in args.param)
+            result = api.run(args.dataset, params)
+            print(f"📊 {args.dataset}: {result['row_count']} строк за {result['seconds']} с")
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
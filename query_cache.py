@@ -0,0 +1,241 @@
+"""Дисковый кэш результатов SQL-запросов с инвалидацией по версии данных.
+
+Ключ кэша — нормализованный текст запроса плюс «отпечаток» каждой таблицы,
+на которую он ссылается (число строк и максимальный первичный ключ).
+Пока таблицы не менялись, повторный запуск анализа читает результаты с диска.
+Запросы к таблицам без отпечатка (новые таблицы, CTE, функции) не кэшируются:
+их результат нельзя инвалидировать.
+
+Индекс кэша общий для всех процессов: записи добавляются и вытесняются под
+файловой блокировкой, а счётчики попаданий и время последнего обращения
+копятся в памяти и сбрасываются в индекс пачкой (не чаще раза в
+STATS_FLUSH_INTERVAL секунд, при записи и при выходе).
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from file_locks import file_lock, file_version, read_json, write_json
+
+STATS_FLUSH_INTERVAL = 5.0
+
+# Дешёвый отпечаток версии данных для каждой таблицы схемы Tickit
+TABLE_VERSION_QUERIES = {
+    'sales': "SELECT COUNT(*), MAX(saleid) FROM sales",
+    'listing': "SELECT COUNT(*), MAX(listid) FROM listing",
+    'events': "SELECT COUNT(*), MAX(eventid) FROM events",
+    'users': "SELECT COUNT(*), MAX(userid) FROM users",
+    'venue': "SELECT COUNT(*), MAX(venueid) FROM venue",
+    'category': "SELECT COUNT(*), MAX(catid) FROM category",
+    'date': "SELECT COUNT(*), MAX(dateid) FROM date",
+    # Куб предагрегатов (rollup.py) меняется при refresh/rebuild: число его строк
+    # растёт при дописывании и сокращается при уплотнении, водяной знак — при новых продажах
+    'sales_rollup': "SELECT (SELECT COUNT(*) FROM sales_rollup), MAX(last_saleid) FROM sales_rollup_state",
+}
+
+_COMMENT_RE = re.compile(r'--[^\n]*')
+# Имя таблицы после FROM/JOIN, в том числе с префиксом схемы (public.sales) и в кавычках
+_TABLE_RE = re.compile(r'\b(?:from|join)\s+(?:"?[a-z_][a-z0-9_]*"?\s*\.\s*)?"?([a-z_][a-z0-9_]*)"?', re.IGNORECASE)
+# FROM, который не вводит таблицу: EXTRACT(YEAR FROM saletime), IS DISTINCT FROM
+_NOT_TABLE_RE = re.compile(r'\b(?:extract\s*\(\s*\w+|distinct)\s+from\b', re.IGNORECASE)
+
+
+def normalize_sql(query):
+    """Нормализация SQL: без комментариев, лишних пробелов и завершающей ';'"""
+    query = _COMMENT_RE.sub(' ', query)
+    query = ' '.join(query.split())
+    return query.rstrip(';').strip()
+
+
+def query_tables(query):
+    """Все имена таблиц из FROM/JOIN запроса (без схемы, в нижнем регистре)"""
+    query = _NOT_TABLE_RE.sub(' ', _COMMENT_RE.sub(' ', query))
+    return {name.lower() for name in _TABLE_RE.findall(query)}
+
+
+def referenced_tables(query):
+    """Таблицы Tickit и куб продаж, упомянутые в FROM/JOIN запроса"""
+    return sorted(query_tables(query) & TABLE_VERSION_QUERIES.keys())
+
+
+def is_cacheable(query):
+    """True, если запрос читает только таблицы с отпечатком версии (и хотя бы одну)"""
+    tables = query_tables(query)
+    return bool(tables) and tables <= TABLE_VERSION_QUERIES.keys()
+
+
+class QueryCache:
+    """Персистентный LRU-кэш DataFrame с ограничением по размеру на диске"""
+
+    def __init__(self, cache_dir='.query_cache', max_bytes=512 * 1024 ** 2, version_ttl=5.0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # Отпечатки таблиц переиспользуются в пределах version_ttl секунд,
+        # чтобы один прогон анализа не пересчитывал COUNT(*) на каждый запрос
+        self.version_ttl = version_ttl
+        self._versions = {}
+        # Один экземпляр кэша может использоваться несколькими фоновыми задачами
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        self._loaded_version = None
+        # Ещё не записанные в индекс счётчики и обращения к записям
+        self._pending = {'hits': 0, 'misses': 0}
+        self._accessed = {}
+        self._flushed_at = time.monotonic()
+        self._load_index()
+        atexit.register(self.flush)
+
+    def _load_index(self):
+        version = file_version(self._index_path)
+        data = read_json(self._index_path, {})
+        self.entries = data.get('entries', {})
+        self.stats = data.get('stats', {})
+        for field in ('hits', 'misses', 'evictions'):
+            self.stats.setdefault(field, 0)
+        self._loaded_version = version
+
+    def _reload(self):
+        """Перечитывание индекса, если его заменил другой процесс"""
+        if file_version(self._index_path) != self._loaded_version:
+            self._load_index()
+
+    def _update_index(self, change=None):
+        """Перечитать индекс, применить change() и накопленные счётчики, вытеснить и записать"""
+        with file_lock(self._index_path):
+            self._load_index()
+            if change is not None:
+                change()
+            for field, value in self._pending.items():
+                self.stats[field] += value
+            for key, accessed in self._accessed.items():
+                if key in self.entries:
+                    self.entries[key]['last_access'] = max(self.entries[key]['last_access'], accessed)
+            self._pending = {'hits': 0, 'misses': 0}
+            self._accessed = {}
+            self._evict()
+            self._loaded_version = write_json(self._index_path, {'entries': self.entries, 'stats': self.stats})
+        self._flushed_at = time.monotonic()
+
+    def flush(self):
+        """Запись накопленных счётчиков и времени обращений в индекс"""
+        with self._lock:
+            if any(self._pending.values()) or self._accessed:
+                self._update_index()
+
+    def _count(self, field, key=None):
+        self._pending[field] += 1
+        if key is not None:
+            self._accessed[key] = time.time()
+        if time.monotonic() - self._flushed_at > STATS_FLUSH_INTERVAL:
+            self._update_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def table_versions(self, connection, query):
+        """Отпечатки версий всех таблиц, на которые ссылается запрос
+
+        None — запрос не кэшируется (нет таблиц с отпечатком или есть таблица без него).
+        """
+        if not is_cacheable(query):
+            return None
+        with self._lock:
+            versions = {}
+            now = time.monotonic()
+            for table in referenced_tables(query):
+                cached = self._versions.get(table)
+                if cached is None or now - cached[0] > self.version_ttl:
+                    with connection.cursor() as cursor:
+                        cursor.execute(TABLE_VERSION_QUERIES[table])
+                        row_count, max_id = cursor.fetchone()
+                    cached = (now, [row_count, max_id])
+                    self._versions[table] = cached
+                versions[table] = cached[1]
+            return versions
+
+    def invalidate_versions(self):
+        """Сброс запомненных отпечатков (например, после вставки данных)"""
+        with self._lock:
+            self._versions.clear()
+
+    def make_key(self, query, versions):
+        payload = json.dumps([normalize_sql(query), versions], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """DataFrame из кэша или None"""
+        import pandas as pd
+        with self._lock:
+            self._reload()
+            if key in self.entries:
+                try:
+                    df = pd.read_pickle(self._path(key))
+                except (OSError, EOFError, ValueError):
+                    df = None
+                if df is not None:
+                    self._count('hits', key)
+                    return df
+            self._count('misses')
+            return None
+
+    def put(self, key, df):
+        """Сохранение результата с вытеснением давно неиспользуемых записей"""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        df.to_pickle(tmp_path)
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        # Читатели других процессов видят либо старый файл, либо новый целиком
+        os.replace(tmp_path, path)
+
+        def add():
+            self.entries[key] = {'size': size, 'last_access': time.time()}
+        with self._lock:
+            self._update_index(add)
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries.pop(key)['size']
+            self.stats['evictions'] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Полная очистка кэша"""
+        def remove_all():
+            for key in list(self.entries):
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+            self.entries.clear()
+        with self._lock:
+            self._update_index(remove_all)
+
+    def summary(self):
+        """Статистика попаданий/промахов (с ещё не записанными в индекс) и занятый объём"""
+        with self._lock:
+            self._reload()
+            hits = self.stats['hits'] + self._pending['hits']
+            misses = self.stats['misses'] + self._pending['misses']
+            lookups = hits + misses
+            return {
+                'hits': hits,
+                'misses': misses,
+                'evictions': self.stats['evictions'],
+                'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+                'entries': len(self.entries),
+                'size_mb': round(sum(e['size'] for e in self.entries.values()) / 1024 ** 2, 2),
+            }
@@ -0,0 +1,113 @@
+"""Кэш отрисовки графиков по содержимому входных данных.
+
+Ключ графика — хэш его DataFrame (значения, колонки, типы) плюс параметры
+отрисовки: имя и путь PNG, DPI, палитра, версия matplotlib и код модуля
+charts. Если ключ совпадает с записью в манифесте, а у PNG те же размер и
+время изменения, график не перерисовывается: файл (и его дата изменения для
+кэша браузера) остаётся прежним, а запись манифеста переиспользуется.
+
+Манифест общий для процессов (веб-сервер, CLI): записи добавляются под
+file_lock с перечитыванием, как в artifacts.py.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import matplotlib
+import pandas as pd
+
+import charts
+from file_locks import file_lock, file_version, read_json, write_json
+
+
+def frame_digest(df):
+    """Хэш содержимого DataFrame, не зависящий от способа его получения"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _renderer_digest():
+    # Любая правка charts.py (подписи, размеры, цвета) инвалидирует все графики
+    with open(charts.__file__, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _png_stat(path):
+    """Размер и время изменения (нс) файла или None, если его нет"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class RenderCache:
+    """Манифест отрисованных графиков: имя -> ключ, путь, размер и mtime PNG"""
+
+    def __init__(self, manifest_path='charts/render_manifest.json'):
+        self.manifest_path = manifest_path
+        self._renderer = _renderer_digest()
+        self._lock = threading.Lock()
+        self.stats = {'rendered': 0, 'skipped': 0}
+        self.entries = {}
+        self._loaded_version = None
+        self._reload(force=True)
+
+    def _reload(self, force=False):
+        """Перечитывание манифеста, если его заменил другой процесс"""
+        version = file_version(self.manifest_path)
+        if force or version != self._loaded_version:
+            self.entries = read_json(self.manifest_path, {}).get('charts', {})
+            self._loaded_version = version
+
+    def key(self, name, df, colors):
+        """Ключ графика name для данных df и палитры colors"""
+        _, path, _ = charts.CHARTS[name]
+        params = json.dumps({
+            'name': name,
+            'path': path,
+            'dpi': charts.DPI,
+            'colors': list(colors),
+            'matplotlib': matplotlib.__version__,
+            'renderer': self._renderer,
+        }, sort_keys=True)
+        return hashlib.sha256(f"{params}:{frame_digest(df)}".encode()).hexdigest()
+
+    def is_fresh(self, name, key):
+        """True, если PNG графика отрисован по тем же данным и не менялся с тех пор"""
+        with self._lock:
+            self._reload()
+            entry = self.entries.get(name)
+            # Записи без mtime_ns (старый формат манифеста) считаются устаревшими
+            fresh = (entry is not None and entry['key'] == key
+                     and _png_stat(entry['path']) == {'size': entry['size'], 'mtime_ns': entry.get('mtime_ns')})
+            if fresh:
+                self.stats['skipped'] += 1
+            return fresh
+
+    def record(self, name, key):
+        """Запись о только что отрисованном PNG"""
+        _, path, _ = charts.CHARTS[name]
+        with self._lock, file_lock(self.manifest_path):
+            self._reload(force=True)
+            self.entries[name] = {
+                'key': key,
+                'path': path,
+                **_png_stat(path),
+                'rendered': datetime.now().isoformat(timespec='seconds'),
+            }
+            self.stats['rendered'] += 1
+            self._save()
+
+    def _save(self):
+        self._loaded_version = write_json(self.manifest_path, {'charts': self.entries},
+                                          ensure_ascii=False, indent=2)
+
+    def clear(self):
+        with self._lock, file_lock(self.manifest_path):
+            self.entries = {}
+            self._save()
@@ -0,0 +1,275 @@
+"""Куб предагрегатов продаж в PostgreSQL.
+
+Таблица sales_rollup хранит аддитивные меры (число продаж, билеты, суммы
+цен) с зерном дата × catgroup × catname × штат покупателя × площадка.
+Куб читают только наборы данных из фиксированного списка ROLLUP_DATASETS:
+для каждого из них запрос к кубу написан вручную и сверяется с исходным
+командой verify. Остальные наборы данных по-прежнему идут в исходные таблицы.
+
+Обновление инкрементальное: в куб дописываются частичные агрегаты продаж
+с saleid больше сохранённого водяного знака. Все меры аддитивны, поэтому
+несколько строк на один ключ допустимы — запросы к кубу всё равно
+суммируют их в GROUP BY. rebuild() пересобирает куб целиком и уплотняет его.
+
+    python rollup.py refresh
+    python rollup.py rebuild
+    python rollup.py verify
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROLLUP_TABLE = 'sales_rollup'
+STATE_TABLE = 'sales_rollup_state'
+
+CREATE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+    sale_date date,
+    catgroup varchar(10),
+    catname varchar(10),
+    buyer_state char(2),
+    venueid integer,
+    sale_count bigint NOT NULL,
+    qty_sum bigint,
+    price_sum numeric,
+    price_count bigint NOT NULL,
+    listed_qty_sum bigint,
+    ticket_price_sum numeric,
+    ticket_price_count bigint NOT NULL
+);
+CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_date_idx ON {ROLLUP_TABLE} (sale_date);
+CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+    id integer PRIMARY KEY,
+    last_saleid integer NOT NULL,
+    refreshed_at timestamp NOT NULL
+);
+"""
+
+# Частичные агрегаты продаж из диапазона (last_saleid, upto_saleid].
+# LEFT JOIN, как в facts.FACT_QUERY: NULL в измерении означает «нет пары»,
+# и запросы к кубу отбрасывают такие строки, повторяя INNER JOIN исходных запросов.
+DELTA_SQL = f"""
+INSERT INTO {ROLLUP_TABLE}
+SELECT DATE(s.saletime), c.catgroup, c.catname, u.state, v.venueid,
+       COUNT(*), SUM(s.qtysold), SUM(s.pricepaid), COUNT(s.pricepaid),
+       SUM(s.qtysold) FILTER (WHERE l.listid IS NOT NULL),
+       SUM(l.priceperticket), COUNT(l.priceperticket)
+FROM sales s
+LEFT JOIN events e ON s.eventid = e.eventid
+LEFT JOIN category c ON e.catid = c.catid
+LEFT JOIN listing l ON s.listid = l.listid
+LEFT JOIN users u ON s.buyerid = u.userid
+LEFT JOIN venue v ON e.venueid = v.venueid
+WHERE s.saleid > %(last_saleid)s AND s.saleid <= %(upto_saleid)s
+GROUP BY 1, 2, 3, 4, 5;
+"""
+
+# Набор данных -> запрос к кубу. Список фиксированный: набор данных попадает
+# сюда, только если его зерно выводится из измерений куба и запрос прошёл verify.
+# Venue_Performance (COUNT DISTINCT событий) и наборы по users в куб не входят.
+ROLLUP_DATASETS = {
+    'category_revenue': f"""
+        SELECT catgroup, ROUND(SUM(price_sum) / 1000, 2) AS revenue_k
+        FROM {ROLLUP_TABLE}
+        WHERE catgroup IS NOT NULL
+        GROUP BY catgroup
+        ORDER BY revenue_k DESC;
+    """,
+    'state_avg_transaction': f"""
+        SELECT buyer_state AS state,
+               SUM(price_sum) / NULLIF(SUM(price_count), 0) AS avg_transaction,
+               SUM(sale_count)::bigint AS total_sales
+        FROM {ROLLUP_TABLE}
+        WHERE buyer_state IS NOT NULL
+        GROUP BY buyer_state
+        HAVING SUM(sale_count) > 100
+        ORDER BY avg_transaction DESC
+        LIMIT 15;
+    """,
+    'monthly_sales': f"""
+        SELECT EXTRACT(YEAR FROM sale_date) AS year,
+               EXTRACT(MONTH FROM sale_date) AS month,
+               SUM(sale_count)::bigint AS total_sales,
+               SUM(price_sum) AS total_revenue
+        FROM {ROLLUP_TABLE}
+        WHERE venueid IS NOT NULL
+        GROUP BY year, month
+        ORDER BY year, month;
+    """,
+    'price_vs_quantity': f"""
+        SELECT SUM(ticket_price_sum) / NULLIF(SUM(ticket_price_count), 0) AS avg_ticket_price,
+               SUM(listed_qty_sum)::bigint AS total_tickets_sold,
+               catname
+        FROM {ROLLUP_TABLE}
+        WHERE catname IS NOT NULL
+        GROUP BY catname
+        HAVING SUM(listed_qty_sum) > 100;
+    """,
+    'daily_category_sales': f"""
+        SELECT sale_date, catgroup,
+               SUM(price_sum) / NULLIF(SUM(price_count), 0) AS avg_price,
+               SUM(sale_count)::bigint AS daily_sales,
+               SUM(qty_sum)::bigint AS daily_tickets
+        FROM {ROLLUP_TABLE}
+        WHERE sale_date >= '2008-01-01' AND catgroup IS NOT NULL
+        GROUP BY sale_date, catgroup
+        ORDER BY sale_date;
+    """,
+    'Sales_Summary': f"""
+        SELECT catgroup, catname,
+               SUM(sale_count)::bigint AS total_sales,
+               SUM(qty_sum)::bigint AS total_tickets,
+               SUM(price_sum) AS total_revenue,
+               SUM(price_sum) / NULLIF(SUM(price_count), 0) AS avg_sale_amount
+        FROM {ROLLUP_TABLE}
+        WHERE catname IS NOT NULL
+        GROUP BY catgroup, catname
+        ORDER BY total_revenue DESC;
+    """,
+}
+
+
+def frames_match(raw, cube):
+    """Сравнение результатов сырого запроса и куба без учёта порядка строк"""
+    if list(raw.columns) != list(cube.columns) or len(raw) != len(cube):
+        return False
+    raw, cube = raw.copy(), cube.copy()
+    numeric = []
+    for column in raw.columns:
+        try:
+            raw[column] = pd.to_numeric(raw[column]).astype('float64')
+            cube[column] = pd.to_numeric(cube[column]).astype('float64')
+            numeric.append(column)
+        except (TypeError, ValueError):
+            raw[column] = raw[column].astype(str)
+            cube[column] = cube[column].astype(str)
+    raw = raw.sort_values(list(raw.columns), ignore_index=True)
+    cube = cube.sort_values(list(cube.columns), ignore_index=True)
+    keys = [column for column in raw.columns if column not in numeric]
+    return (raw[keys].equals(cube[keys])
+            and bool(np.allclose(raw[numeric].values, cube[numeric].values,
+                                 rtol=1e-9, atol=0.005, equal_nan=True)))
+
+
+class SalesRollup:
+    """Куб продаж в базе: создание, инкрементальное обновление, маршрутизация"""
+
+    def __init__(self):
+        self.last_saleid = None
+        self.ready = False
+
+    def ensure(self, connection):
+        """Создание таблиц куба (если их нет) и чтение водяного знака"""
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_SQL)
+            cursor.execute(f"SELECT last_saleid FROM {STATE_TABLE} WHERE id = 1")
+            row = cursor.fetchone()
+        connection.commit()
+        self.last_saleid = row[0] if row else None
+        return self.last_saleid
+
+    def _append(self, cursor, last_saleid):
+        cursor.execute("SELECT COALESCE(MAX(saleid), 0) FROM sales")
+        upto_saleid = cursor.fetchone()[0]
+        cursor.execute(DELTA_SQL, {'last_saleid': last_saleid, 'upto_saleid': upto_saleid})
+        added = cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO {STATE_TABLE} (id, last_saleid, refreshed_at) VALUES (1, %(upto)s, now())
+            ON CONFLICT (id) DO UPDATE SET last_saleid = EXCLUDED.last_saleid,
+                                           refreshed_at = EXCLUDED.refreshed_at
+        """, {'upto': upto_saleid})
+        return upto_saleid, added
+
+    def rebuild(self, connection):
+        """Полная пересборка куба; возвращает число строк куба"""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(CREATE_SQL)
+                cursor.execute(f"TRUNCATE {ROLLUP_TABLE}")
+                self.last_saleid, added = self._append(cursor, 0)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        self.ready = True
+        return added
+
+    def refresh(self, connection):
+        """Дописывание агрегатов новых продаж; при первом запуске — полная сборка
+
+        Возвращает число добавленных строк куба.
+        """
+        if self.ensure(connection) is None:
+            return self.rebuild(connection)
+        try:
+            with connection.cursor() as cursor:
+                # Блокировка строки состояния: параллельные обновления не задвоят продажи
+                cursor.execute(f"SELECT last_saleid FROM {STATE_TABLE} WHERE id = 1 FOR UPDATE")
+                self.last_saleid, added = self._append(cursor, cursor.fetchone()[0])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        self.ready = True
+        return added
+
+    def route(self, name):
+        """Запрос к кубу для набора данных name или None, если его нет в ROLLUP_DATASETS"""
+        if not self.ready:
+            return None
+        return ROLLUP_DATASETS.get(name)
+
+    def verify(self, connection, raw_queries):
+        """Сверка куба с сырыми запросами raw_queries (имя -> SQL) на одном снимке данных
+
+        Куб дообновляется в той же транзакции REPEATABLE READ, в которой
+        читаются оба варианта, поэтому новые продажи не дают ложных расхождений.
+        """
+        if self.ensure(connection) is None:
+            self.rebuild(connection)
+        results = {}
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                cursor.execute(f"SELECT last_saleid FROM {STATE_TABLE} WHERE id = 1 FOR UPDATE")
+                self.last_saleid, _ = self._append(cursor, cursor.fetchone()[0])
+            for name, query in ROLLUP_DATASETS.items():
+                if name in raw_queries:
+                    raw = pd.read_sql_query(raw_queries[name], connection)
+                    cube = pd.read_sql_query(query, connection)
+                    results[name] = frames_match(raw, cube)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        self.ready = True
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Куб предагрегатов продаж AWS Tickit")
+    parser.add_argument('command', choices=['refresh', 'rebuild', 'verify'])
+    args = parser.parse_args()
+
+    from db_pool import get_pool, close_pool
+    rollup = SalesRollup()
+    try:
+        with get_pool().connection() as connection:
+            if args.command == 'refresh':
+                added = rollup.refresh(connection)
+                print(f"✅ Куб обновлен до saleid {rollup.last_saleid}: +{added} строк")
+            elif args.command == 'rebuild':
+                added = rollup.rebuild(connection)
+                print(f"✅ Куб пересобран до saleid {rollup.last_saleid}: {added} строк")
+            else:
+                from main import CHART_QUERIES, EXCEL_QUERIES
+                checks = rollup.verify(connection, {**CHART_QUERIES, **EXCEL_QUERIES})
+                status = "✅" if all(checks.values()) else "❌"
+                print(f"{status} Сверка куба с исходными таблицами: {checks}")
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
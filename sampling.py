@@ -0,0 +1,334 @@
+"""Приближённый предпросмотр графиков по выборке с доверительными интервалами.
+
+Для sales (с нужными колонками измерений) и listing поддерживаются
+резервуарные выборки фиксированного размера. Первая выборка берётся
+TABLESAMPLE BERNOULLI, дальше новые строки (по водяному знаку первичного
+ключа) проходят через алгоритм R, так что выборка остаётся равномерной
+без повторного чтения таблиц. Круговая диаграмма, гистограмма, точечная
+и горизонтальная диаграммы считаются по выборке в памяти; к оценкам
+добавляются 95%-ные доверительные интервалы (колонки *_low и *_high).
+
+    python sampling.py verify --scale 1 --sample-size 5000 --trials 20
+"""
+import argparse
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import binning
+
+PREVIEW_PATH = '.preview/sample.pkl'
+DEFAULT_SAMPLE_SIZE = 100000
+# Квантиль нормального распределения для 95%-ного интервала
+Z = 1.959963984540054
+# Запас для BERNOULLI: выборка должна набрать не меньше size строк
+OVERSAMPLE = 1.2
+
+SALES_COLUMNS = """
+SELECT s.saleid, s.qtysold, s.pricepaid, c.catgroup, c.catname,
+       l.priceperticket, u.state AS buyer_state
+FROM sales s {sample}
+LEFT JOIN events e ON s.eventid = e.eventid
+LEFT JOIN category c ON e.catid = c.catid
+LEFT JOIN listing l ON s.listid = l.listid
+LEFT JOIN users u ON s.buyerid = u.userid
+"""
+
+# Таблица -> (первичный ключ с псевдонимом таблицы, запрос строк)
+SOURCES = {
+    'sales': ('s.saleid', SALES_COLUMNS),
+    'listing': ('l.listid', "SELECT l.listid, l.priceperticket FROM listing l {sample}"),
+}
+
+
+class Reservoir:
+    """Равномерная выборка не более size строк из всех учтённых строк таблицы"""
+
+    def __init__(self, size, seed=42):
+        self.size = size
+        self.sample = None
+        self.seen = 0
+        self.watermark = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, rows):
+        """Алгоритм R: i-я строка потока попадает в выборку с вероятностью size/i"""
+        rows = rows.reset_index(drop=True)
+        if self.sample is None:
+            self.sample = rows.iloc[:0].copy()
+        free = max(0, self.size - len(self.sample))
+        if free:
+            self.sample = pd.concat([self.sample, rows.iloc[:free]], ignore_index=True)
+        rest = rows.iloc[free:]
+        if len(rest):
+            positions = self.seen + free + np.arange(1, len(rest) + 1)
+            slots = self.rng.integers(0, positions)
+            keep = slots < self.size
+            # Если один слот заменяется несколько раз, остаётся последняя строка
+            last = pd.Series(np.flatnonzero(keep)).groupby(slots[keep]).last()
+            for column in self.sample.columns:
+                self.sample.loc[last.index.to_numpy(), column] = rest[column].to_numpy()[last.to_numpy()]
+        self.seen += len(rows)
+        return len(rows)
+
+
+def _rows_query(table, sample='', condition=''):
+    """Запрос строк таблицы (с TABLESAMPLE или без) с условием на первичный ключ"""
+    key, query = SOURCES[table]
+    return query.format(sample=sample) + f"WHERE {key} {condition} ORDER BY {key}"
+
+
+class PreviewSample:
+    """Резервуарные выборки sales и listing, обновляемые по водяному знаку"""
+
+    def __init__(self, size=DEFAULT_SAMPLE_SIZE, seed=42):
+        self.seed = seed
+        self.reservoirs = {table: Reservoir(size, seed + idx) for idx, table in enumerate(SOURCES)}
+
+    def _read(self, connection, query, params):
+        df = pd.read_sql_query(query, connection, params=params)
+        for column in ('pricepaid', 'priceperticket'):
+            if column in df:
+                df[column] = pd.to_numeric(df[column]).astype('float64')
+        return df
+
+    def refresh(self, connection):
+        """Первая выборка (BERNOULLI) или учёт только новых строк; возвращает число учтённых строк"""
+        added = 0
+        for table, reservoir in self.reservoirs.items():
+            key = SOURCES[table][0].split('.')[1]
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*), COALESCE(MAX({key}), 0) FROM {table} WHERE {key} > %(last)s",
+                               {'last': reservoir.watermark})
+                count, upto = cursor.fetchone()
+            if count == 0:
+                continue
+            if reservoir.sample is None:
+                percent = min(100.0, 100.0 * reservoir.size * OVERSAMPLE / count)
+                rows = self._read(connection, _rows_query(
+                    table, "TABLESAMPLE BERNOULLI (%(percent)s) REPEATABLE (%(seed)s) ", "<= %(upto)s"),
+                    {'percent': percent, 'seed': self.seed, 'upto': upto})
+                rows = rows.sample(n=min(len(rows), reservoir.size), random_state=self.seed, ignore_index=True)
+                # Если BERNOULLI набрал меньше size строк, ёмкость остаётся прежней:
+                # свободные места заполнят новые строки в Reservoir.add (алгоритм R)
+                reservoir.sample = rows
+                reservoir.seen = count
+            else:
+                rows = self._read(connection, _rows_query(table, condition="> %(last)s AND {0} <= %(upto)s".format(
+                    SOURCES[table][0])), {'last': reservoir.watermark, 'upto': upto})
+                reservoir.add(rows)
+            reservoir.watermark = upto
+            added += count
+        connection.rollback()
+        return added
+
+    @classmethod
+    def from_frames(cls, sales, listing, size=DEFAULT_SAMPLE_SIZE, seed=42):
+        """Выборки из уже загруженных DataFrame (для проверки на синтетических данных)"""
+        preview = cls(size, seed)
+        for table, rows in (('sales', sales), ('listing', listing)):
+            preview.reservoirs[table].add(rows)
+        return preview
+
+    @property
+    def sales(self):
+        return self.reservoirs['sales']
+
+    @property
+    def listing(self):
+        return self.reservoirs['listing']
+
+    def save(self, path=PREVIEW_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path=PREVIEW_PATH):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+# ---------- Оценки ----------
+
+def group_estimates(groups, values, population):
+    """Оценки по группам из равномерной выборки без возвращения
+
+    groups — ключ группы каждой строки выборки, values — значение (NaN —
+    строка не участвует). Для каждой группы: total (сумма по генеральной
+    совокупности), mean (среднее в группе), count (число строк) и их
+    стандартные ошибки с поправкой на конечность совокупности.
+    """
+    n = len(groups)
+    fpc = max(0.0, 1.0 - n / population) if population else 0.0
+    values = pd.Series(values, index=groups.index, dtype='float64')
+    valid = groups.notna() & values.notna()
+    rows = []
+    for key, positions in groups[valid].groupby(groups[valid], observed=True).groups.items():
+        y = values[positions].to_numpy()
+        z = np.zeros(n)
+        z[groups.index.get_indexer(positions)] = y
+        share = len(y) / n
+        rows.append({
+            'key': key,
+            'total': population * z.mean(),
+            'total_se': population * np.sqrt(fpc * z.var(ddof=1) / n) if n > 1 else 0.0,
+            'mean': y.mean(),
+            'mean_se': np.sqrt(fpc * y.var(ddof=1) / len(y)) if len(y) > 1 else np.nan,
+            'count': population * share,
+            'count_se': population * np.sqrt(fpc * share * (1 - share) / (n - 1)) if n > 1 else 0.0,
+        })
+    return pd.DataFrame(rows, columns=['key', 'total', 'total_se', 'mean', 'mean_se', 'count', 'count_se'])
+
+
+def _with_interval(df, column, estimate, se, scale=1.0, digits=None):
+    df[column] = estimate / scale
+    df[f'{column}_low'] = (estimate - Z * se) / scale
+    df[f'{column}_high'] = (estimate + Z * se) / scale
+    if digits is not None:
+        df[[column, f'{column}_low', f'{column}_high']] = df[[column, f'{column}_low', f'{column}_high']].round(digits)
+    return df
+
+
+def category_revenue(preview):
+    """Выручка по группам категорий в тыс. $ с интервалами (круговая диаграмма)"""
+    sample = preview.sales.sample
+    est = group_estimates(sample['catgroup'], sample['pricepaid'], preview.sales.seen)
+    df = _with_interval(pd.DataFrame({'catgroup': est['key']}), 'revenue_k', est['total'], est['total_se'],
+                        scale=1000, digits=2)
+    return df.sort_values('revenue_k', ascending=False, ignore_index=True)
+
+
+def state_avg_transaction(preview, filtered=True):
+    """Средний чек по штатам с интервалами (горизонтальная диаграмма)"""
+    sample = preview.sales.sample
+    est = group_estimates(sample['buyer_state'], sample['pricepaid'], preview.sales.seen)
+    df = _with_interval(pd.DataFrame({'state': est['key']}), 'avg_transaction', est['mean'], est['mean_se'])
+    df = _with_interval(df, 'total_sales', est['count'], est['count_se'], digits=0)
+    if filtered:
+        df = df[df['total_sales'] > 100].sort_values('avg_transaction', ascending=False).head(15)
+    return df.reset_index(drop=True)
+
+
+def price_vs_quantity(preview, filtered=True):
+    """Средняя цена билета и число проданных билетов по категориям с интервалами (точечная диаграмма)"""
+    sample = preview.sales.sample
+    listed = sample['priceperticket'].notna()
+    prices = group_estimates(sample['catname'], sample['priceperticket'], preview.sales.seen)
+    tickets = group_estimates(sample['catname'], sample['qtysold'].where(listed), preview.sales.seen)
+    df = _with_interval(pd.DataFrame({'catname': prices['key']}), 'avg_ticket_price',
+                        prices['mean'], prices['mean_se'])
+    tickets = _with_interval(pd.DataFrame({'catname': tickets['key']}), 'total_tickets_sold',
+                             tickets['total'], tickets['total_se'], digits=0)
+    df = df.merge(tickets, on='catname')
+    if filtered:
+        df = df[df['total_tickets_sold'] > 100]
+    return df.reset_index(drop=True)
+
+
+def price_histogram(preview, lo=1, hi=500, bins=30):
+    """Гистограмма цен билетов с интервалами для числа билетов в каждом интервале
+
+    Границы берутся по min/max цен в выборке, поэтому могут немного
+    отличаться от точной гистограммы.
+    """
+    reservoir = preview.listing
+    prices = reservoir.sample['priceperticket'].to_numpy(dtype='float64')
+    in_range = prices[(prices >= lo) & (prices <= hi)]
+    if len(in_range) == 0:
+        return binning.binned_frame(binning.bin_edges(0.0, 1.0, bins), np.zeros(bins))
+    edges = binning.bin_edges(in_range.min(), in_range.max(), bins)
+    counts = np.histogram(in_range, bins=edges)[0]
+    n, population = len(prices), reservoir.seen
+    fpc = max(0.0, 1.0 - n / population)
+    share = counts / n
+    estimate = population * share
+    se = population * np.sqrt(fpc * share * (1 - share) / max(n - 1, 1))
+    df = binning.binned_frame(edges, np.rint(estimate))
+    df['count_low'] = np.maximum(0, estimate - Z * se)
+    df['count_high'] = estimate + Z * se
+    return df
+
+
+# Набор данных графика -> оценка по выборке
+PREVIEW_AGGREGATES = {
+    'category_revenue': category_revenue,
+    'state_avg_transaction': state_avg_transaction,
+    'price_vs_quantity': price_vs_quantity,
+}
+
+
+# ---------- Проверка интервалов ----------
+
+def check_coverage(sales, listing, sample_size=5000, trials=20, seed=42):
+    """Доля случаев, когда точное значение попало в 95%-ный интервал оценки
+
+    Точные значения — те же оценки по всей совокупности (интервалы нулевой
+    ширины). Сравниваются все группы без фильтров HAVING/LIMIT, иначе
+    отбор по оценке смещал бы покрытие.
+    """
+    exact = PreviewSample.from_frames(sales, listing, size=len(sales) + len(listing))
+    checks = {
+        'category_revenue': (lambda p: category_revenue(p), 'catgroup', 'revenue_k'),
+        'avg_transaction': (lambda p: state_avg_transaction(p, filtered=False), 'state', 'avg_transaction'),
+        'total_sales': (lambda p: state_avg_transaction(p, filtered=False), 'state', 'total_sales'),
+        'avg_ticket_price': (lambda p: price_vs_quantity(p, filtered=False), 'catname', 'avg_ticket_price'),
+        'total_tickets_sold': (lambda p: price_vs_quantity(p, filtered=False), 'catname', 'total_tickets_sold'),
+    }
+    hits = {name: [] for name in list(checks) + ['histogram']}
+    listing_prices = listing['priceperticket'].to_numpy(dtype='float64')
+    for trial in range(trials):
+        preview = PreviewSample.from_frames(sales, listing, size=sample_size, seed=seed + trial)
+        for name, (estimate, key, column) in checks.items():
+            merged = estimate(preview).merge(estimate(exact)[[key, column]], on=key, suffixes=('', '_exact'))
+            # Округление оценок (до тыс. $ или целых) расширяет интервал на полшага
+            slack = 0.005 if column == 'revenue_k' else 0.5 if column.startswith('total') else 0.0
+            hits[name] += list((merged[f'{column}_exact'] >= merged[f'{column}_low'] - slack)
+                               & (merged[f'{column}_exact'] <= merged[f'{column}_high'] + slack))
+        histogram = price_histogram(preview)
+        in_range = listing_prices[(listing_prices >= 1) & (listing_prices <= 500)]
+        exact_counts = np.histogram(in_range, bins=binning.edges_of(histogram))[0]
+        hits['histogram'] += list((exact_counts >= histogram['count_low'] - 0.5)
+                                  & (exact_counts <= histogram['count_high'] + 0.5))
+    return {name: float(np.mean(values)) for name, values in hits.items() if values}
+
+
+def verify_on_synthetic(scale=1, sample_size=5000, trials=20, seed=42, min_coverage=0.9):
+    """Проверка интервалов на синтетических данных; True, если покрытие не ниже min_coverage"""
+    import synthetic
+    from snapshot import Snapshot
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        synthetic.write_snapshot(snapshot_dir, scale, seed)
+        snapshot = Snapshot(snapshot_dir)
+        facts = snapshot.build_facts()
+        listing = snapshot.read_table('listing', ['listid', 'priceperticket'])
+    sales = facts[['saleid', 'qtysold', 'pricepaid', 'catgroup', 'catname', 'priceperticket', 'buyer_state']]
+    sales = sales.astype({'catgroup': object, 'catname': object, 'buyer_state': object})
+    listing = listing.assign(priceperticket=listing['priceperticket'].astype('float64'))
+
+    coverage = check_coverage(sales, listing, sample_size, trials, seed)
+    passed = all(value >= min_coverage for value in coverage.values())
+    for name, value in coverage.items():
+        print(f"{'✅' if value >= min_coverage else '❌'} {name}: покрытие 95%-ных интервалов {value:.1%}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Предпросмотр по выборке: проверка доверительных интервалов")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    verify = subparsers.add_parser('verify', help="покрытие интервалов на синтетических данных")
+    verify.add_argument('--scale', type=int, default=1)
+    verify.add_argument('--sample-size', type=int, default=5000)
+    verify.add_argument('--trials', type=int, default=20)
+    verify.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if not verify_on_synthetic(args.scale, args.sample_size, args.trials, args.seed):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Локальные колоночные снимки базы AWS Tickit.
+
+Команда `python snapshot.py create` выгружает таблицы Tickit порциями
+(серверным курсором) в секционированные файлы Arrow IPC или Parquet.
+SnapshotAnalyzer строит все графики и Excel-отчет по этим файлам,
+открывая Arrow через memory map, — без подключения к PostgreSQL.
+"""
+import argparse
+import glob
+import json
+import os
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+import binning
+import facts
+from main import AWSTickitAnalyzer
+
+SNAPSHOT_TABLES = ['sales', 'listing', 'events', 'category', 'venue', 'users']
+
+# OID типов PostgreSQL -> тип Arrow (всё остальное пишется строкой)
+PG_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    700: pa.float64(),
+    701: pa.float64(),
+    1700: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp('us'),
+    1184: pa.timestamp('us', tz='UTC'),
+}
+
+
+def _schema_from_description(description):
+    return pa.schema([(column.name, PG_TYPES.get(column.type_code, pa.string())) for column in description])
+
+
+def _rows_to_table(rows, schema):
+    df = pd.DataFrame.from_records(rows, columns=schema.names)
+    for field in schema:
+        if pa.types.is_floating(field.type):
+            # NUMERIC приходит как Decimal
+            df[field.name] = pd.to_numeric(df[field.name]).astype('float64')
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def write_part(table, path, file_format):
+    """Запись одной секции таблицы в формате arrow (IPC) или parquet"""
+    if file_format == 'parquet':
+        pq.write_table(table, path)
+    else:
+        with ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+
+
+def create_snapshot(connection, snapshot_dir='snapshots/latest', file_format='arrow',
+                    chunk_size=500000, tables=SNAPSHOT_TABLES):
+    """Выгрузка таблиц Tickit в секционированные колоночные файлы
+
+    Каждая порция из chunk_size строк становится отдельной секцией
+    <таблица>/part-NNNNN.<arrow|parquet>; в manifest.json записываются
+    число строк и список секций.
+    """
+    extension = 'parquet' if file_format == 'parquet' else 'arrow'
+    manifest = {'created': datetime.now().isoformat(timespec='seconds'),
+                'format': extension, 'tables': {}}
+    try:
+        for table_name in tables:
+            table_dir = os.path.join(snapshot_dir, table_name)
+            os.makedirs(table_dir, exist_ok=True)
+            for stale in glob.glob(os.path.join(table_dir, 'part-*')):
+                os.remove(stale)
+            parts = []
+            n_rows = 0
+            with connection.cursor(name=f"snapshot_{uuid.uuid4().hex}") as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(f"SELECT * FROM {table_name}")
+                rows = cursor.fetchmany(chunk_size)
+                schema = _schema_from_description(cursor.description)
+                while rows or not parts:
+                    part_name = f"part-{len(parts):05d}.{extension}"
+                    write_part(_rows_to_table(rows, schema), os.path.join(table_dir, part_name), file_format)
+                    parts.append(part_name)
+                    n_rows += len(rows)
+                    rows = cursor.fetchmany(chunk_size)
+            manifest['tables'][table_name] = {'rows': n_rows, 'parts': parts}
+            print(f"📦 {table_name}: {n_rows} строк, секций: {len(parts)}")
+    finally:
+        connection.rollback()
+    with open(os.path.join(snapshot_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"✅ Снимок сохранен: {snapshot_dir}")
+    return manifest
+
+
+class Snapshot:
+    """Чтение таблиц снимка (Arrow — через memory map, только нужные колонки)"""
+
+    def __init__(self, snapshot_dir='snapshots/latest'):
+        self.snapshot_dir = snapshot_dir
+        with open(os.path.join(snapshot_dir, 'manifest.json'), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.file_format = self.manifest['format']
+
+    def part_paths(self, table_name):
+        parts = self.manifest['tables'][table_name]['parts']
+        return [os.path.join(self.snapshot_dir, table_name, part) for part in parts]
+
+    def iter_batches(self, table_name, columns=None):
+        """Секции таблицы по очереди как pyarrow.Table"""
+        for path in self.part_paths(table_name):
+            if self.file_format == 'parquet':
+                yield pq.read_table(path, columns=columns, memory_map=True)
+            else:
+                table = ipc.open_file(pa.memory_map(path, 'r')).read_all()
+                yield table.select(columns) if columns else table
+
+    def read_table(self, table_name, columns=None):
+        """Таблица целиком как pandas.DataFrame (только перечисленные колонки)"""
+        table = pa.concat_tables(list(self.iter_batches(table_name, columns)))
+        return table.to_pandas()
+
+    def build_facts(self):
+        """Таблица фактов продаж, эквивалентная facts.FACT_QUERY"""
+        sales = self.read_table('sales', ['saleid', 'listid', 'eventid', 'buyerid', 'saletime', 'qtysold', 'pricepaid'])
+        events = self.read_table('events', ['eventid', 'catid', 'venueid']).rename(columns={'venueid': 'event_venueid'})
+        category = self.read_table('category', ['catid', 'catgroup', 'catname'])
+        listing = self.read_table('listing', ['listid', 'priceperticket'])
+        users = self.read_table('users', ['userid', 'state']).rename(columns={'state': 'buyer_state'})
+        venue = self.read_table('venue', ['venueid', 'venuename', 'venuecity', 'venuestate'])
+
+        df = (sales
+              .merge(events, on='eventid', how='left')
+              .merge(category, on='catid', how='left')
+              .merge(listing, on='listid', how='left')
+              .merge(users, left_on='buyerid', right_on='userid', how='left')
+              .merge(venue, left_on='event_venueid', right_on='venueid', how='left'))
+        df = df[['saleid', 'eventid', 'saletime', 'qtysold', 'pricepaid', 'catgroup', 'catname',
+                 'priceperticket', 'buyer_state', 'venueid', 'venuename', 'venuecity', 'venuestate']]
+        return facts.compact_facts(df)
+
+    def price_histogram(self, lo=1, hi=500, bins=30):
+        """Гистограмма цен билетов потоково по секциям listing"""
+        def prices():
+            for batch in self.iter_batches('listing', ['priceperticket']):
+                values = batch.column('priceperticket').to_numpy(zero_copy_only=False).astype('float64')
+                yield values[(values >= lo) & (values <= hi)]
+
+        non_empty = [(chunk.min(), chunk.max()) for chunk in prices() if len(chunk)]
+        if not non_empty:
+            return binning.chunked_histogram([], bins=bins, value_range=(0.0, 1.0))
+        value_range = (min(low for low, _ in non_empty), max(high for _, high in non_empty))
+        return binning.chunked_histogram(prices(), bins=bins, value_range=value_range)
+
+
+def top_cities(snapshot):
+    """Топ-10 городов по числу пользователей (более 50 пользователей)"""
+    users = snapshot.read_table('users', ['city', 'state'])
+    df = users.groupby(['city', 'state'], dropna=False).size().rename('user_count').reset_index()
+    df = df[df['user_count'] > 50]
+    return df.sort_values('user_count', ascending=False, ignore_index=True).head(10)
+
+
+def user_geography(snapshot):
+    """Пользователи и фанаты спорта/концертов по городам (лист User_Geography)"""
+    users = snapshot.read_table('users', ['userid', 'city', 'state', 'likesports', 'likeconcerts'])
+    users['sports_fan'] = users['userid'].where(users['likesports'].fillna(False).astype(bool))
+    users['concert_fan'] = users['userid'].where(users['likeconcerts'].fillna(False).astype(bool))
+    df = users.groupby(['city', 'state'], dropna=False).agg(
+        user_count=('userid', 'size'),
+        sports_fans=('sports_fan', 'nunique'),
+        concert_fans=('concert_fan', 'nunique'),
+    ).reset_index()
+    df = df[df['user_count'] > 10]
+    return df.sort_values('user_count', ascending=False, ignore_index=True)
+
+
+# Наборы данных, которые не выводятся из таблицы фактов продаж
+SNAPSHOT_AGGREGATES = {
+    'top_cities': top_cities,
+    'User_Geography': user_geography,
+}
+
+
+class SnapshotAnalyzer(AWSTickitAnalyzer):
+    """Анализатор, работающий по локальному снимку вместо PostgreSQL"""
+
+    def __init__(self, snapshot_dir='snapshots/latest', headless=False):
+        self.snapshot = Snapshot(snapshot_dir)
+        super().__init__(headless=headless)
+        self.connect()
+
+    def connect(self):
+        """Подключение не требуется: таблица фактов строится из снимка (один раз)"""
+        if self.facts is not None:
+            return
+        self.facts = self.snapshot.build_facts()
+        print(f"✅ Открыт снимок {self.snapshot.snapshot_dir} от {self.snapshot.manifest['created']}: "
+              f"{len(self.facts)} продаж")
+
+    def execute_query(self, query, description="", connection=None):
+        print(f"❌ SQL недоступен в режиме снимка ({description or 'запрос'})")
+        return None
+
+    def execute_queries(self, queries, description="", max_workers=4):
+        return {name: self.get_data(name, query, f"{description} {name}".strip())
+                for name, query in queries.items()}
+
+    def get_data(self, name, query, description=""):
+        if name in SNAPSHOT_AGGREGATES:
+            df = SNAPSHOT_AGGREGATES[name](self.snapshot)
+            if description:
+                print(f"📊 {description}: {len(df)} строк (из снимка)")
+            return df
+        return super().get_data(name, query, description)
+
+    def load_sales_facts(self):
+        return self.facts
+
+    def price_histogram(self, bins=30):
+        return self.snapshot.price_histogram(bins=bins)
+
+    def refresh_live_aggregates(self):
+        # Снимок неизменен: новых продаж после последнего saleid нет
+        return 0
+
+    def demonstrate_live_data_update(self, verify=False):
+        super().demonstrate_live_data_update(verify=False)
+
+    def export_to_excel_streaming(self, queries, filename, chunk_size=50000):
+        # Таблицы снимка уже в памяти — используем обычный экспорт
+        return self.export_to_excel(self.prepare_data_for_excel_export(), filename)
+
+    def close(self):
+        print("✅ Снимок закрыт")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Колоночные снимки базы AWS Tickit")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create = subparsers.add_parser('create', help="выгрузить таблицы Tickit в снимок")
+    create.add_argument('--dir', default='snapshots/latest')
+    create.add_argument('--format', choices=['arrow', 'parquet'], default='arrow')
+    create.add_argument('--chunk-size', type=int, default=500000)
+
+    analyze = subparsers.add_parser('analyze', help="полный анализ по снимку")
+    analyze.add_argument('--dir', default='snapshots/latest')
+    analyze.add_argument('--headless', action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'create':
+        from db_pool import get_pool, close_pool
+        try:
+            with get_pool().connection() as connection:
+                create_snapshot(connection, args.dir, args.format, args.chunk_size)
+        finally:
+            close_pool()
+    else:
+        analyzer = SnapshotAnalyzer(args.dir, headless=args.headless)
+        analyzer.run_complete_analysis(parallel_render=args.headless)
+        analyzer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+"""Пакетная перегенерация дашбордов Superset из их экспортов.
+
+Экспорт дашборда — zip-архив с YAML: дашборд (раскладка графиков),
+графики (тип визуализации и параметры запроса) и наборы данных (SQL).
+Загрузчик разбирает архивы и для каждого графика строит агрегирующий
+SQL поверх его набора данных: фильтры, зерно времени, GROUP BY, метрики,
+сортировка и лимит считаются в базе, и из неё приходят только строки
+графика. Одинаковые запросы разных графиков выполняются один раз, а
+независимые — параллельно на соединениях пула. Графики рисуются пакетно
+в пуле процессов, а для каждого дашборда пишется Excel-отчет — так же,
+как в AWSTickitAnalyzer.
+
+Относительные диапазоны (Current year, Last month, …) отсчитываются от
+--as-of, а по умолчанию — от последней даты в данных набора: данные
+Tickit относятся к 2008 году.
+
+    python superset.py
+    python superset.py "Assignment 3 json files/dashboard sales.json" --as-of 2008-12-31
+"""
+import argparse
+import glob
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import matplotlib.pyplot as plt
+import pandas as pd
+import yaml
+
+import charts
+
+BUNDLE_DIR = 'Assignment 3 json files'
+
+# Зерно времени Superset -> единица DATE_TRUNC
+TIME_GRAINS = {'PT1H': 'hour', 'P1D': 'day', 'P1W': 'week', 'P1M': 'month', 'P3M': 'quarter', 'P1Y': 'year'}
+
+AGGREGATES = {'SUM': 'SUM({})', 'AVG': 'AVG({})', 'MIN': 'MIN({})', 'MAX': 'MAX({})',
+              'COUNT': 'COUNT({})', 'COUNT_DISTINCT': 'COUNT(DISTINCT {})'}
+
+COMPARISONS = {'==': '=', '!=': '<>', '>': '>', '<': '<', '>=': '>=', '<=': '<='}
+
+# Относительные диапазоны Superset: текущий период (период pandas) и последние N
+CURRENT_RANGES = {'Current day': 'D', 'Current week': 'W', 'Current month': 'M',
+                  'Current quarter': 'Q', 'Current year': 'Y'}
+LAST_RANGES = {'Last day': pd.DateOffset(days=1), 'Last week': pd.DateOffset(weeks=1),
+               'Last month': pd.DateOffset(months=1), 'Last quarter': pd.DateOffset(months=3),
+               'Last year': pd.DateOffset(years=1)}
+
+TIMESERIES_TYPES = {'echarts_timeseries_bar': 'bar', 'echarts_timeseries_line': 'line',
+                    'echarts_timeseries_scatter': 'scatter', 'echarts_area': 'line'}
+
+# Больше серий на графике не помещается в легенду — остальные объединяются
+MAX_SERIES = 10
+
+
+def _slug(text):
+    return re.sub(r'[^0-9a-zA-Z]+', '_', text).strip('_').lower()
+
+
+# ---------- Загрузка экспортов ----------
+
+def _layout_order(position):
+    """uuid графиков дашборда в порядке раскладки (обход от ROOT_ID)"""
+    order = []
+    stack = ['ROOT_ID']
+    while stack:
+        node = position.get(stack.pop())
+        if not isinstance(node, dict):
+            continue
+        if node.get('type') == 'CHART':
+            order.append(node['meta'])
+        stack.extend(reversed(node.get('children', [])))
+    return order
+
+
+def load_bundle(path):
+    """Дашборды и наборы данных из zip-экспорта Superset
+
+    Возвращает (список дашбордов, словарь uuid -> набор данных); каждый
+    дашборд — {'title', 'charts'}, графики в порядке раскладки.
+    """
+    dashboards, chart_docs, datasets = [], {}, {}
+    with zipfile.ZipFile(path) as bundle:
+        for name in bundle.namelist():
+            parts = name.split('/')
+            if not name.endswith('.yaml') or len(parts) < 3:
+                continue
+            doc = yaml.safe_load(bundle.read(name))
+            if parts[1] == 'dashboards':
+                dashboards.append(doc)
+            elif parts[1] == 'charts':
+                chart_docs[doc['uuid']] = doc
+            elif parts[1] == 'datasets':
+                datasets[doc['uuid']] = doc
+
+    result = []
+    for dashboard in dashboards:
+        items = []
+        for meta in _layout_order(dashboard.get('position') or {}):
+            chart = chart_docs.get(meta.get('uuid'))
+            if chart is not None:
+                items.append({**chart, 'title': meta.get('sliceNameOverride') or chart['slice_name']})
+        result.append({'title': dashboard['dashboard_title'], 'charts': items})
+    return result, datasets
+
+
+# ---------- Параметры графиков ----------
+
+def chart_metrics(params):
+    metrics = list(params.get('metrics') or [])
+    if params.get('metric'):
+        metrics.append(params['metric'])
+    return metrics
+
+
+def chart_dimensions(params):
+    """Колонки группировки графика: ось X (для временных рядов) + серии"""
+    dimensions = []
+    if params.get('viz_type') in TIMESERIES_TYPES and params.get('x_axis'):
+        dimensions.append(params['x_axis'])
+    for key in ('groupby', 'columns'):
+        for column in params.get(key) or []:
+            if not isinstance(column, str):
+                raise ValueError(f"группировка по выражению не поддерживается: {column}")
+            dimensions.append(column)
+    return dimensions
+
+
+def metric_label(metric):
+    if isinstance(metric, str):
+        return metric
+    return metric.get('label') or f"{metric['aggregate']}({metric['column']['column_name']})"
+
+
+# ---------- Планирование SQL ----------
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def sql_literal(value):
+    """Значение фильтра Superset как литерал SQL"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, pd.Timestamp):
+        return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def dataset_source(dataset):
+    """FROM набора данных: виртуальный (SQL) или физическая таблица"""
+    if dataset.get('sql'):
+        return f"({dataset['sql'].strip().rstrip(';')}) AS virtual_table"
+    return f"{dataset['schema']}.{dataset['table_name']}" if dataset.get('schema') else dataset['table_name']
+
+
+def dataset_key(dataset):
+    return f"{dataset['table_name']} [{dataset['uuid'][:8]}]"
+
+
+def time_range(comparator, as_of):
+    """Границы [начало, конец) относительного диапазона Superset или (None, None)"""
+    if comparator in (None, '', 'No filter'):
+        return None, None
+    if as_of is None:
+        raise ValueError(f"нет даты отсчёта для диапазона {comparator}")
+    today = as_of.normalize()
+    if comparator in CURRENT_RANGES:
+        period = today.to_period(CURRENT_RANGES[comparator])
+        return period.start_time, (period + 1).start_time
+    if comparator in LAST_RANGES:
+        return today - LAST_RANGES[comparator], today
+    if ' : ' in comparator:
+        start, end = (part.strip() for part in comparator.split(' : ', 1))
+        return (pd.Timestamp(start) if start else None), (pd.Timestamp(end) if end else None)
+    raise ValueError(f"диапазон времени не поддерживается: {comparator}")
+
+
+def relative_time_columns(params):
+    """Колонки, по которым график фильтруется относительным диапазоном (Current year и т.п.)"""
+    return {condition['subject'] for condition in params.get('adhoc_filters') or []
+            if condition.get('operator') == 'TEMPORAL_RANGE'
+            and (condition.get('comparator') in CURRENT_RANGES or condition.get('comparator') in LAST_RANGES)}
+
+
+def filter_sql(condition, anchors):
+    """Условие WHERE для adhoc-фильтра (None — фильтр ничего не отбрасывает)
+
+    anchors — колонка -> дата, от которой отсчитываются относительные диапазоны.
+    """
+    if condition.get('expressionType') != 'SIMPLE' or condition.get('clause', 'WHERE') != 'WHERE':
+        raise ValueError(f"фильтр не поддерживается: {condition.get('sqlExpression')}")
+    subject, operator, value = condition['subject'], condition['operator'], condition.get('comparator')
+    column = _quote(subject)
+    if operator == 'TEMPORAL_RANGE':
+        start, end = time_range(value, anchors.get(subject))
+        bounds = ([f"{column} >= {sql_literal(start)}"] if start is not None else []) + \
+                 ([f"{column} < {sql_literal(end)}"] if end is not None else [])
+        return " AND ".join(bounds) or None
+    if operator in ('IN', 'NOT IN'):
+        values = list(value or [])
+        if not values:
+            return "FALSE" if operator == 'IN' else None
+        return f"{column} {operator} ({', '.join(sql_literal(item) for item in values)})"
+    if operator in ('IS NULL', 'IS NOT NULL'):
+        return f"{column} {operator}"
+    if operator in COMPARISONS:
+        return f"{column} {COMPARISONS[operator]} {sql_literal(value)}"
+    raise ValueError(f"оператор фильтра не поддерживается: {operator}")
+
+
+def metric_sql(metric, dataset):
+    """Выражение метрики: сохранённая метрика набора данных или простой агрегат"""
+    if isinstance(metric, str):
+        saved = {item['metric_name']: item for item in dataset.get('metrics') or []}
+        expression = (saved.get(metric) or {}).get('expression')
+        if not expression:
+            raise ValueError(f"метрика не поддерживается: {metric}")
+        return expression
+    if metric.get('expressionType') == 'SIMPLE' and metric.get('aggregate') in AGGREGATES:
+        return AGGREGATES[metric['aggregate']].format(_quote(metric['column']['column_name']))
+    raise ValueError(f"метрика не поддерживается: {metric_label(metric)}")
+
+
+def chart_query(chart, dataset, anchors):
+    """Агрегирующий SQL графика: фильтры, зерно времени, GROUP BY, метрики, сортировка и лимит
+
+    Колонки результата называются d0, d1, … (измерения) и m0, m1, …
+    (метрики), поэтому графики с одинаковым запросом, но разными подписями
+    получают один и тот же SQL; настоящие имена возвращает chart_data().
+    """
+    params = chart['params']
+    keys = chart_dimensions(params)
+    x_axis = params.get('x_axis') if params['viz_type'] in TIMESERIES_TYPES else None
+    grain = TIME_GRAINS.get(params.get('time_grain_sqla'))
+    dimensions = []
+    for key in keys:
+        expression = _quote(key)
+        if key == x_axis and grain and key == dataset.get('main_dttm_col'):
+            expression = f"DATE_TRUNC('{grain}', {expression})"
+        dimensions.append(expression)
+    metrics = [metric_sql(metric, dataset) for metric in chart_metrics(params)]
+    conditions = [filter_sql(condition, anchors) for condition in params.get('adhoc_filters') or []]
+
+    select = [f"{expression} AS d{idx}" for idx, expression in enumerate(dimensions)]
+    select += [f"{expression} AS m{idx}" for idx, expression in enumerate(metrics)]
+    sql = f"SELECT {'DISTINCT ' if not metrics else ''}{', '.join(select) or '1 AS d0'} FROM {dataset_source(dataset)}"
+    conditions = [condition for condition in conditions if condition]
+    if conditions:
+        sql += " WHERE " + " AND ".join(f"({condition})" for condition in conditions)
+    if metrics and dimensions:
+        sql += " GROUP BY " + ", ".join(dimensions)
+    if metrics and (params.get('order_desc', True) or params.get('sort_by_metric')):
+        sql += " ORDER BY m0 DESC NULLS LAST"
+    if params.get('row_limit'):
+        sql += f" LIMIT {int(params['row_limit'])}"
+    return sql
+
+
+def anchor_queries(dashboards, datasets):
+    """Запросы MAX(колонка) для колонок с относительными диапазонами: (uuid, колонка) -> (имя, SQL)"""
+    queries = {}
+    for dashboard in dashboards:
+        for chart in dashboard['charts']:
+            dataset = datasets.get(chart['dataset_uuid'])
+            if dataset is None:
+                continue
+            for column in relative_time_columns(chart['params']):
+                queries[(dataset['uuid'], column)] = (
+                    f"{dataset_key(dataset)} max({column})",
+                    f"SELECT MAX({_quote(column)}) AS as_of FROM {dataset_source(dataset)}")
+    return queries
+
+
+def plan_queries(dashboards, datasets, anchors):
+    """Один агрегирующий запрос на график; одинаковые запросы разных графиков выполняются один раз
+
+    anchors — (uuid набора данных, колонка) -> дата для относительных диапазонов.
+    Возвращает (имя -> SQL, uuid графика -> имя запроса или текст ошибки).
+    """
+    queries, by_sql, planned = {}, {}, {}
+    for dashboard in dashboards:
+        for chart in dashboard['charts']:
+            dataset = datasets.get(chart['dataset_uuid'])
+            if dataset is None or chart['uuid'] in planned:
+                continue
+            columns = {column: anchors.get((dataset['uuid'], column))
+                       for column in relative_time_columns(chart['params'])}
+            try:
+                sql = chart_query(chart, dataset, columns)
+            except (ValueError, KeyError) as e:
+                planned[chart['uuid']] = ValueError(str(e))
+                continue
+            if sql not in by_sql:
+                by_sql[sql] = f"{dataset_key(dataset)}: {chart['title']}"
+                queries[by_sql[sql]] = sql
+            planned[chart['uuid']] = by_sql[sql]
+    return queries, planned
+
+
+def chart_data(chart, df):
+    """Результат запроса графика с именами колонок Superset и числовыми метриками"""
+    params = chart['params']
+    keys = chart_dimensions(params)
+    metrics = chart_metrics(params)
+    df = df.copy()
+    df.columns = keys + [metric_label(metric) for metric in metrics] if (keys or metrics) else ['_row']
+    for metric in metrics:
+        label = metric_label(metric)
+        # NUMERIC из PostgreSQL приходит как Decimal; количества остаются целыми
+        df[label] = pd.to_numeric(df[label])
+        if isinstance(metric, dict) and metric.get('aggregate') not in ('COUNT', 'COUNT_DISTINCT'):
+            df[label] = df[label].astype('float64')
+    x_axis = params.get('x_axis') if params['viz_type'] in TIMESERIES_TYPES else None
+    if x_axis:
+        df = df.sort_values(x_axis)
+    return df.reset_index(drop=True)
+
+
+# ---------- Отрисовка ----------
+
+def _top_series(wide):
+    if wide.shape[1] <= MAX_SERIES:
+        return wide
+    order = wide.sum().sort_values(ascending=False).index
+    top = wide[order[:MAX_SERIES]].copy()
+    top['Другие'] = wide[order[MAX_SERIES:]].sum(axis=1)
+    return top
+
+
+def _render_timeseries(df, spec, ax):
+    x, series, metric = spec['x'], spec['series'], spec['metrics'][0]
+    if spec['kind'] == 'scatter':
+        colors = pd.to_numeric(df[series[0]], errors='coerce') if series else None
+        points = ax.scatter(df[x], df[metric], c=colors, cmap='viridis', alpha=0.6)
+        if colors is not None and colors.notna().any():
+            plt.colorbar(points, ax=ax, label=series[0])
+        ax.set_xlabel(x)
+        ax.set_ylabel(metric)
+        return
+    if series:
+        wide = _top_series(df.pivot_table(index=x, columns=series, values=metric, aggfunc='sum', dropna=False))
+    else:
+        wide = df.set_index(x)[spec['metrics']]
+    if spec['kind'] == 'bar':
+        if isinstance(wide.index, pd.DatetimeIndex):
+            wide.index = wide.index.strftime('%Y-%m-%d')
+        wide.plot(kind='bar', stacked=True, ax=ax, legend=wide.shape[1] > 1, width=0.8)
+    else:
+        wide.plot(ax=ax, marker='o', linewidth=1.5, legend=wide.shape[1] > 1)
+    ax.set_ylabel(metric)
+    ax.grid(True, alpha=0.3)
+
+
+def _render_pie(df, spec, ax):
+    metric = spec['metrics'][0]
+    labels = df[spec['series']].astype(str).agg(', '.join, axis=1)
+    ax.pie(df[metric], labels=labels, autopct='%1.1f%%', startangle=90, colors=spec['colors'])
+
+
+def _render_treemap(df, spec, ax):
+    """Treemap методом slice-and-dice: полосы по убыванию метрики"""
+    metric = spec['metrics'][0]
+    values = df[metric].clip(lower=0)
+    labels = df[spec['series']].astype(str).agg(', '.join, axis=1)
+    total = values.sum() or 1
+    x = 0.0
+    for idx, (label, value) in enumerate(zip(labels, values)):
+        width = value / total
+        ax.add_patch(plt.Rectangle((x, 0), width, 1, facecolor=spec['colors'][idx % len(spec['colors'])],
+                                   edgecolor='white'))
+        if width > 0.03:
+            ax.text(x + width / 2, 0.5, f"{label}\n{value:,.0f}", ha='center', va='center',
+                    rotation=90 if width < 0.12 else 0, fontsize=8)
+        x += width
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    ax.axis('off')
+
+
+def _render_sunburst(df, spec, ax):
+    """Sunburst как вложенные кольца: внутреннее кольцо — первый уровень иерархии"""
+    metric, levels = spec['metrics'][0], spec['series']
+    df = df.sort_values(levels)
+    ring = 0.7 / len(levels)
+    for depth in range(len(levels)):
+        sums = df.groupby(levels[:depth + 1], sort=False)[metric].sum()
+        labels = [str(key[-1] if isinstance(key, tuple) else key) for key in sums.index] if depth == 0 else None
+        ax.pie(sums, radius=0.3 + ring * (depth + 1), labels=labels, labeldistance=0.3,
+               colors=spec['colors'], wedgeprops={'width': ring, 'edgecolor': 'white', 'linewidth': 0.3})
+    ax.set(aspect='equal')
+
+
+def _render_bars(df, spec, ax):
+    """Горизонтальные столбцы по первой метрике (вместо horizon-графика Superset)"""
+    metric = spec['metrics'][0]
+    labels = df[spec['series']].astype(str).agg(', '.join, axis=1) if spec['series'] else df.index.astype(str)
+    ax.barh(range(len(df)), df[metric], color=spec['colors'][1])
+    ax.set_yticks(range(len(df)), labels)
+    ax.invert_yaxis()
+    ax.set_xlabel(metric)
+    for idx, value in enumerate(df[metric]):
+        extra = ", ".join(f"{other}: {df[other].iloc[idx]:,.0f}" for other in spec['metrics'][1:])
+        ax.text(value, idx, f" {value:,.0f}" + (f" ({extra})" if extra else ""), va='center', fontsize=8)
+
+
+RENDERERS = {
+    'timeseries': (_render_timeseries, (14, 7)),
+    'pie': (_render_pie, (10, 8)),
+    'treemap_v2': (_render_treemap, (14, 7)),
+    'sunburst_v2': (_render_sunburst, (10, 10)),
+    'horizon': (_render_bars, (12, 7)),
+}
+
+
+def render_spec(chart, colors):
+    """Описание отрисовки графика (передаётся в процесс-воркер) или None"""
+    params = chart['params']
+    viz_type = params['viz_type']
+    kind = 'timeseries' if viz_type in TIMESERIES_TYPES else viz_type
+    if kind not in RENDERERS:
+        return None
+    dimensions = chart_dimensions(params)
+    if kind == 'timeseries' and params.get('x_axis'):
+        # Первое измерение временного ряда — ось X, остальные — серии
+        dimensions = dimensions[1:]
+    return {
+        'renderer': kind,
+        'kind': TIMESERIES_TYPES.get(viz_type),
+        'title': chart['title'],
+        'x': params.get('x_axis'),
+        'series': dimensions,
+        'metrics': [metric_label(metric) for metric in chart_metrics(params)],
+        'colors': colors,
+    }
+
+
+def render_chart(df, spec, path):
+    """Отрисовка графика Superset в PNG"""
+    render_fn, figsize = RENDERERS[spec['renderer']]
+    fig, ax = plt.subplots(figsize=figsize)
+    render_fn(df, spec, ax)
+    ax.set_title(spec['title'], fontsize=14, fontweight='bold')
+    fig.tight_layout()
+    fig.savefig(path, dpi=charts.DPI, bbox_inches='tight')
+    return fig
+
+
+def _render_job(df, spec, path):
+    started = time.perf_counter()
+    plt.close(render_chart(df, spec, path))
+    return path, time.perf_counter() - started
+
+
+def render_all(jobs, max_workers=None):
+    """Пакетная отрисовка (DataFrame, описание, путь) в пуле процессов; возвращает готовые пути"""
+    done = []
+    if not jobs:
+        return done
+    pool = charts.worker_pool(min(max_workers or os.cpu_count() or 1, len(jobs)))
+    futures = {pool.submit(_render_job, df, spec, path): spec['title'] for df, spec, path in jobs}
+    for future in as_completed(futures):
+        try:
+            path, seconds = future.result()
+            done.append(path)
+            print(f"✅ {futures[future]}: {path} ({seconds:.2f} с)")
+        except BrokenProcessPool as e:
+            charts.discard_worker_pool(pool)
+            print(f"❌ Ошибка отрисовки графика {futures[future]}: воркер завершился аварийно ({e})")
+        except Exception as e:
+            print(f"❌ Ошибка отрисовки графика {futures[future]}: {e}")
+    return done
+
+
+# ---------- Пакетный запуск ----------
+
+def _sheet_name(title, used):
+    name = re.sub(r'[\[\]:*?/\\]', '', title)[:31] or 'Sheet'
+    base, idx = name, 2
+    while name in used:
+        suffix = f"_{idx}"
+        name = base[:31 - len(suffix)] + suffix
+        idx += 1
+    used.add(name)
+    return name
+
+
+def resolve_anchors(analyzer, dashboards, datasets, as_of=None, max_workers=None):
+    """(uuid набора данных, колонка) -> дата отсчёта относительных диапазонов
+
+    Явная дата as_of применяется ко всем колонкам, иначе берётся MAX колонки
+    в наборе данных.
+    """
+    queries = anchor_queries(dashboards, datasets)
+    if as_of is not None:
+        return {key: pd.Timestamp(as_of) for key in queries}
+    frames = analyzer.execute_queries(dict(queries.values()), "Последняя дата",
+                                      max_workers=max_workers or 4)
+    anchors = {}
+    for key, (name, _) in queries.items():
+        df = frames.get(name)
+        value = df['as_of'].iloc[0] if df is not None and len(df) else None
+        anchors[key] = pd.Timestamp(value) if pd.notna(value) else pd.Timestamp.now()
+    return anchors
+
+
+def run_bundles(analyzer, paths, as_of=None, max_workers=None):
+    """Перегенерация дашбордов из экспортов: графики в charts/, отчеты в exports/
+
+    Возвращает словарь название дашборда -> список созданных PNG.
+    """
+    dashboards, datasets = [], {}
+    for path in paths:
+        bundle_dashboards, bundle_datasets = load_bundle(path)
+        dashboards += bundle_dashboards
+        datasets.update(bundle_datasets)
+
+    anchors = resolve_anchors(analyzer, dashboards, datasets, as_of, max_workers)
+    queries, planned = plan_queries(dashboards, datasets, anchors)
+    n_charts = sum(len(dashboard['charts']) for dashboard in dashboards)
+    print(f"🧭 Дашбордов: {len(dashboards)}, графиков: {n_charts}, "
+          f"уникальных запросов: {len(queries)}")
+    frames = analyzer.execute_queries(queries, "Запрос Superset", max_workers=max_workers or 4)
+
+    jobs, outputs = [], {}
+    for dashboard in dashboards:
+        sheets, used = {}, set()
+        outputs[dashboard['title']] = []
+        for chart in dashboard['charts']:
+            query = planned.get(chart['uuid'])
+            if isinstance(query, ValueError):
+                print(f"❌ {chart['title']}: {query}")
+                continue
+            df = frames.get(query) if query else None
+            if df is None:
+                print(f"❌ {chart['title']}: набор данных недоступен")
+                continue
+            try:
+                data = chart_data(chart, df)
+                spec = render_spec(chart, analyzer.colors)
+            except (ValueError, KeyError) as e:
+                print(f"❌ {chart['title']}: {e}")
+                continue
+            sheets[_sheet_name(chart['title'], used)] = data
+            if spec is None:
+                print(f"⚠️ {chart['title']}: тип {chart['params']['viz_type']} только в Excel")
+            elif len(data) == 0:
+                print(f"⚠️ {chart['title']}: нет данных в выбранном диапазоне")
+            else:
+                path = f"charts/superset_{_slug(dashboard['title'])}_{_slug(chart['title'])}.png"
+                jobs.append((data, spec, path))
+                outputs[dashboard['title']].append(path)
+        if sheets:
+            analyzer.export_to_excel(sheets, f"superset_{_slug(dashboard['title'])}.xlsx")
+
+    os.makedirs('charts', exist_ok=True)
+    rendered = render_all(jobs, max_workers)
+    for path in rendered:
+        analyzer.artifacts.register('chart', path)
+    return {title: [path for path in paths if path in rendered] for title, paths in outputs.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перегенерация дашбордов Superset из экспортов")
+    parser.add_argument('bundles', nargs='*', help="zip-экспорты дашбордов (по умолчанию все из папки задания)")
+    parser.add_argument('--as-of', help="дата для относительных диапазонов (Current year и т.п.; по умолчанию — последняя дата в данных)")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    from main import AWSTickitAnalyzer
+    from db_pool import close_pool
+    paths = args.bundles or sorted(glob.glob(os.path.join(BUNDLE_DIR, '*.json')))
+    analyzer = AWSTickitAnalyzer(headless=True)
+    try:
+        run_bundles(analyzer, paths, as_of=args.as_of, max_workers=args.workers)
+    finally:
+        analyzer.close()
+        close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""Детерминированный генератор синтетических данных схемы Tickit.
+
+Размеры справочников соответствуют исходному датасету AWS Tickit, а число
+строк в listing и sales умножается на масштабный коэффициент (1x, 10x, 100x).
+Данные генерируются блоками фиксированного размера, поэтому при одинаковых
+seed и масштабе результат всегда один и тот же, а память не растёт с масштабом.
+Данные можно загрузить в локальный PostgreSQL или записать в формат снимка.
+"""
+import argparse
+import io
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from snapshot import write_part
+
+BLOCK_ROWS = 100000
+
+BASE_ROWS = {
+    'category': 11,
+    'venue': 202,
+    'users': 49990,
+    'events': 8798,
+    'listing': 192497,
+    'sales': 172456,
+}
+SCALED_TABLES = ('listing', 'sales')
+
+# Порядок загрузки и колонки: (имя, тип PostgreSQL); первая колонка — первичный ключ
+COLUMNS = {
+    'category': [('catid', 'smallint'), ('catgroup', 'varchar(10)'), ('catname', 'varchar(10)'),
+                 ('catdesc', 'varchar(50)')],
+    'venue': [('venueid', 'smallint'), ('venuename', 'varchar(100)'), ('venuecity', 'varchar(30)'),
+              ('venuestate', 'char(2)'), ('venueseats', 'integer')],
+    'users': [('userid', 'integer'), ('username', 'char(8)'), ('city', 'varchar(30)'), ('state', 'char(2)'),
+              ('likesports', 'boolean'), ('liketheatre', 'boolean'), ('likeconcerts', 'boolean'),
+              ('likejazz', 'boolean'), ('likeclassical', 'boolean'), ('likeopera', 'boolean'),
+              ('likerock', 'boolean'), ('likevegas', 'boolean'), ('likebroadway', 'boolean'),
+              ('likemusicals', 'boolean')],
+    'events': [('eventid', 'integer'), ('venueid', 'smallint'), ('catid', 'smallint'), ('dateid', 'smallint'),
+               ('eventname', 'varchar(200)'), ('starttime', 'timestamp')],
+    'listing': [('listid', 'integer'), ('sellerid', 'integer'), ('eventid', 'integer'), ('dateid', 'smallint'),
+                ('numtickets', 'smallint'), ('priceperticket', 'decimal(8,2)'), ('totalprice', 'decimal(8,2)'),
+                ('listtime', 'timestamp')],
+    'sales': [('saleid', 'integer'), ('listid', 'integer'), ('sellerid', 'integer'), ('buyerid', 'integer'),
+              ('eventid', 'integer'), ('dateid', 'smallint'), ('qtysold', 'smallint'),
+              ('pricepaid', 'decimal(8,2)'), ('commission', 'decimal(8,2)'), ('saletime', 'timestamp')],
+}
+
+CATEGORIES = [
+    (1, 'Sports', 'MLB', 'Major League Baseball'),
+    (2, 'Sports', 'NHL', 'National Hockey League'),
+    (3, 'Sports', 'NFL', 'National Football League'),
+    (4, 'Sports', 'NBA', 'National Basketball Association'),
+    (5, 'Sports', 'MLS', 'Major League Soccer'),
+    (6, 'Shows', 'Musicals', 'Musical theatre'),
+    (7, 'Shows', 'Plays', 'All non-musical theatre'),
+    (8, 'Shows', 'Opera', 'All opera and light opera'),
+    (9, 'Concerts', 'Pop', 'All rock and pop music concerts'),
+    (10, 'Concerts', 'Jazz', 'All jazz singers and bands'),
+    (11, 'Concerts', 'Classical', 'All symphony, concerto, and choir concerts'),
+]
+# Доля событий по категориям (как в Tickit: больше всего концертов и шоу)
+CATEGORY_WEIGHTS = np.array([1, 1, 1, 1, 1, 25, 25, 5, 30, 5, 5], dtype='float64')
+
+CITIES = [
+    ('New York City', 'NY'), ('Los Angeles', 'CA'), ('San Francisco', 'CA'), ('Chicago', 'IL'),
+    ('Houston', 'TX'), ('Austin', 'TX'), ('Dallas', 'TX'), ('Seattle', 'WA'), ('Boston', 'MA'),
+    ('Miami', 'FL'), ('Orlando', 'FL'), ('Denver', 'CO'), ('Phoenix', 'AZ'), ('Atlanta', 'GA'),
+    ('Portland', 'OR'), ('Las Vegas', 'NV'), ('Nashville', 'TN'), ('Philadelphia', 'PA'),
+    ('Washington', 'DC'), ('Minneapolis', 'MN'), ('Detroit', 'MI'), ('Cleveland', 'OH'),
+    ('San Diego', 'CA'), ('Salt Lake City', 'UT'), ('Kansas City', 'MO'),
+]
+CITY_WEIGHTS = 1.0 / np.arange(1, len(CITIES) + 1)
+
+YEAR_START = np.datetime64('2008-01-01T00:00:00')
+YEAR_SECONDS = 366 * 24 * 3600
+FIRST_DATEID = 1827
+
+PG_TO_ARROW = {'smallint': pa.int16(), 'integer': pa.int32(), 'boolean': pa.bool_(),
+               'decimal(8,2)': pa.float64(), 'timestamp': pa.timestamp('us')}
+
+
+def table_rows(name, scale=1):
+    """Число строк таблицы при заданном масштабе"""
+    return BASE_ROWS[name] * scale if name in SCALED_TABLES else BASE_ROWS[name]
+
+
+def arrow_schema(name):
+    return pa.schema([(column, PG_TO_ARROW.get(pg_type, pa.string())) for column, pg_type in COLUMNS[name]])
+
+
+def _mix(ids, salt):
+    """Детерминированный 64-битный хэш id (splitmix64) — без хранения таблиц в памяти"""
+    x = ids.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(salt)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def _unit(ids, salt):
+    """Псевдослучайное число в [0, 1) для каждого id"""
+    return (_mix(ids, salt) >> np.uint64(11)).astype('float64') / 2.0 ** 53
+
+
+def listing_eventid(listid, seed, n_events):
+    return (_mix(listid, seed * 1000 + 1) % np.uint64(n_events)).astype('int64') + 1
+
+
+def listing_price(listid, seed):
+    """Цена билета: от $5 до $2000 со смещением к дешёвым билетам"""
+    return np.round(5 + 1995 * _unit(listid, seed * 1000 + 2) ** 3, 2)
+
+
+def _times(rng, n):
+    return YEAR_START + rng.integers(0, YEAR_SECONDS, n).astype('timedelta64[s]')
+
+
+def _dateids(times):
+    return (FIRST_DATEID + (times - YEAR_START).astype('timedelta64[D]').astype('int64')).astype('int16')
+
+
+def _block(name, seed, scale, start, stop, rng):
+    ids = np.arange(start + 1, stop + 1, dtype='int64')
+    n = len(ids)
+    n_users = table_rows('users', scale)
+    if name == 'category':
+        return pd.DataFrame(CATEGORIES, columns=[column for column, _ in COLUMNS['category']])
+    if name == 'venue':
+        cities = rng.choice(len(CITIES), n, p=CITY_WEIGHTS / CITY_WEIGHTS.sum())
+        seats = np.where(rng.random(n) < 0.3, 0, rng.integers(10000, 75000, n))
+        return pd.DataFrame({
+            'venueid': ids, 'venuename': [f"Venue {i}" for i in ids],
+            'venuecity': [CITIES[c][0] for c in cities], 'venuestate': [CITIES[c][1] for c in cities],
+            'venueseats': seats,
+        })
+    if name == 'users':
+        cities = rng.choice(len(CITIES), n, p=CITY_WEIGHTS / CITY_WEIGHTS.sum())
+        df = pd.DataFrame({
+            'userid': ids, 'username': [f"U{i:07d}" for i in ids],
+            'city': [CITIES[c][0] for c in cities], 'state': [CITIES[c][1] for c in cities],
+        })
+        for column, pg_type in COLUMNS['users']:
+            if pg_type == 'boolean':
+                values = pd.array(rng.random(n) < 0.4, dtype='boolean')
+                values[rng.random(n) < 0.1] = pd.NA
+                df[column] = values
+        return df
+    if name == 'events':
+        starts = _times(rng, n)
+        return pd.DataFrame({
+            'eventid': ids, 'venueid': rng.integers(1, BASE_ROWS['venue'] + 1, n),
+            'catid': rng.choice(np.arange(1, 12), n, p=CATEGORY_WEIGHTS / CATEGORY_WEIGHTS.sum()),
+            'dateid': _dateids(starts), 'eventname': [f"Event {i}" for i in ids], 'starttime': starts,
+        })
+    if name == 'listing':
+        price = listing_price(ids, seed)
+        numtickets = rng.integers(1, 31, n)
+        listtimes = _times(rng, n)
+        return pd.DataFrame({
+            'listid': ids, 'sellerid': rng.integers(1, n_users + 1, n),
+            'eventid': listing_eventid(ids, seed, BASE_ROWS['events']), 'dateid': _dateids(listtimes),
+            'numtickets': numtickets, 'priceperticket': price,
+            'totalprice': np.minimum(np.round(price * numtickets, 2), 999999.99), 'listtime': listtimes,
+        })
+    if name == 'sales':
+        n_listing = table_rows('listing', scale)
+        listids = rng.integers(1, n_listing + 1, n)
+        qtysold = rng.choice([1, 2, 3, 4], n, p=[0.5, 0.3, 0.15, 0.05])
+        pricepaid = np.minimum(np.round(qtysold * listing_price(listids, seed), 2), 999999.99)
+        # Время продажи растёт вместе с saleid (как при реальной вставке), с небольшим разбросом
+        offsets = (ids - 1) * YEAR_SECONDS // table_rows('sales', scale) + rng.integers(0, 3600, n)
+        saletimes = YEAR_START + np.minimum(offsets, YEAR_SECONDS - 1).astype('timedelta64[s]')
+        return pd.DataFrame({
+            'saleid': ids, 'listid': listids, 'sellerid': rng.integers(1, n_users + 1, n),
+            'buyerid': rng.integers(1, n_users + 1, n),
+            'eventid': listing_eventid(listids, seed, BASE_ROWS['events']), 'dateid': _dateids(saletimes),
+            'qtysold': qtysold, 'pricepaid': pricepaid, 'commission': np.round(pricepaid * 0.15, 2),
+            'saletime': saletimes,
+        })
+    raise ValueError(f"Неизвестная таблица: {name}")
+
+
+def generate_table(name, scale=1, seed=42):
+    """Блоки DataFrame таблицы name (по BLOCK_ROWS строк)"""
+    total = table_rows(name, scale)
+    for block_idx, start in enumerate(range(0, total, BLOCK_ROWS)):
+        rng = np.random.default_rng([seed, list(COLUMNS).index(name), block_idx])
+        yield _block(name, seed, scale, start, min(start + BLOCK_ROWS, total), rng)
+
+
+def write_snapshot(snapshot_dir, scale=1, seed=42, file_format='arrow'):
+    """Запись синтетических таблиц в формате снимка (см. snapshot.Snapshot)"""
+    extension = 'parquet' if file_format == 'parquet' else 'arrow'
+    manifest = {'created': datetime.now().isoformat(timespec='seconds'), 'format': extension,
+                'synthetic': {'scale': scale, 'seed': seed}, 'tables': {}}
+    for name in COLUMNS:
+        table_dir = os.path.join(snapshot_dir, name)
+        os.makedirs(table_dir, exist_ok=True)
+        schema = arrow_schema(name)
+        parts = []
+        for block in generate_table(name, scale, seed):
+            part_name = f"part-{len(parts):05d}.{extension}"
+            table = pa.Table.from_pandas(block, schema=schema, preserve_index=False)
+            write_part(table, os.path.join(table_dir, part_name), file_format)
+            parts.append(part_name)
+        manifest['tables'][name] = {'rows': table_rows(name, scale), 'parts': parts}
+        print(f"📦 {name}: {table_rows(name, scale)} строк")
+    with open(os.path.join(snapshot_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(f"✅ Синтетический снимок x{scale} сохранен: {snapshot_dir}")
+    return manifest
+
+
+def ensure_database(database):
+    """Создание базы database, если её ещё нет"""
+    import psycopg2
+    from db_pool import DB_CONFIG
+    connection = psycopg2.connect(**{**DB_CONFIG, 'database': 'postgres'})
+    try:
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (database,))
+            if cursor.fetchone() is None:
+                cursor.execute(f'CREATE DATABASE "{database}"')
+                print(f"✅ Создана база данных {database}")
+    finally:
+        connection.close()
+
+
+def load_postgres(connection, scale=1, seed=42, replace=False):
+    """Загрузка синтетических таблиц в PostgreSQL через COPY
+
+    Существующие таблицы пересоздаются только при replace=True.
+    """
+    with connection.cursor() as cursor:
+        for name, columns in COLUMNS.items():
+            if replace:
+                cursor.execute(f"DROP TABLE IF EXISTS {name}")
+            ddl = ", ".join(f"{column} {pg_type}" + (" PRIMARY KEY" if idx == 0 else "")
+                            for idx, (column, pg_type) in enumerate(columns))
+            cursor.execute(f"CREATE TABLE {name} ({ddl})")
+            for block in generate_table(name, scale, seed):
+                buffer = io.StringIO()
+                block.to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY {name} FROM STDIN WITH (FORMAT csv)", buffer)
+            connection.commit()
+            print(f"📦 {name}: {table_rows(name, scale)} строк загружено")
+        cursor.execute("CREATE INDEX IF NOT EXISTS sales_eventid_idx ON sales (eventid)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS sales_buyerid_idx ON sales (buyerid)")
+        connection.commit()
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    finally:
+        connection.autocommit = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные Tickit")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    snap = subparsers.add_parser('snapshot', help="записать синтетический снимок")
+    snap.add_argument('--scale', type=int, default=1)
+    snap.add_argument('--seed', type=int, default=42)
+    snap.add_argument('--dir', default=None)
+    snap.add_argument('--format', choices=['arrow', 'parquet'], default='arrow')
+
+    pg = subparsers.add_parser('postgres', help="загрузить синтетические данные в PostgreSQL")
+    pg.add_argument('--scale', type=int, default=1)
+    pg.add_argument('--seed', type=int, default=42)
+    pg.add_argument('--database', required=True, help="отдельная база, например tickit_sf10")
+    pg.add_argument('--replace', action='store_true', help="пересоздать существующие таблицы")
+
+    args = parser.parse_args()
+    if args.command == 'snapshot':
+        write_snapshot(args.dir or f"snapshots/synthetic_sf{args.scale}", args.scale, args.seed, args.format)
+    else:
+        import psycopg2
+        from db_pool import DB_CONFIG
+        ensure_database(args.database)
+        connection = psycopg2.connect(**{**DB_CONFIG, 'database': args.database})
+        try:
+            load_postgres(connection, args.scale, args.seed, args.replace)
+        finally:
+            connection.close()
+
+
+if __name__ == "__main__":
+    main()